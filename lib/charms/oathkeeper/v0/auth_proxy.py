@@ -48,7 +48,13 @@ class SomeCharm(CharmBase):
             return AuthProxyConfig(
                 protected_urls=self.external_urls,
                 allowed_endpoints=AUTH_PROXY_ALLOWED_ENDPOINTS,
-                headers=AUTH_PROXY_HEADERS
+                headers=AUTH_PROXY_HEADERS,
+                # Optional, API clients sending tokens can skip the Kratos session check
+                authenticator="jwt",
+                # Optional, receive a signed id token rather than plain headers
+                mutator="id_token",
+                # Optional, serve the files with these extensions without authentication
+                static_asset_suffixes=["js", "css", "png"],
             )
 
         def _on_ingress_ready(self, event):
@@ -78,7 +84,7 @@ LIBAPI = 0
 
 # Increment this PATCH version before using `charmcraft publish-lib` or reset
 # to 0 if you are raising the major API version
-LIBPATCH = 6
+LIBPATCH = 10
 
 RELATION_NAME = "auth-proxy"
 INTERFACE_NAME = "auth_proxy"
@@ -86,6 +92,14 @@ INTERFACE_NAME = "auth_proxy"
 logger = logging.getLogger(__name__)
 
 ALLOWED_HEADERS = ["X-User", "X-Email", "X-Name"]
+# The Oathkeeper authenticators a requirer can protect its urls with
+ALLOWED_AUTHENTICATORS = ["cookie_session", "jwt", "oauth2_introspection"]
+DEFAULT_AUTHENTICATOR = "cookie_session"
+# The Oathkeeper mutators a requirer can receive the identity with
+ALLOWED_MUTATORS = ["header", "id_token"]
+DEFAULT_MUTATOR = "header"
+# A static asset suffix is a file extension, without the leading dot
+STATIC_ASSET_SUFFIX_REGEX = "^[A-Za-z0-9]+$"
 
 url_regex = re.compile(
     r"(^http://)|(^https://)"  # http:// or https://
@@ -112,6 +126,21 @@ AUTH_PROXY_REQUIRER_JSON_SCHEMA = {
                 "type": "string",
             },
         },
+        "authenticator": {
+            "type": "string",
+            "default": DEFAULT_AUTHENTICATOR,
+            "enum": ALLOWED_AUTHENTICATORS,
+        },
+        "mutator": {
+            "type": "string",
+            "default": DEFAULT_MUTATOR,
+            "enum": ALLOWED_MUTATORS,
+        },
+        "static_asset_suffixes": {
+            "type": "array",
+            "default": [],
+            "items": {"type": "string", "pattern": STATIC_ASSET_SUFFIX_REGEX},
+        },
     },
     "required": ["protected_urls", "allowed_endpoints", "headers"],
 }
@@ -194,6 +223,9 @@ class AuthProxyConfig:
     protected_urls: List[str]
     headers: List[str]
     allowed_endpoints: List[str] = field(default_factory=lambda: [])
+    authenticator: Optional[str] = None
+    mutator: Optional[str] = None
+    static_asset_suffixes: Optional[List[str]] = None
 
     def validate(self) -> None:
         """Validate the auth proxy configuration."""
@@ -215,6 +247,29 @@ class AuthProxyConfig:
                     f"Unsupported header {header}, it must be one of {ALLOWED_HEADERS}"
                 )
 
+        # Validate authenticator
+        if self.authenticator and self.authenticator not in ALLOWED_AUTHENTICATORS:
+            raise AuthProxyConfigError(
+                f"Unsupported authenticator {self.authenticator}, "
+                f"it must be one of {ALLOWED_AUTHENTICATORS}"
+            )
+
+        # Validate mutator
+        if self.mutator and self.mutator not in ALLOWED_MUTATORS:
+            raise AuthProxyConfigError(
+                f"Unsupported mutator {self.mutator}, it must be one of {ALLOWED_MUTATORS}"
+            )
+
+        self._validate_static_asset_suffixes()
+
+    def _validate_static_asset_suffixes(self) -> None:
+        for suffix in self.static_asset_suffixes or []:
+            if not re.match(STATIC_ASSET_SUFFIX_REGEX, suffix):
+                raise AuthProxyConfigError(
+                    f"Invalid static asset suffix {suffix}, it must be a file extension "
+                    "without the leading dot"
+                )
+
     def to_dict(self) -> Dict:
         """Convert object to dict."""
         return {k: v for k, v in asdict(self).items() if v is not None}
@@ -231,6 +286,9 @@ class AuthProxyConfigChangedEvent(EventBase):
         allowed_endpoints: List[str],
         relation_id: int,
         relation_app_name: str,
+        authenticator: str = DEFAULT_AUTHENTICATOR,
+        mutator: str = DEFAULT_MUTATOR,
+        static_asset_suffixes: Optional[List[str]] = None,
     ) -> None:
         super().__init__(handle)
         self.protected_urls = protected_urls
@@ -238,6 +296,9 @@ class AuthProxyConfigChangedEvent(EventBase):
         self.headers = headers
         self.relation_id = relation_id
         self.relation_app_name = relation_app_name
+        self.authenticator = authenticator
+        self.mutator = mutator
+        self.static_asset_suffixes = static_asset_suffixes or []
 
     def snapshot(self) -> Dict:
         """Save event."""
@@ -247,6 +308,9 @@ class AuthProxyConfigChangedEvent(EventBase):
             "allowed_endpoints": self.allowed_endpoints,
             "relation_id": self.relation_id,
             "relation_app_name": self.relation_app_name,
+            "authenticator": self.authenticator,
+            "mutator": self.mutator,
+            "static_asset_suffixes": self.static_asset_suffixes,
         }
 
     def restore(self, snapshot: Dict) -> None:
@@ -256,13 +320,19 @@ class AuthProxyConfigChangedEvent(EventBase):
         self.allowed_endpoints = snapshot["allowed_endpoints"]
         self.relation_id = snapshot["relation_id"]
         self.relation_app_name = snapshot["relation_app_name"]
+        self.authenticator = snapshot.get("authenticator", DEFAULT_AUTHENTICATOR)
+        self.mutator = snapshot.get("mutator", DEFAULT_MUTATOR)
+        self.static_asset_suffixes = snapshot.get("static_asset_suffixes", [])
 
     def to_auth_proxy_config(self) -> AuthProxyConfig:
         """Convert the event information to an AuthProxyConfig object."""
         return AuthProxyConfig(
-            self.protected_urls,
-            self.allowed_endpoints,
-            self.headers,
+            protected_urls=self.protected_urls,
+            headers=self.headers,
+            allowed_endpoints=self.allowed_endpoints,
+            authenticator=self.authenticator,
+            mutator=self.mutator,
+            static_asset_suffixes=self.static_asset_suffixes,
         )
 
 
@@ -329,13 +399,23 @@ class AuthProxyProvider(AuthProxyRelation):
         protected_urls = auth_proxy_data.get("protected_urls")
         allowed_endpoints = auth_proxy_data.get("allowed_endpoints")
         headers = auth_proxy_data.get("headers")
+        authenticator = auth_proxy_data.get("authenticator", DEFAULT_AUTHENTICATOR)
+        mutator = auth_proxy_data.get("mutator", DEFAULT_MUTATOR)
+        static_asset_suffixes = auth_proxy_data.get("static_asset_suffixes", [])
 
         relation_id = event.relation.id
         relation_app_name = event.relation.app.name
 
         # Notify Oathkeeper to create access rules
         self.on.proxy_config_changed.emit(
-            protected_urls, headers, allowed_endpoints, relation_id, relation_app_name
+            protected_urls,
+            headers,
+            allowed_endpoints,
+            relation_id,
+            relation_app_name,
+            authenticator,
+            mutator,
+            static_asset_suffixes,
         )
 
     def _on_relation_broken_event(self, event: RelationBrokenEvent) -> None:
@@ -358,6 +438,30 @@ class AuthProxyProvider(AuthProxyRelation):
 
         return list(headers)
 
+    def get_auth_proxy_configs(self) -> Dict[int, AuthProxyConfig]:
+        """Returns the valid auth-proxy configs of all relations, keyed by relation id."""
+        configs = {}
+        for relation in self._charm.model.relations[self._relation_name]:
+            if not relation.app or not relation.data[relation.app]:
+                continue
+
+            try:
+                data = _load_data(relation.data[relation.app], AUTH_PROXY_REQUIRER_JSON_SCHEMA)
+            except DataValidationError as e:
+                logger.error(f"Invalid config in relation {relation.id}: {e}")
+                continue
+
+            configs[relation.id] = AuthProxyConfig(
+                protected_urls=data["protected_urls"],
+                headers=data["headers"],
+                allowed_endpoints=data["allowed_endpoints"],
+                authenticator=data.get("authenticator", DEFAULT_AUTHENTICATOR),
+                mutator=data.get("mutator", DEFAULT_MUTATOR),
+                static_asset_suffixes=data.get("static_asset_suffixes", []),
+            )
+
+        return configs
+
     def get_app_names(self) -> List[str]:
         """Returns the list of all related app names."""
         if not self._charm.model.relations[self._relation_name]:
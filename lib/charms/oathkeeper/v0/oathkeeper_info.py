@@ -48,7 +48,7 @@ LIBAPI = 0
 
 # Increment this PATCH version before using `charmcraft publish-lib` or reset
 # to 0 if you are raising the major API version
-LIBPATCH = 2
+LIBPATCH = 4
 
 RELATION_NAME = "oathkeeper-info"
 INTERFACE_NAME = "oathkeeper_info"
@@ -75,6 +75,8 @@ class OathkeeperInfoProvider(Object):
 
         self._charm = charm
         self._relation_name = relation_name
+        # The number of databags written by this instance
+        self.writes = 0
 
         events = self._charm.on[relation_name]
         self.framework.observe(events.relation_created, self._on_info_provider_relation_created)
@@ -87,10 +89,18 @@ class OathkeeperInfoProvider(Object):
         public_endpoint: str,
         rules_configmap_name: str,
         configmaps_namespace: str,
-    ) -> None:
-        """Updates relation with endpoints and configmaps info."""
+        jwks_endpoint: Optional[str] = None,
+    ) -> int:
+        """Updates relation with endpoints and configmaps info.
+
+        `jwks_endpoint` serves the keys verifying the id tokens issued by Oathkeeper, it is
+        only shared when the id_token mutator is enabled.
+
+        Only the databags whose content differs are written, as every write fires a
+        relation-changed event on the requirer. Returns the number of databags written.
+        """
         if not self._charm.unit.is_leader():
-            return
+            return 0
 
         relations = self.model.relations[self._relation_name]
         info_databag = {
@@ -98,9 +108,28 @@ class OathkeeperInfoProvider(Object):
             "rules_configmap_name": rules_configmap_name,
             "configmaps_namespace": configmaps_namespace,
         }
+        if jwks_endpoint:
+            info_databag["jwks_endpoint"] = jwks_endpoint
 
+        written = 0
         for relation in relations:
-            relation.data[self._charm.app].update(info_databag)
+            databag = relation.data[self._charm.app]
+            stale_jwks_endpoint = not jwks_endpoint and "jwks_endpoint" in databag
+            if not stale_jwks_endpoint and all(
+                databag.get(key) == value for key, value in info_databag.items()
+            ):
+                continue
+            databag.update(info_databag)
+            if stale_jwks_endpoint:
+                del databag["jwks_endpoint"]
+            written += 1
+
+        self.writes += written
+        logger.debug(
+            f"Oathkeeper info written to {written} of {len(relations)} relations, "
+            f"{self.writes} writes in total"
+        )
+        return written
 
 
 class OathkeeperInfoRelationError(Exception):
@@ -6,18 +6,25 @@
 
 """A Juju charm for Ory Oathkeeper."""
 
+import hashlib
 import json
 import logging
 import os
 import subprocess
+import time
 from base64 import b64encode
-from typing import Dict, List, Optional
+from collections import defaultdict
+from functools import cached_property
+from typing import Any, Dict, List, Optional, Set
 from urllib.parse import urlparse
 
 from charms.grafana_k8s.v0.grafana_dashboard import GrafanaDashboardProvider
 from charms.kratos.v0.kratos_info import KratosInfoRelationDataMissingError, KratosInfoRequirer
 from charms.loki_k8s.v1.loki_push_api import LogForwarder
 from charms.oathkeeper.v0.auth_proxy import (
+    DEFAULT_AUTHENTICATOR,
+    DEFAULT_MUTATOR,
+    AuthProxyConfig,
     AuthProxyConfigChangedEvent,
     AuthProxyConfigRemovedEvent,
     AuthProxyProvider,
@@ -42,9 +49,9 @@ from charms.traefik_k8s.v2.ingress import (
     IngressPerAppRequirer,
     IngressPerAppRevokedEvent,
 )
-from jinja2 import Template
+from httpx import HTTPError
 from lightkube import Client
-from lightkube.resources.apps_v1 import StatefulSet
+from lightkube.core.exceptions import ApiError
 from ops.charm import (
     ActionEvent,
     CharmBase,
@@ -56,6 +63,7 @@ from ops.charm import (
     RemoveEvent,
     UpdateStatusEvent,
 )
+from ops.framework import PreCommitEvent, StoredState
 from ops.main import main
 from ops.model import (
     ActiveStatus,
@@ -63,37 +71,98 @@ from ops.model import (
     MaintenanceStatus,
     ModelError,
     Relation,
+    SecretNotFoundError,
     WaitingStatus,
 )
-from ops.pebble import ChangeError, Error, ExecError, Layer
-from tenacity import before_log, retry, stop_after_attempt, wait_exponential
+from ops.pebble import ChangeError, CheckLevel, CheckStatus, Error, ExecError, Layer
 
 import config_map
-from config_map import AccessRulesConfigMap, OathkeeperConfigMap
+from config_map import AccessRulesConfigMap, AccessRulesShards, OathkeeperConfigMap
 from constants import (
+    ACCESS_RULE_METHODS,
+    ACCESS_RULES_PEER_KEY,
+    CONFIGMAP_CONFIG_DELIVERY,
+    FLUSH_FAILURE_BUDGET,
     GRAFANA_DASHBOARD_RELATION_NAME,
+    ID_TOKEN_JWKS_PATH,
+    ID_TOKEN_JWKS_SECRET_LABEL,
     LOKI_PUSH_API_RELATION_NAME,
     OATHKEEPER_API_PORT,
+    OATHKEEPER_CONFIG_PEER_KEY,
+    OATHKEEPER_INFO_RELATION_NAME,
     OATHKEEPER_METRICS_PORT,
+    PEBBLE_CONFIG_DELIVERY,
     PEER,
+    PREFLIGHT_METHODS,
     PROMETHEUS_METRICS_PATH,
     PROMETHEUS_SCRAPE_RELATION_NAME,
     SERVER_CA_CERT_PATH,
     SERVER_CERT_PATH,
     SERVER_KEY_PATH,
+    SESSION_TRAIT_HEADERS,
+    SESSION_TRAIT_TEMPLATE,
     SSL_PATH,
+    STATIC_ASSET_METHODS,
     TRACING_RELATION_NAME,
 )
+from hook_profiler import HookProfiler
+from jwks import generate_jwks
 from oathkeeper_cli import OathkeeperCLI
+from resource_limits import (
+    go_runtime_env,
+    parse_cpu,
+    parse_memory,
+    read_cgroup_cpu_limit,
+    read_cgroup_memory_limit,
+)
+from restart_lock import RestartLock, RestartLockAcquiredEvent
+from rule_compiler import (
+    GLOB_MATCHING_STRATEGY,
+    REGEXP_MATCHING_STRATEGY,
+    allow_pattern,
+    deny_pattern,
+    is_glob_compatible,
+    preflight_pattern,
+    protected_url_pattern,
+    static_asset_pattern,
+)
 
 logger = logging.getLogger(__name__)
 
+NOT_READY_STATUS = WaitingStatus("Waiting for Oathkeeper to be ready")
+FLUSH_FAILED_STATUS = BlockedStatus("Failed to write the configMaps, see the logs")
+
+
+def _normalize_layer_value(value: Any) -> Any:
+    """Normalize a layer value the way Pebble reports it back, with the scalars as strings."""
+    if isinstance(value, dict):
+        return {key: _normalize_layer_value(v) for key, v in value.items()}
+    if isinstance(value, bool):
+        return str(value).lower()
+    if value is None or isinstance(value, list):
+        return value
+    return str(value)
+
 
 class OathkeeperCharm(CharmBase):
     """Charmed Ory Oathkeeper."""
 
+    _stored = StoredState()
+
     def __init__(self, *args) -> None:
         super().__init__(*args)
+        self._stored.set_default(
+            needs_reconcile=False,
+            pending_reconcile=False,
+            failed_flushes=0,
+            resources="{}",
+            pushed_files="{}",
+            restart_ready_since="",
+            ready_since="",
+        )
+        # The peer data values overwritten during the hook, restored if the configMaps
+        # cannot be written
+        self._peer_data_undo: Dict[str, Optional[str]] = {}
 
         self._container_name = "oathkeeper"
         self._service_name = "oathkeeper"
@@ -101,9 +170,10 @@ class OathkeeperCharm(CharmBase):
         self._oathkeeper_config_dir_path = "/etc/config/oathkeeper"
         self._oathkeeper_config_file_path = "/etc/config/oathkeeper/oathkeeper.yaml"
         self._access_rules_dir_path = "/etc/config/access-rules"
+        self._pushed_config_file_path = "/etc/oathkeeper/oathkeeper.yaml"
+        self._pushed_access_rules_dir_path = "/etc/oathkeeper/access-rules"
         self._name = self.model.app.name
         self._oathkeeper_config_map_name = "oathkeeper-config"
-        self._access_rules_config_map_name = "access-rules"
         self._sans_dns = f"{self.app.name}.{self.model.name}.svc.cluster.local"
 
         self._kratos_relation_name = "kratos-info"
@@ -159,13 +229,8 @@ class OathkeeperCharm(CharmBase):
 
         self._kratos_info = KratosInfoRequirer(self, relation_name=self._kratos_relation_name)
 
-        self.client = Client(field_manager=self.app.name, namespace=self.model.name)
-        self.oathkeeper_configmap = OathkeeperConfigMap(self.client, self)
-        self.access_rules_configmap = AccessRulesConfigMap(self.client, self)
-
-        self._oathkeeper_cli = OathkeeperCLI(
-            f"http://localhost:{OATHKEEPER_API_PORT}",
-            self._container,
+        self._restart_lock = RestartLock(
+            self, relation_name=PEER, batch_size=self.config["restart-batch-size"]
         )
 
         self._ingress = IngressPerAppRequirer(
@@ -181,6 +246,9 @@ class OathkeeperCharm(CharmBase):
         self.framework.observe(self.on.config_changed, self._on_config_changed)
         self.framework.observe(self.on.update_status, self._on_update_status)
         self.framework.observe(self.on.remove, self._on_remove)
+        self.framework.observe(self.framework.on.pre_commit, self._on_pre_commit)
+        self.framework.observe(self.on[PEER].relation_changed, self._on_peer_relation_changed)
+        self.framework.observe(self._restart_lock.on.acquired, self._on_restart_lock_acquired)
 
         self.framework.observe(
             self.auth_proxy.on.proxy_config_changed, self._on_auth_proxy_config_changed
@@ -208,6 +276,7 @@ class OathkeeperCharm(CharmBase):
 
         self.framework.observe(self.on.list_rules_action, self._on_list_rules_action)
         self.framework.observe(self.on.get_rule_action, self._on_get_rule_action)
+        self.framework.observe(self.on.hook_stats_action, self._on_hook_stats_action)
 
         self.framework.observe(
             self.on[self._kratos_relation_name].relation_changed, self._on_kratos_relation_changed
@@ -218,10 +287,67 @@ class OathkeeperCharm(CharmBase):
         self.framework.observe(self.tracing.on.endpoint_changed, self._on_config_changed)
         self.framework.observe(self.tracing.on.endpoint_removed, self._on_config_changed)
 
+        # Set up last, to wrap all the handlers observed above
+        self._profiler = HookProfiler(self, enabled=self.config["profile-hooks"])
+
+    # The Kubernetes client, the configMaps and the CLI are only needed by some of the hooks,
+    # they are built on first use to keep the charm startup cheap
+    @cached_property
+    def client(self) -> Client:
+        """The lightkube client."""
+        client = Client(field_manager=self.app.name, namespace=self.model.name)
+        return self._profiler.track_kubernetes_client(client)
+
+    @cached_property
+    def oathkeeper_configmap(self) -> OathkeeperConfigMap:
+        """The configMap holding the Oathkeeper config file."""
+        return OathkeeperConfigMap(self.client, self)
+
+    @cached_property
+    def access_rules_shards(self) -> AccessRulesShards:
+        """The configMaps holding the access rules."""
+        return AccessRulesShards(self.client, self, shards=self._access_rules_shards)
+
+    @property
+    def access_rules_configmap(self) -> AccessRulesConfigMap:
+        """The first access rules configMap, shared with the oathkeeper-info requirers."""
+        return self.access_rules_shards.configmaps[0]
+
+    @cached_property
+    def _oathkeeper_cli(self) -> OathkeeperCLI:
+        return OathkeeperCLI(f"http://localhost:{OATHKEEPER_API_PORT}", self._container)
+
+    @property
+    def _resource_limits(self) -> Dict[str, str]:
+        """The CPU and memory limits of the Oathkeeper container set in the charm config."""
+        limits = {}
+        for resource, parse in (("cpu", parse_cpu), ("memory", parse_memory)):
+            if not (quantity := self.config.get(resource)):
+                continue
+            try:
+                parse(quantity)
+            except ValueError as e:
+                logger.error(f"Ignoring the {resource} config: {e}")
+                continue
+            limits[resource] = quantity
+        return limits
+
+    @cached_property
+    def _go_runtime_env(self) -> Dict[str, str]:
+        """The Go runtime tuning matching the limits of the container."""
+        limits = self._resource_limits
+        cpu = parse_cpu(limits["cpu"]) if "cpu" in limits else None
+        memory = parse_memory(limits["memory"]) if "memory" in limits else None
+        # The limits may also be set outside of the charm, e.g. by a LimitRange
+        if self._container.can_connect():
+            cpu = cpu or read_cgroup_cpu_limit(self._container)
+            memory = memory or read_cgroup_memory_limit(self._container)
+        return go_runtime_env(cpu, memory)
+
     @property
     def _oathkeeper_layer(self) -> Layer:
         """Returns a pre-configured Pebble layer."""
-        extra_env = {}
+        extra_env = dict(self._go_runtime_env)
         domain = "http://localhost"
         # We need to push the tls config as env vars due to k8s configmap latency.
         # Oathkeeper may restart before the config.yaml file is reloaded,
@@ -233,8 +359,12 @@ class OathkeeperCharm(CharmBase):
             self.cert_handler.ca,
         ]):
             extra_env.update({
-                "SERVE_API_TLS_CERT_BASE64": b64encode(bytes(self.cert_handler.cert, "utf-8")),
-                "SERVE_API_TLS_KEY_BASE64": b64encode(bytes(self.cert_handler.key, "utf-8")),
+                "SERVE_API_TLS_CERT_BASE64": b64encode(
+                    bytes(self.cert_handler.cert, "utf-8")
+                ).decode(),
+                "SERVE_API_TLS_KEY_BASE64": b64encode(
+                    bytes(self.cert_handler.key, "utf-8")
+                ).decode(),
             })
 
             domain = f"https://{self._sans_dns}"
@@ -245,7 +375,7 @@ class OathkeeperCharm(CharmBase):
                 "TRACING_PROVIDER": "otel",
                 "TRACING_PROVIDERS_OTLP_SERVER_URL": self._get_tracing_endpoint_info(),
                 "TRACING_PROVIDERS_OTLP_INSECURE": True,
-                "TRACING_PROVIDERS_OTLP_SAMPLING_SAMPLING_RATIO": 1,
+                "TRACING_PROVIDERS_OTLP_SAMPLING_SAMPLING_RATIO": self._tracing_sampling_ratio,
             })
 
         layer_config = {
@@ -255,7 +385,7 @@ class OathkeeperCharm(CharmBase):
                 self._service_name: {
                     "override": "replace",
                     "summary": "Oathkeeper Operator layer",
-                    "command": f"oathkeeper serve -c {self._oathkeeper_config_file_path}",
+                    "command": f"oathkeeper serve -c {self._config_file_path}",
                     "startup": "enabled",
                     "environment": extra_env,
                 }
@@ -263,12 +393,89 @@ class OathkeeperCharm(CharmBase):
             "checks": {
                 "alive": {
                     "override": "replace",
+                    "level": "alive",
                     "http": {"url": f"{domain}:{OATHKEEPER_API_PORT}/health/alive"},
                 },
+                # Juju wires the ready checks to the Kubernetes readiness probe, so the pod
+                # only gets traffic once Oathkeeper has loaded the access rules
+                "ready": {
+                    "override": "replace",
+                    "level": "ready",
+                    "http": {"url": f"{domain}:{OATHKEEPER_API_PORT}/health/ready"},
+                },
             },
         }
         return Layer(layer_config)
 
+    @property
+    def _config_delivery(self) -> str:
+        delivery = self.config["config-delivery"]
+        if delivery not in (CONFIGMAP_CONFIG_DELIVERY, PEBBLE_CONFIG_DELIVERY):
+            logger.warning(
+                f"Unknown config delivery {delivery}, using {CONFIGMAP_CONFIG_DELIVERY}"
+            )
+            return CONFIGMAP_CONFIG_DELIVERY
+        return delivery
+
+    @property
+    def _tracing_sampling_ratio(self) -> float:
+        ratio = float(self.config["tracing-sampling-ratio"])
+        if not 0 <= ratio <= 1:
+            clamped = min(max(ratio, 0.0), 1.0)
+            logger.warning(f"Tracing sampling ratio {ratio} is out of [0, 1], using {clamped}")
+            return clamped
+        return ratio
+
+    @property
+    def _config_file_path(self) -> str:
+        """The path of the config file that Oathkeeper is started with."""
+        if self._config_delivery == PEBBLE_CONFIG_DELIVERY:
+            return self._pushed_config_file_path
+        return self._oathkeeper_config_file_path
+
+    @property
+    def _access_rules_repository_path(self) -> str:
+        """The directory that Oathkeeper loads the access rules from."""
+        if self._config_delivery == PEBBLE_CONFIG_DELIVERY:
+            return self._pushed_access_rules_dir_path
+        return self._access_rules_dir_path
+
+    def _layer_changes(self) -> List[str]:
+        """Return the fields of the Oathkeeper layer that differ from the container's plan."""
+        plan = self._container.get_plan().to_dict()
+        changes = []
+        for section in ("services", "checks"):
+            for name, desired in self._oathkeeper_layer.to_dict().get(section, {}).items():
+                current = plan.get(section, {}).get(name)
+                if current is None:
+                    changes.append(f"{section}.{name}")
+                    continue
+                # Pebble omits the empty fields from the plan
+                changes.extend(
+                    f"{section}.{name}.{field}"
+                    for field, value in desired.items()
+                    if field != "override"
+                    and _normalize_layer_value(current.get(field) or None)
+                    != _normalize_layer_value(value or None)
+                )
+        return changes
+
+    @property
+    def _restart_required(self) -> bool:
+        """Whether the running service must be restarted to apply the layer.
+
+        Oathkeeper watches its config file and the access rules, so changes to the rules,
+        the mutator headers or the Kratos urls are hot-reloaded. Changes to the command or
+        to the environment, which carries the TLS and tracing settings, need a restart.
+        """
+        if not self._container.can_connect():
+            return False
+
+        changes = self._layer_changes()
+        return f"services.{self._service_name}" not in changes and any(
+            change.startswith("services.") for change in changes
+        )
+
     @property
     def _oathkeeper_service_is_running(self) -> bool:
         if not self._container.can_connect():
@@ -319,13 +526,31 @@ class OathkeeperCharm(CharmBase):
 
     def _get_all_access_rules_repositories(self) -> Optional[List]:
         repositories = []
-        if cm_access_rules := self.access_rules_configmap.get():
+        if cm_access_rules := self.access_rules_shards.get():
             for key in cm_access_rules:
-                repositories.append(f"{self._access_rules_dir_path}/{key}")
+                repositories.append(f"{self._access_rules_repository_path}/{key}")
         return repositories
 
+    @property
+    def _session_extra_from(self) -> str:
+        """The part of the Kratos session copied into the request context, as a gjson path."""
+        if not self.config["session-projection"]:
+            return "@this"
+
+        headers = self.auth_proxy.get_headers()
+        traits = ",".join(
+            f'"{trait}":identity.traits.{trait}'
+            for header, trait in SESSION_TRAIT_HEADERS.items()
+            if header in headers
+        )
+        # Keep the shape of the session, so that the mutators read the same fields
+        identity = '"id":identity.id' + (f',"traits":{{{traits}}}' if traits else "")
+        return f'{{"identity":{{{identity}}}}}'
+
     def _render_conf_file(self) -> str:
         """Render the Oathkeeper configuration file."""
+        from jinja2 import Template
+
         with open("templates/oathkeeper.yaml.j2", "r") as file:
             template = Template(file.read())
 
@@ -335,18 +560,32 @@ class OathkeeperCharm(CharmBase):
             kratos_login_url=kratos_endpoints.get("login_browser_endpoint", None),
             access_rules=self._get_all_access_rules_repositories(),
             headers=self.auth_proxy.get_headers(),
+            extra_from=self._session_extra_from,
+            matching_strategy=self._rendered_matching_strategy,
+            jwks_url=self.config.get("jwt-jwks-url"),
+            jwks_ttl=self.config["jwt-jwks-ttl"],
+            introspection_url=self.config.get("oauth2-introspection-url"),
+            introspection_cache_ttl=self.config["oauth2-introspection-cache-ttl"],
+            introspection_cache_max_cost=self.config["oauth2-introspection-cache-max-cost"],
+            id_token_jwks_path=ID_TOKEN_JWKS_PATH if self._id_token_enabled else None,
+            id_token_issuer=self._public_endpoint,
+            id_token_claims=self._id_token_claims,
         )
         return rendered
 
-    @retry(
-        wait=wait_exponential(multiplier=3, min=1, max=10),
-        stop=stop_after_attempt(5),
-        reraise=True,
-        before=before_log(logger, logging.DEBUG),
-    )
-    def _update_config(self) -> None:
+    def _update_config(self) -> bool:
+        """Update the config file, returns True if its content changed."""
         conf = self._render_conf_file()
-        self.oathkeeper_configmap.update({"oathkeeper.yaml": conf})
+        fingerprint = self._fingerprint(conf)
+        changed = self._get_peer_data(OATHKEEPER_CONFIG_PEER_KEY).get("fingerprint") != fingerprint
+        if changed:
+            self.oathkeeper_configmap.update({"oathkeeper.yaml": conf})
+            if self.unit.is_leader():
+                self._set_peer_data(OATHKEEPER_CONFIG_PEER_KEY, {"fingerprint": fingerprint})
+        else:
+            logger.debug("Oathkeeper config is unchanged, skipping the configMap update")
+        self._push_config_files(conf)
+        self._push_id_token_jwks()
 
         if all([
             self.cert_handler.cert,
@@ -357,14 +596,117 @@ class OathkeeperCharm(CharmBase):
                 self.cert_handler.cert, self.cert_handler.key, self.cert_handler.ca
             )
 
+        return changed
+
+    def _push_config_files(self, conf: Optional[str] = None) -> None:
+        """Push the config file and the access rules into the Oathkeeper container.
+
+        This only happens with the pebble config delivery. The kubelet can take a minute or
+        more to sync the mounted configMaps, while Oathkeeper reloads the pushed files within
+        seconds. The files are pushed from the configMaps, which remain the durable copy.
+
+        Only the files that changed or are missing from the container are pushed, as every
+        write makes Oathkeeper reload its config.
+        """
+        if self._config_delivery != PEBBLE_CONFIG_DELIVERY or not self._container.can_connect():
+            return
+
+        pushed = json.loads(self._stored.pushed_files)
+        existing = set()
+        if self._container.exists(self._pushed_access_rules_dir_path):
+            existing = {
+                file.path
+                for file in self._container.list_files(self._pushed_access_rules_dir_path)
+            }
+        if self._container.exists(self._pushed_config_file_path):
+            existing.add(self._pushed_config_file_path)
+
+        access_rules = self.access_rules_shards.get()
+        for filename, rules in access_rules.items():
+            path = f"{self._pushed_access_rules_dir_path}/{filename}"
+            self._push_file(path, rules, pushed, existing)
+        for path in existing - {self._pushed_config_file_path}:
+            if os.path.basename(path) not in access_rules:
+                self._container.remove_path(path)
+                pushed.pop(path, None)
+
+        # The config file is pushed last, as it references the access rules files
+        conf = conf or self._render_conf_file()
+        self._push_file(self._pushed_config_file_path, conf, pushed, existing)
+        self._stored.pushed_files = json.dumps(pushed)
+
+    def _push_file(
+        self, path: str, content: str, pushed: Dict[str, str], existing: Set[str]
+    ) -> None:
+        """Push a file into the Oathkeeper container, unless it is there with the same content."""
+        fingerprint = self._fingerprint(content)
+        if path in existing and pushed.get(path) == fingerprint:
+            return
+        self._container.push(path, content, make_dirs=True)
+        pushed[path] = fingerprint
+
+    @property
+    def _id_token_enabled(self) -> bool:
+        """Whether any auth-proxy requirer receives the identity as an id token."""
+        return any(
+            config.mutator == "id_token"
+            for config in self.auth_proxy.get_auth_proxy_configs().values()
+        )
+
+    @property
+    def _id_token_claims(self) -> Optional[str]:
+        """The claims added to the id tokens, matching the headers requested over auth-proxy."""
+        headers = self.auth_proxy.get_headers()
+        claims = {
+            trait: SESSION_TRAIT_TEMPLATE.format(trait=trait)
+            for header, trait in SESSION_TRAIT_HEADERS.items()
+            if header in headers
+        }
+        return json.dumps(claims) if claims else None
+
+    @property
+    def _id_token_jwks(self) -> Optional[str]:
+        """The keys signing the id tokens, generated by the leader when first needed."""
+        try:
+            secret = self.model.get_secret(label=ID_TOKEN_JWKS_SECRET_LABEL)
+        except SecretNotFoundError:
+            if not self.unit.is_leader():
+                return None
+            logger.info("Generating the id token signing keys")
+            secret = self.app.add_secret(
+                {"jwks": generate_jwks()}, label=ID_TOKEN_JWKS_SECRET_LABEL
+            )
+        return secret.get_content(refresh=True)["jwks"]
+
+    def _push_id_token_jwks(self) -> None:
+        """Push the keys signing the id tokens into the Oathkeeper container."""
+        if not self._id_token_enabled or not self._container.can_connect():
+            return
+
+        if not (jwks := self._id_token_jwks):
+            logger.info("Waiting for the leader to generate the id token signing keys")
+            return
+        self._container.push(ID_TOKEN_JWKS_PATH, jwks, make_dirs=True, permissions=0o600)
+
+    def _fingerprint(self, content: str) -> str:
+        return hashlib.sha256(content.encode()).hexdigest()
+
     def _update_oathkeeper_info_relation_data(self, event: HookEvent) -> None:
         logger.info("Sending oathkeeper info")
 
-        self.info_provider.send_info_relation_data(
+        written = self.info_provider.send_info_relation_data(
             public_endpoint=self._public_endpoint,
-            rules_configmap_name=self.access_rules_configmap.name,
+            rules_configmap_name=AccessRulesShards.shard_name(0),
             configmaps_namespace=self.model.name,
+            # Oathkeeper serves the public keys of the id_token mutator
+            jwks_endpoint=f"{self._public_endpoint.rstrip('/')}/.well-known/jwks.json"
+            if self._id_token_enabled
+            else None,
         )
+        if written:
+            # The written databags all hold the same info
+            relation = self.model.relations[OATHKEEPER_INFO_RELATION_NAME][0]
+            self._profiler.track_relation_data(relation.data[self.app], writes=written)
 
     def _get_kratos_info(self) -> Dict:
         kratos_info = {}
@@ -383,11 +725,19 @@ class OathkeeperCharm(CharmBase):
         """Fetch the peer relation."""
         return self.model.get_relation(PEER)
 
+    def _record_peer_data_undo(self, key: str) -> None:
+        """Keep the value a peer data key had when the hook started."""
+        if key not in self._peer_data_undo:
+            self._peer_data_undo[key] = self._peers.data[self.app].get(key)
+
     def _set_peer_data(self, key: str, data: Dict) -> None:
         """Put information into the peer data bucket."""
         if not self._peers:
             return
-        self._peers.data[self.app][key] = json.dumps(data)
+        self._record_peer_data_undo(key)
+        value = json.dumps(data)
+        self._peers.data[self.app][key] = value
+        self._profiler.track_relation_data({key: value})
 
     def _get_peer_data(self, key: str) -> Dict:
         """Retrieve information from the peer data bucket."""
@@ -400,6 +750,7 @@ class OathkeeperCharm(CharmBase):
         """Retrieve and remove information from the peer data bucket."""
         if not self._peers:
             return {}
+        self._record_peer_data_undo(key)
         data = self._peers.data[self.app].pop(key, "")
         return json.loads(data) if data else {}
 
@@ -416,6 +767,8 @@ class OathkeeperCharm(CharmBase):
         return self._pop_peer_data(key)
 
     def _patch_statefulset(self) -> None:
+        from lightkube.resources.apps_v1 import StatefulSet
+
         pod_spec_patch = {
             "containers": [
                 {
@@ -441,19 +794,31 @@ class OathkeeperCharm(CharmBase):
                 },
                 {
                     "name": "access-rules",
-                    "configMap": {"name": self._access_rules_config_map_name},
+                    # Remove the volume source used before the access rules were sharded
+                    "configMap": None,
+                    "projected": {
+                        "sources": [
+                            {"configMap": {"name": name}}
+                            for name in self.access_rules_shards.names
+                        ]
+                    },
                 },
             ],
         }
+        if limits := self._resource_limits:
+            # Requests equal to the limits give the pod a guaranteed QoS
+            pod_spec_patch["containers"][0]["resources"] = {"limits": limits, "requests": limits}
         patch = {"spec": {"template": {"spec": pod_spec_patch}}}
         self.client.patch(StatefulSet, name=self._name, namespace=self.model.name, obj=patch)
+        self._stored.resources = json.dumps(limits)
 
     def _on_install(self, event: InstallEvent) -> None:
         """Handle install event."""
         if not self.unit.is_leader():
             return
 
-        config_map.create_all()
+        self.oathkeeper_configmap.create()
+        self.access_rules_shards.create()
         self._update_config()
 
     def _on_oathkeeper_pebble_ready(self, event: PebbleReadyEvent) -> None:
@@ -463,18 +828,94 @@ class OathkeeperCharm(CharmBase):
 
     def _on_config_changed(self, event: ConfigChangedEvent) -> None:
         """Handle config-changed event."""
+        if self.unit.is_leader() and json.loads(self._stored.resources) != self._resource_limits:
+            logger.info(f"Setting the Oathkeeper container resources to {self._resource_limits}")
+            self._patch_statefulset()
+
+        self._reconcile_access_rules()
+        self._update_config()
+        if self._restart_required:
+            self._restart_service()
+
         self.forward_auth.update_forward_auth_config(self._forward_auth_config)
 
     def _on_update_status(self, event: UpdateStatusEvent) -> None:
         """Handle update-status event."""
+        if self.unit.status == NOT_READY_STATUS:
+            self._set_ready_status()
         self._update_oathkeeper_info_relation_data(event)
+        # Pick up the access rules written to the configMaps by other charms
+        self._push_config_files()
+        self._push_id_token_jwks()
+
+    def _on_peer_relation_changed(self, event: RelationChangedEvent) -> None:
+        """Push the config files written to the configMaps by the leader."""
+        self._push_config_files()
+        self._push_id_token_jwks()
+
+    def _on_restart_lock_acquired(self, event: RestartLockAcquiredEvent) -> None:
+        """Apply the layer changes that were waiting for the restart lock."""
+        if self._stored.restart_ready_since:
+            # The lock is already held until the restarted Oathkeeper is ready
+            return
+
+        self._restart_service()
+        # The layer may have been applied in the meantime, don't hold the other units back
+        self._restart_lock.release()
 
     def _on_remove(self, event: RemoveEvent) -> None:
         """Handle remove event."""
         if not self.unit.is_leader():
             return
 
-        config_map.delete_all()
+        self.oathkeeper_configmap.delete()
+        for configmap in self.access_rules_shards.configmaps:
+            configmap.delete()
+
+    def _on_pre_commit(self, event: PreCommitEvent) -> None:
+        """Write the configMap changes buffered during the hook.
+
+        Instead of retrying within the hook, a failed write is recorded and the configMaps
+        are reconciled again at the end of the next hook, so that a flaky API server does
+        not hold the other events of the model back. This runs on pre-commit, as the stored
+        state is saved before the commit observers of the charm run.
+        """
+        self._release_restart_lock_when_ready()
+
+        if self._stored.needs_reconcile:
+            self._reconcile()
+
+        if self._stored.pending_reconcile:
+            logger.info("Retrying the configMap changes of a previous hook")
+            self._reconcile_access_rules()
+            self._update_config()
+
+        try:
+            config_map.flush_all()
+        except (ApiError, HTTPError) as e:
+            logger.error(f"Failed to write the configMaps, will retry on the next hook: {e}")
+            self._on_flush_failed()
+            return
+
+        self._stored.pending_reconcile = False
+        self._stored.failed_flushes = 0
+        if self.unit.status == FLUSH_FAILED_STATUS:
+            self._set_ready_status()
+
+    def _on_flush_failed(self) -> None:
+        """Revert the peer data written during the hook and record the pending work."""
+        # The fingerprints in the peer data describe what is stored in the configMaps,
+        # restoring them makes the next reconcile rewrite what was lost
+        for key, value in self._peer_data_undo.items():
+            if value is None:
+                self._peers.data[self.app].pop(key, None)
+            else:
+                self._peers.data[self.app][key] = value
+
+        self._stored.pending_reconcile = True
+        self._stored.failed_flushes += 1
+        if self._stored.failed_flushes >= FLUSH_FAILURE_BUDGET:
+            self.unit.status = FLUSH_FAILED_STATUS
 
     def _on_kratos_relation_changed(self, event: RelationChangedEvent) -> None:
         self._handle_status_update_config(event)
@@ -485,18 +926,20 @@ class OathkeeperCharm(CharmBase):
         self._update_oathkeeper_info_relation_data(event)
 
         if not self._container.can_connect():
-            logger.info(f"Cannot connect to Oathkeeper container. Deferring the {event} event.")
-            event.defer()
+            self._postpone_reconcile(WaitingStatus("Waiting to connect to Oathkeeper container"))
             return
 
+        self._ensure_admin_ui_rules()
+        self._reconcile_access_rules()
+        self._handle_status_update_config(event)
+
+    def _ensure_admin_ui_rules(self) -> None:
         if not self._container.exists("/etc/config/access-rules/admin_ui_rules.json"):
             # Create an empty configMap key for admin ui
             # to make sure it will be enlisted in oathkeeper config
             patch = {"data": {"admin_ui_rules.json": ""}}
             self.access_rules_configmap.patch(patch=patch, cm_name="access-rules")
 
-        self._handle_status_update_config(event)
-
     def _on_ingress_ready(self, event: IngressPerAppReadyEvent) -> None:
         if self.unit.is_leader():
             logger.info(f"This app's ingress URL: {event.url}")
@@ -511,8 +954,7 @@ class OathkeeperCharm(CharmBase):
 
     def _on_cert_changed(self, event: CertChanged) -> None:
         if not self._container.can_connect():
-            logger.info(f"Cannot connect to Oathkeeper container. Deferring the {event} event.")
-            event.defer()
+            self._postpone_reconcile(WaitingStatus("Waiting to connect to Oathkeeper container"))
             return
 
         self.update_cert_configuration(
@@ -548,33 +990,161 @@ class OathkeeperCharm(CharmBase):
 
     # TODO @shipperizer worth analyzing if the add_layer call
     #  can be spread where needed instead of wired in here
-    def _restart_service(self) -> None:
-        """Build a new layer and restart the service."""
+    def _restart_service(self, wait: bool = True) -> bool:
+        """Apply the layer and replan, if it differs from the plan or the service is down.
+
+        Pebble only restarts the services whose definition changed, so a layer identical to
+        the plan leaves Oathkeeper running and a change to the checks alone does not restart it.
+        Restarting a running service goes through the restart lock, so that the units take
+        turns and the others keep serving the decisions API. The lock is released once the
+        restarted Oathkeeper is ready, or on a later hook when `wait` is False. Starting or
+        restarting the service records the ready check successes, so that the unit is only
+        set active once a check passed afterwards.
+
+        Returns False if the layer could not be applied.
+        """
+        changes = self._layer_changes()
+        running = self._oathkeeper_service_is_running
+        if not changes and running:
+            logger.info("The Oathkeeper layer is unchanged, skipping the replan")
+            return True
+
+        rolling = running and any(
+            change.startswith(f"services.{self._service_name}.") for change in changes
+        )
+        if rolling and not self._restart_lock.acquire():
+            logger.info("Waiting for the restart lock to apply the Oathkeeper layer changes")
+            return True
+
+        if changes:
+            logger.info(f"The Oathkeeper layer changed: {', '.join(changes)}")
         self._container.add_layer(self._container_name, self._oathkeeper_layer, combine=True)
 
+        # The checks keep their counts across a replan, only a success counted after this
+        # point tells that the started Oathkeeper is ready
+        since = self._ready_check_successes()
+        if rolling or not running:
+            self._stored.ready_since = json.dumps(since)
         try:
-            self._container.restart(self._container_name)
+            self._container.replan()
         except ChangeError as err:
             logger.error(str(err))
             self.unit.status = BlockedStatus(
                 "Failed to restart the container, please consult the logs"
             )
+            if rolling:
+                self._restart_lock.release()
+            return False
+
+        if rolling:
+            if wait:
+                self._wait_for_ready(since)
+                self._restart_lock.release()
+            else:
+                self._stored.restart_ready_since = json.dumps(since)
+        return True
+
+    def _ready_check_successes(self) -> Dict[str, Optional[int]]:
+        """The number of successes of each ready check, None if Pebble does not report it."""
+        return {
+            name: check.successes
+            for name, check in self._container.get_checks(level=CheckLevel.READY).items()
+        }
+
+    def _is_ready(self, since: Optional[Dict[str, Optional[int]]] = None) -> bool:
+        """Whether Oathkeeper runs and passes its ready checks.
+
+        Pebble does not reset the checks on a replan, so after a restart only a success
+        counted after `since` tells that the new process is ready.
+        """
+        if not self._oathkeeper_service_is_running:
+            return False
+
+        for name, check in self._container.get_checks(level=CheckLevel.READY).items():
+            if check.status != CheckStatus.UP or check.failures:
+                return False
+            previous = (since or {}).get(name)
+            if None not in (previous, check.successes) and check.successes <= previous:
+                return False
+        return True
+
+    def _set_ready_status(self) -> None:
+        """Set the unit active once Oathkeeper passed a ready check since it last started."""
+        since = json.loads(self._stored.ready_since) if self._stored.ready_since else None
+        if not self._is_ready(since):
+            self.unit.status = NOT_READY_STATUS
+            return
+
+        self._stored.ready_since = ""
+        self.unit.status = ActiveStatus()
+
+    def _wait_for_ready(
+        self, since: Optional[Dict[str, Optional[int]]] = None, timeout: float = 60
+    ) -> bool:
+        """Wait for Oathkeeper to pass its ready checks, returns False on timeout."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self._is_ready(since):
+                return True
+            time.sleep(1)
+
+        logger.warning(f"Oathkeeper is not ready {timeout}s after the restart")
+        return False
+
+    def _release_restart_lock_when_ready(self) -> None:
+        """Release the restart lock held since a previous hook, once Oathkeeper is ready."""
+        if not self._stored.restart_ready_since or not self._container.can_connect():
             return
 
-    def _handle_status_update_config(self, event: HookEvent) -> None:
-        """Handle unit status, update access rules and config file."""
+        if self._is_ready(json.loads(self._stored.restart_ready_since)):
+            self._stored.restart_ready_since = ""
+            self._restart_lock.release()
+
+    def _postpone_reconcile(self, status: WaitingStatus) -> None:
+        """Mark the charm for a reconcile once the workload can be configured.
+
+        This replaces deferring the events: however many handlers postpone their work,
+        a single idempotent reconcile runs at the end of a later hook.
+        """
+        logger.info(f"{status.message}, postponing the reconcile")
+        self._stored.needs_reconcile = True
+        self.unit.status = status
+
+    def _reconcile(self) -> None:
+        """Configure the access rules, the config file and the workload in one pass."""
         if not self._container.can_connect():
-            event.defer()
-            logger.info("Cannot connect to Oathkeeper container. Deferring the event.")
-            self.unit.status = WaitingStatus("Waiting to connect to Oathkeeper container")
+            return
+
+        if self.unit.is_leader() and not self._peers and self.auth_proxy.get_app_names():
+            # The access rules are tracked in the peer data
+            return
+
+        self._stored.needs_reconcile = False
+        logger.info("Reconciling the changes postponed by previous hooks")
+        if self.model.relations[OATHKEEPER_INFO_RELATION_NAME]:
+            self._ensure_admin_ui_rules()
+        self._reconcile_access_rules()
+        # This runs on pre-commit, don't hold the end of the hook back waiting for Oathkeeper
+        self._handle_status_update_config(None, wait=False)
+        self.forward_auth.update_forward_auth_config(self._forward_auth_config)
+
+    def _handle_status_update_config(self, event: Optional[HookEvent], wait: bool = True) -> None:
+        """Handle unit status, update access rules and config file.
+
+        The readiness is not waited for: if Oathkeeper is not ready yet, the status is
+        updated on update-status.
+        """
+        if not self._container.can_connect():
+            self._postpone_reconcile(WaitingStatus("Waiting to connect to Oathkeeper container"))
             return
 
         self.unit.status = MaintenanceStatus("Configuring the container")
 
         self._update_config()
-        self._restart_service()
+        if not self._restart_service(wait=wait):
+            return
 
-        self.unit.status = ActiveStatus()
+        self._set_ready_status()
 
     def _on_list_rules_action(self, event: ActionEvent) -> None:
         if not self._oathkeeper_service_is_running:
@@ -616,6 +1186,12 @@ class OathkeeperCharm(CharmBase):
         event.log(f"Successfully fetched rule: {rule_id}")
         event.set_results(rule)
 
+    def _on_hook_stats_action(self, event: ActionEvent) -> None:
+        if not self._profiler.enabled:
+            event.log("Hook profiling is disabled, enable it with the profile-hooks config")
+
+        event.set_results({"stats": json.dumps(self._profiler.collect(), sort_keys=True)})
+
     def _on_invalid_forward_auth_config(self, event: InvalidForwardAuthConfigEvent) -> None:
         logger.info(
             "The forward-auth config is invalid: one or more of the related apps is missing ingress relation"
@@ -631,62 +1207,235 @@ class OathkeeperCharm(CharmBase):
         # The proxy was removed, but the charm is still functional
         self.unit.status = ActiveStatus()
 
-    @retry(
-        wait=wait_exponential(multiplier=3, min=1, max=10),
-        stop=stop_after_attempt(5),
-        reraise=True,
-        before=before_log(logger, logging.DEBUG),
-    )
-    def _patch_access_rules(self, patch: Dict) -> None:
-        self.access_rules_configmap.patch(patch=patch, cm_name="access-rules")
+    def _patch_access_rules(self, patch: Dict, configmap: AccessRulesConfigMap) -> None:
+        configmap.patch(patch=patch, cm_name=configmap.name)
 
     def _on_auth_proxy_config_changed(self, event: AuthProxyConfigChangedEvent) -> None:
         if not self._oathkeeper_service_is_running:
-            self.unit.status = WaitingStatus("Waiting for Oathkeeper service")
-            event.defer()
+            self._postpone_reconcile(WaitingStatus("Waiting for Oathkeeper service"))
             return
 
         if not self._peers:
-            self.unit.status = WaitingStatus("Waiting for peer relation")
-            event.defer()
+            self._postpone_reconcile(WaitingStatus("Waiting for peer relation"))
             return
 
-        access_rules_filenames = []
-        for rule_type in ("allow", "deny"):
-            rules = self._render_access_rules(
-                rule_type=rule_type,
-                protected_urls=event.protected_urls,
-                allowed_endpoints=event.allowed_endpoints,
-                relation_app_name=event.relation_app_name,
-            )
-
-            if rules:
-                cm_name = f"access-rules-{event.relation_app_name}-{rule_type}.json"
-                patch = {"data": {cm_name: str(rules)}}
-                self._patch_access_rules(patch)
-                access_rules_filenames.append(cm_name)
-
-        self._set_auth_proxy_relation_peer_data(
-            event.relation_id, {"access_rules_filenames": access_rules_filenames}
-        )
+        rules_changed = self._reconcile_access_rules()
 
         try:
-            self._update_config()
+            config_changed = self._update_config()
         except Error as e:
             logger.error(f"Failed to set new config: {e}")
             self.unit.status = BlockedStatus("Failed to set new config, see logs")
             self._pop_auth_proxy_relation_peer_data(event.relation_id)
             return
 
+        if not rules_changed and not config_changed:
+            logger.info("Auth-proxy config is unchanged, skipping the forward-auth update")
+            return
+
         logger.info("Auth-proxy config has changed. Forward-auth relation will be updated")
         self.forward_auth.update_forward_auth_config(self._forward_auth_config)
+        self._update_oathkeeper_info_relation_data(event)
+
+    def _render_relation_access_rules(
+        self,
+        relation_app_name: str,
+        protected_urls: List[str],
+        allowed_endpoints: List[str],
+        matching_strategy: str,
+        authenticator: str = DEFAULT_AUTHENTICATOR,
+        mutator: str = DEFAULT_MUTATOR,
+        static_asset_suffixes: Optional[List[str]] = None,
+    ) -> Dict[str, str]:
+        """Render the rule files of an auth-proxy relation, keyed by filename."""
+        access_rules = {}
+        for rule_type in ("allow", "deny"):
+            rules = self._render_access_rules(
+                rule_type=rule_type,
+                protected_urls=protected_urls,
+                allowed_endpoints=allowed_endpoints,
+                relation_app_name=relation_app_name,
+                matching_strategy=matching_strategy,
+                authenticator=authenticator,
+                mutator=mutator,
+                static_asset_suffixes=static_asset_suffixes,
+            )
+
+            if rules:
+                access_rules[f"access-rules-{relation_app_name}-{rule_type}.json"] = str(rules)
+        return access_rules
+
+    def _reconcile_access_rules(self, removed_relation_id: Optional[int] = None) -> bool:
+        """Render the access rules of all the auth-proxy relations and store them in one pass.
+
+        The changed rule files are written with a single patch per configMap, which also
+        deletes the files of removed relations and the files moved to another shard.
+        Returns True if any rule file changed.
+        """
+        if not self.unit.is_leader() or not self._peers:
+            return False
+
+        layout = self._apply_access_rules_layout()
+
+        patches: Dict[str, Dict[str, Optional[str]]] = defaultdict(dict)
+        peer_data = {}
+        configs = self.auth_proxy.get_auth_proxy_configs()
+        configs.pop(removed_relation_id, None)
+        for relation_id, config in configs.items():
+            relation = self.model.get_relation(self._auth_proxy_relation_name, relation_id)
+            access_rules = self._render_relation_access_rules(
+                relation_app_name=relation.app.name,
+                protected_urls=config.protected_urls,
+                allowed_endpoints=config.allowed_endpoints,
+                matching_strategy=layout["matching_strategy"],
+                authenticator=self._access_rules_authenticator(config, relation.app.name),
+                mutator=config.mutator or DEFAULT_MUTATOR,
+                static_asset_suffixes=config.static_asset_suffixes,
+            )
+            configmap_name = self.access_rules_shards.shard(relation.app.name).name
+            fingerprint = self._fingerprint(
+                json.dumps({"configmap": configmap_name, "data": access_rules}, sort_keys=True)
+            )
+            previous = self._get_auth_proxy_relation_peer_data(relation_id)
+            if previous.get("fingerprint") == fingerprint:
+                continue
+
+            logger.info(f"Access rules of {relation.app.name} have changed")
+            patches[configmap_name].update(access_rules)
+            self._drop_access_rules_files(patches, previous)
+            peer_data[relation_id] = {
+                "access_rules_filenames": list(access_rules),
+                "configmap": configmap_name,
+                "fingerprint": fingerprint,
+            }
+
+        for relation_id in self._auth_proxy_peer_relation_ids() - configs.keys():
+            self._drop_access_rules_files(
+                patches, self._get_auth_proxy_relation_peer_data(relation_id)
+            )
+            self._pop_auth_proxy_relation_peer_data(relation_id)
+
+        for configmap_name, data in patches.items():
+            configmap = self.access_rules_shards.get_configmap(configmap_name)
+            self._patch_access_rules({"data": data}, configmap)
+
+        for relation_id, data in peer_data.items():
+            self._set_auth_proxy_relation_peer_data(relation_id, data)
+
+        self.access_rules_shards.prune(
+            previous_shards=self._rendered_access_rules_layout["shards"]
+        )
+        self._set_peer_data(ACCESS_RULES_PEER_KEY, layout)
+        return bool(patches)
+
+    def _drop_access_rules_files(
+        self, patches: Dict[str, Dict[str, Optional[str]]], peer_data: Dict
+    ) -> None:
+        """Delete the previously stored rule files of a relation, unless they are rewritten."""
+        configmap_name = peer_data.get("configmap", self.access_rules_configmap.name)
+        for filename in peer_data.get("access_rules_filenames", []):
+            # A null value removes the key when the configMap is patched
+            patches[configmap_name].setdefault(filename, None)
+
+    def _auth_proxy_peer_relation_ids(self) -> Set[int]:
+        """The ids of the auth-proxy relations that have rules stored in the peer data."""
+        prefix = "auth_proxy_"
+        return {
+            int(key[len(prefix) :]) for key in self._peers.data[self.app] if key.startswith(prefix)
+        }
+
+    @property
+    def _access_rules_matching_strategy(self) -> str:
+        """The matching strategy that all the access rules can be rendered with."""
+        if self.config["access-rules-matching-strategy"] != GLOB_MATCHING_STRATEGY:
+            return REGEXP_MATCHING_STRATEGY
+
+        # Rules provided over oathkeeper-info are written by the related charms as regexes
+        if self.model.relations[OATHKEEPER_INFO_RELATION_NAME]:
+            logger.info("Falling back to regexp matching strategy due to oathkeeper-info rules")
+            return REGEXP_MATCHING_STRATEGY
+
+        for config in self.auth_proxy.get_auth_proxy_configs().values():
+            if not is_glob_compatible(config.protected_urls, config.allowed_endpoints):
+                logger.info(
+                    f"Falling back to regexp matching strategy, {config.protected_urls} and "
+                    f"{config.allowed_endpoints} cannot be expressed as glob patterns"
+                )
+                return REGEXP_MATCHING_STRATEGY
+
+        return GLOB_MATCHING_STRATEGY
+
+    @property
+    def _enabled_authenticators(self) -> Set[str]:
+        """The authenticators enabled in the Oathkeeper config."""
+        authenticators = {DEFAULT_AUTHENTICATOR}
+        if self.config.get("jwt-jwks-url"):
+            authenticators.add("jwt")
+        if self.config.get("oauth2-introspection-url"):
+            authenticators.add("oauth2_introspection")
+        return authenticators
+
+    def _access_rules_authenticator(self, config: AuthProxyConfig, app_name: str) -> str:
+        """The authenticator protecting the urls of a requirer."""
+        authenticator = config.authenticator or DEFAULT_AUTHENTICATOR
+        if authenticator not in self._enabled_authenticators:
+            logger.warning(
+                f"The {authenticator} authenticator requested by {app_name} is not configured, "
+                f"falling back to {DEFAULT_AUTHENTICATOR}"
+            )
+            return DEFAULT_AUTHENTICATOR
+        return authenticator
+
+    @property
+    def _access_rules_shards(self) -> int:
+        return max(int(self.config["access-rules-shards"]), 1)
+
+    @property
+    def _rendered_access_rules_layout(self) -> Dict:
+        """The matching strategy and number of shards of the stored access rules."""
+        return {
+            "matching_strategy": REGEXP_MATCHING_STRATEGY,
+            "shards": 1,
+            **self._get_peer_data(ACCESS_RULES_PEER_KEY),
+        }
+
+    @property
+    def _rendered_matching_strategy(self) -> str:
+        """The matching strategy that the stored access rules were rendered with."""
+        return self._rendered_access_rules_layout["matching_strategy"]
+
+    def _apply_access_rules_layout(self) -> Dict:
+        """Return the layout to render the access rules with, preparing the shards it needs.
+
+        The layout is made of the matching strategy and the number of shards.
+        """
+        layout = {
+            "matching_strategy": self._access_rules_matching_strategy,
+            "shards": self._access_rules_shards,
+        }
+        rendered_layout = self._rendered_access_rules_layout
+        if layout["shards"] != rendered_layout["shards"]:
+            logger.info(f"Spreading the access rules across {layout['shards']} configMaps")
+            self.access_rules_shards.resize(layout["shards"])
+            self.access_rules_shards.create()
+            self._patch_statefulset()
+
+        if layout["matching_strategy"] != rendered_layout["matching_strategy"]:
+            logger.info(f"Rendering all access rules with {layout['matching_strategy']} strategy")
+        return layout
 
     def _rule_template(
-        self, rule_id: str, url: str, authenticator: str, mutator: str, error_handler: str
+        self,
+        rule_id: str,
+        url: str,
+        authenticator: str,
+        mutator: str,
+        error_handler: str,
+        methods: List[str] = ACCESS_RULE_METHODS,
     ) -> Dict:
         return {
             "id": rule_id,
-            "match": {"url": url, "methods": ["GET", "POST", "OPTION", "PUT", "PATCH", "DELETE"]},
+            "match": {"url": url, "methods": list(methods)},
             "authenticators": [{"handler": authenticator}],
             "mutators": [{"handler": mutator}],
             "authorizer": {"handler": "allow"},
@@ -699,25 +1448,27 @@ class OathkeeperCharm(CharmBase):
         protected_urls: List[str],
         allowed_endpoints: List[str],
         relation_app_name: str,
-    ) -> Optional[List[Dict]]:
-        """Render access rules from a template."""
+        matching_strategy: str = REGEXP_MATCHING_STRATEGY,
+        authenticator: str = DEFAULT_AUTHENTICATOR,
+        mutator: str = DEFAULT_MUTATOR,
+        static_asset_suffixes: Optional[List[str]] = None,
+    ) -> List[Dict]:
+        """Render access rules from a template.
+
+        Besides the allowed endpoints, the allow rules let through the CORS preflight
+        requests and the static assets of the requirer without a session check.
+        """
         rules = []
 
         for url_index, url in enumerate(protected_urls):
-            # Parse url
-            if url.endswith("/"):
-                url = url[:-1]
-            # Replace with regex to match both http and https
-            url = url.replace("https", "<^(https|http)>")
+            # Match both http and https
+            url = protected_url_pattern(url, matching_strategy)
 
             if rule_type == "allow":
-                if not allowed_endpoints:
-                    return None
                 for endpoint in allowed_endpoints:
-                    allow_regex = f"{url}/<{endpoint}((/.*$)|$)>"
                     allow_rule = self._rule_template(
                         rule_id=f"{relation_app_name}:{endpoint}:{url_index}:allow",
-                        url=allow_regex,
+                        url=allow_pattern(url, endpoint, matching_strategy),
                         authenticator="noop",
                         mutator="noop",
                         error_handler="json",
@@ -725,25 +1476,44 @@ class OathkeeperCharm(CharmBase):
 
                     rules.append(allow_rule)
 
-            if rule_type == "deny":
-                if allowed_endpoints:
-                    # Render a regex to exclude allowed endpoints
-                    exclude_endpoints = [
-                        "/" + endpoint + "((/.*$)|$)" for endpoint in allowed_endpoints
-                    ]
-
-                    # Add | alternation
-                    deny_regex = f"{url}<(?!{'|'.join(exclude_endpoints)}).*>"
-                else:
-                    # Protect all endpoints
-                    deny_regex = f"{url}<.*>"
+                # Browsers send preflight requests without credentials
+                rules.append(
+                    self._rule_template(
+                        rule_id=f"{relation_app_name}:{url_index}:preflight",
+                        url=preflight_pattern(url, matching_strategy),
+                        authenticator="noop",
+                        mutator="noop",
+                        error_handler="json",
+                        methods=PREFLIGHT_METHODS,
+                    )
+                )
+                if static_asset_suffixes:
+                    rules.append(
+                        self._rule_template(
+                            rule_id=f"{relation_app_name}:{url_index}:static",
+                            url=static_asset_pattern(
+                                url, allowed_endpoints, static_asset_suffixes, matching_strategy
+                            ),
+                            authenticator="noop",
+                            mutator="noop",
+                            error_handler="json",
+                            methods=STATIC_ASSET_METHODS,
+                        )
+                    )
 
+            if rule_type == "deny":
+                # Render a pattern matching every endpoint except the allowed ones and
+                # the static assets
                 deny_rule = self._rule_template(
                     rule_id=f"{relation_app_name}:{url_index}:deny",
-                    url=deny_regex,
-                    authenticator="cookie_session",
-                    mutator="header",
-                    error_handler="redirect",
+                    url=deny_pattern(
+                        url, allowed_endpoints, matching_strategy, static_asset_suffixes
+                    ),
+                    authenticator=authenticator,
+                    mutator=mutator,
+                    # API clients with a missing or expired token expect a 401, not a
+                    # redirect to the browser login page
+                    error_handler="redirect" if authenticator == "cookie_session" else "json",
                 )
 
                 rules.append(deny_rule)
@@ -756,20 +1526,14 @@ class OathkeeperCharm(CharmBase):
             return
 
         if not self._peers:
-            self.unit.status = WaitingStatus("Waiting for peer relation")
-            event.defer()
+            self._postpone_reconcile(WaitingStatus("Waiting for peer relation"))
             return
 
-        peer_data = self._get_auth_proxy_relation_peer_data(event.relation_id)
-        if not peer_data:
-            logger.error("No access rules locations found in peer data")
-            return
-
-        self.access_rules_configmap.pop(keys=peer_data["access_rules_filenames"])
-        self._pop_auth_proxy_relation_peer_data(event.relation_id)
+        self._reconcile_access_rules(removed_relation_id=event.relation_id)
 
         self._update_config()
         self.forward_auth.update_forward_auth_config(self._forward_auth_config)
+        self._update_oathkeeper_info_relation_data(event)
 
 
 if __name__ == "__main__":
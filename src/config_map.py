@@ -4,11 +4,13 @@
 """A helper class for managing the configMaps holding the oathkeeper config."""
 
 import logging
-from typing import Dict, List
+import zlib
+from typing import Dict, List, Optional, Tuple
 
 from lightkube import ApiError, Client
 from lightkube.models.meta_v1 import ObjectMeta
 from lightkube.resources.core_v1 import ConfigMap
+from lightkube.types import PatchType
 from ops.charm import CharmBase
 
 logger = logging.getLogger(__name__)
@@ -31,6 +33,21 @@ class ConfigMapManager:
         for cm in cls.configmaps.values():
             cm.delete()
 
+    @classmethod
+    def flush_all(cls) -> int:
+        """Apply the buffered changes of all the configMaps, returns the number of saved calls."""
+        requested, made = 0, 0
+        for cm in cls.configmaps.values():
+            cm_requested, cm_made = cm.flush()
+            requested += cm_requested
+            made += cm_made
+
+        if requested:
+            logger.info(
+                f"Flushed the configMap changes with {made} API calls instead of {requested}"
+            )
+        return requested - made
+
     @classmethod
     def register(cls, cm: "ConfigMapBase") -> None:
         """Register a configMap."""
@@ -38,12 +55,28 @@ class ConfigMapManager:
 
 
 class ConfigMapBase:
-    """Base class for managing a configMap."""
+    """Base class for managing a configMap.
+
+    Changes to the data are buffered and applied by `flush`, so that a hook writes
+    each configMap at most once. The configMap is read at most once per dispatch, the
+    snapshot is then kept up to date with the objects returned by the writes.
+
+    The configMap is created and updated with server-side apply, using the field manager
+    of the lightkube client, while individual keys are set and removed with a JSON patch.
+    """
 
     def __init__(self, configmap_name: str, client: Client, charm: CharmBase) -> None:
         self.name = configmap_name
         self._client = client
         self._charm = charm
+        # The data replacing the whole configMap data, if `update` was called
+        self._data: Optional[Dict[str, str]] = None
+        # The keys to set or, when None, to remove
+        self._changes: Dict[str, Optional[str]] = {}
+        # The number of API calls the buffered changes would have cost without the buffer
+        self._requested_calls = 0
+        # The last known state of the configMap, read or written during this dispatch
+        self._snapshot: Optional[ConfigMap] = None
         ConfigMapManager.register(self)
 
     @property
@@ -51,14 +84,23 @@ class ConfigMapBase:
         """The namespace of the ConfigMap."""
         return self._charm.model.name
 
-    def create(self) -> None:
-        """Create the configMap."""
-        try:
-            self._client.get(ConfigMap, self.name, namespace=self.namespace)
-            return
-        except ApiError:
-            pass
-
+    @property
+    def resource_version(self) -> Optional[str]:
+        """The resourceVersion of the configMap snapshot, if it was read or written."""
+        if self._snapshot is None or self._snapshot.metadata is None:
+            return None
+        return self._snapshot.metadata.resourceVersion
+
+    def _read(self) -> ConfigMap:
+        if self._snapshot is None:
+            self._snapshot = self._client.get(ConfigMap, self.name, namespace=self.namespace)
+        return self._snapshot
+
+    def invalidate(self) -> None:
+        """Drop the configMap snapshot, the next read goes to the API server."""
+        self._snapshot = None
+
+    def _apply(self, data: Optional[Dict[str, str]] = None) -> None:
         cm = ConfigMap(
             apiVersion="v1",
             kind="ConfigMap",
@@ -70,47 +112,143 @@ class ConfigMapBase:
                     "app.kubernetes.io/managed-by": "juju",
                 },
             ),
+            data=data,
         )
-        self._client.create(cm)
+        self._snapshot = self._client.apply(cm, force=True)
+
+    def create(self) -> None:
+        """Create the configMap, this is a no-op if it already exists."""
+        self._apply()
 
     def update(self, data: Dict) -> None:
-        """Update the configMap."""
-        try:
-            cm = self._client.get(ConfigMap, self.name, namespace=self.namespace)
-        except ApiError:
-            return
-        cm.data = data
-        self._client.replace(cm)
+        """Replace the configMap data."""
+        self._data = dict(data)
+        self._changes = {}
+        self._requested_calls += 2
 
     def patch(self, patch: Dict, cm_name: str) -> None:
-        """Patch the configMap."""
-        self._client.patch(ConfigMap, name=cm_name, namespace=self.namespace, obj=patch)
+        """Patch the configMap data, a None value removes the key."""
+        self._stage(patch.get("data", {}))
+        self._requested_calls += 1
 
     def pop(self, keys: List[str]) -> None:
         """Pop data from the configMap."""
-        try:
-            cm = self._client.get(ConfigMap, self.name, namespace=self.namespace)
-        except ApiError:
-            return
+        self._stage(dict.fromkeys(keys))
+        self._requested_calls += 2
 
-        for key in keys:
-            try:
-                cm.data.pop(key)
-            except KeyError:
-                logger.info(f"{key} not found in the ConfigMap")
+    def _stage(self, changes: Dict[str, Optional[str]]) -> None:
+        if self._data is None:
+            self._changes.update(changes)
+            return
 
-        self._client.replace(cm)
+        for key, value in changes.items():
+            if value is None:
+                self._data.pop(key, None)
+            else:
+                self._data[key] = value
 
     def get(self) -> Dict[str, str]:
-        """Get the configMap."""
+        """Get the configMap, including the changes that are not flushed yet."""
+        if self._data is not None:
+            return dict(self._data)
+
         try:
-            cm = self._client.get(ConfigMap, self.name, namespace=self.namespace)
+            cm = self._read()
         except ApiError:
             return {}
-        return cm.data
+
+        data = dict(cm.data or {})
+        for key, value in self._changes.items():
+            if value is None:
+                data.pop(key, None)
+            else:
+                data[key] = value
+        return data
+
+    def flush(self) -> Tuple[int, int]:
+        """Apply the buffered changes to the configMap.
+
+        Returns the number of API calls requested by the buffered changes and the number
+        of calls actually made.
+        """
+        requested, made = self._requested_calls, 0
+        if self._data is not None:
+            self._apply(self._data)
+            made += 1
+        elif self._changes:
+            made += self._patch_data(self._changes)
+
+        # Keep the changes until they are applied, so that a failed flush can be retried
+        self._data, self._changes, self._requested_calls = None, {}, 0
+        return requested, made
+
+    def _json_patch(self, changes: Dict[str, Optional[str]]) -> List[Dict]:
+        """Build the JSON patch operations applying the changes to the configMap snapshot.
+
+        The operations are guarded by a `test` of the resourceVersion of the snapshot, so
+        that the API server rejects them if the configMap changed since it was read.
+        """
+        data = self._read().data
+        guard = []
+        if resource_version := self.resource_version:
+            guard = [
+                {"op": "test", "path": "/metadata/resourceVersion", "value": resource_version}
+            ]
+
+        if data is None:
+            # A `remove` operation fails on a missing key, so only the added keys are sent
+            values = {key: value for key, value in changes.items() if value is not None}
+            return guard + [{"op": "add", "path": "/data", "value": values}] if values else []
+
+        operations = []
+        for key, value in changes.items():
+            path = "/data/" + key.replace("~", "~0").replace("/", "~1")
+            if value is not None:
+                operations.append({"op": "add", "path": path, "value": value})
+            elif key in data:
+                operations.append({"op": "remove", "path": path})
+        return guard + operations if operations else []
+
+    def _patch_data(self, changes: Dict[str, Optional[str]]) -> int:
+        """Apply the changes with a JSON patch, returns the number of API calls made.
+
+        The operations are built from the snapshot. If the configMap changed since it was
+        read, the resourceVersion test fails and the patch is rejected, so the snapshot is
+        dropped and the patch built again.
+        """
+        calls = 0
+        for attempt in range(2):
+            if self._snapshot is None:
+                calls += 1
+            try:
+                operations = self._json_patch(changes)
+            except ApiError:
+                logger.error(f"Failed to patch configMap {self.name}, it does not exist")
+                return calls
+            if not operations:
+                return calls
+
+            calls += 1
+            try:
+                self._snapshot = self._client.patch(
+                    ConfigMap,
+                    name=self.name,
+                    namespace=self.namespace,
+                    obj=operations,
+                    patch_type=PatchType.JSON,
+                )
+                return calls
+            except ApiError as e:
+                self.invalidate()
+                if e.status.code not in (409, 422) or attempt:
+                    raise
+                logger.info(f"ConfigMap {self.name} changed since it was read, reading it again")
+        return calls
 
     def delete(self) -> None:
         """Delete the configMap."""
+        self._data, self._changes, self._requested_calls = None, {}, 0
+        self.invalidate()
         try:
             self._client.delete(ConfigMap, self.name, namespace=self.namespace)
         except ApiError:
@@ -125,10 +263,70 @@ class OathkeeperConfigMap(ConfigMapBase):
 
 
 class AccessRulesConfigMap(ConfigMapBase):
-    """Class for managing the Oathkeeper access rules configMap."""
+    """Class for managing an Oathkeeper access rules configMap."""
 
-    def __init__(self, client: Client, charm: CharmBase) -> None:
-        super().__init__("access-rules", client, charm)
+    def __init__(self, client: Client, charm: CharmBase, name: str = "access-rules") -> None:
+        super().__init__(name, client, charm)
+
+
+class AccessRulesShards:
+    """Spreads the access rule files across several access rules configMaps.
+
+    Each configMap is limited to 1MiB by Kubernetes, so the rule files are assigned to
+    a shard using a stable hash of the key they belong to (e.g. the related app name).
+    The first shard keeps the name of the original access rules configMap.
+    """
+
+    def __init__(self, client: Client, charm: CharmBase, shards: int = 1) -> None:
+        self._client = client
+        self._charm = charm
+        self.configmaps: List[AccessRulesConfigMap] = []
+        self.resize(shards)
+
+    @staticmethod
+    def shard_name(index: int) -> str:
+        """The name of the configMap holding a shard."""
+        return "access-rules" if index == 0 else f"access-rules-{index}"
+
+    @property
+    def names(self) -> List[str]:
+        """The names of all the shard configMaps."""
+        return [self.shard_name(i) for i in range(len(self.configmaps))]
+
+    def resize(self, shards: int) -> None:
+        """Change the number of shards, keeping the configMaps of the existing ones."""
+        self.configmaps = [self.get_configmap(self.shard_name(i)) for i in range(max(shards, 1))]
+
+    def shard(self, key: str) -> AccessRulesConfigMap:
+        """Get the configMap holding the rule files of `key`."""
+        return self.configmaps[zlib.crc32(key.encode()) % len(self.configmaps)]
+
+    def get(self) -> Dict[str, str]:
+        """Get the rule files of all the shards."""
+        data = {}
+        for cm in self.configmaps:
+            data.update(cm.get() or {})
+        return data
+
+    def get_configmap(self, name: str) -> AccessRulesConfigMap:
+        """Get a shard configMap by name, including shards that are no longer in use."""
+        for cm in self.configmaps:
+            if cm.name == name:
+                return cm
+        return AccessRulesConfigMap(self._client, self._charm, name=name)
+
+    def create(self) -> None:
+        """Create the shard configMaps."""
+        for cm in self.configmaps:
+            cm.create()
+
+    def prune(self, previous_shards: int) -> None:
+        """Delete the shard configMaps left over from a larger number of shards."""
+        for index in range(len(self.configmaps), previous_shards):
+            try:
+                self.get_configmap(self.shard_name(index)).delete()
+            except ValueError:
+                logger.warning(f"Failed to delete configMap {self.shard_name(index)}")
 
 
 def create_all() -> None:
@@ -136,6 +334,11 @@ def create_all() -> None:
     ConfigMapManager.create_all()
 
 
+def flush_all() -> int:
+    """Apply the buffered changes of all the registered configMaps."""
+    return ConfigMapManager.flush_all()
+
+
 def delete_all() -> None:
     """Delete all the register configMaps."""
     ConfigMapManager.delete_all()
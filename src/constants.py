@@ -7,16 +7,39 @@
 OATHKEEPER_API_PORT = 4456
 OATHKEEPER_METRICS_PORT = 9000
 PEER = "oathkeeper"
+ACCESS_RULES_PEER_KEY = "access_rules"
+OATHKEEPER_CONFIG_PEER_KEY = "oathkeeper_config"
+HOOK_STATS_PEER_KEY = "hook_stats"
+CONFIGMAP_CONFIG_DELIVERY = "configmap"
+PEBBLE_CONFIG_DELIVERY = "pebble"
+# The methods of the requests protected by the access rules. The CORS preflight requests
+# and the static assets are matched by dedicated rules, skipping the session check.
+ACCESS_RULE_METHODS = ["GET", "POST", "PUT", "PATCH", "DELETE"]
+PREFLIGHT_METHODS = ["OPTIONS"]
+STATIC_ASSET_METHODS = ["GET", "HEAD"]
+# The Kratos identity traits read by the header mutator, by header
+SESSION_TRAIT_HEADERS = {"X-Email": "email", "X-Name": "name"}
+# Prints a trait of the Kratos identity, or the claim of the same name when a token
+# authenticator filled the extra context with the claims of the token
+SESSION_TRAIT_TEMPLATE = (
+    "{{{{ with .Extra.identity }}}}{{{{ print .traits.{trait} }}}}{{{{ else }}}}"
+    "{{{{ with .Extra.{trait} }}}}{{{{ print . }}}}{{{{ end }}}}{{{{ end }}}}"
+)
+# The number of hooks in a row that can fail to write the configMaps before blocking
+FLUSH_FAILURE_BUDGET = 3
 SSL_PATH = "/etc/ssl/certs/ca-certificates.crt"
 CA_CERTS_PATH = "/usr/share/ca-certificates"
 LOCAL_CA_CERTS_PATH = "/usr/local/share/ca-certificates"
 SERVER_CERT_PATH = f"{LOCAL_CA_CERTS_PATH}/server.crt"
 SERVER_KEY_PATH = f"{LOCAL_CA_CERTS_PATH}/server.key"
 SERVER_CA_CERT_PATH = f"{LOCAL_CA_CERTS_PATH}/oathkeeper-ca.crt"
+ID_TOKEN_JWKS_PATH = "/etc/oathkeeper/id_token.jwks.json"
+ID_TOKEN_JWKS_SECRET_LABEL = "id-token-jwks"
 
 # Integration constants
 GRAFANA_DASHBOARD_RELATION_NAME = "grafana-dashboard"
 LOKI_PUSH_API_RELATION_NAME = "logging"
+OATHKEEPER_INFO_RELATION_NAME = "oathkeeper-info"
 PROMETHEUS_METRICS_PATH = "/metrics/prometheus"
 PROMETHEUS_SCRAPE_RELATION_NAME = "metrics-endpoint"
 TRACING_RELATION_NAME = "tracing"
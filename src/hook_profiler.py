@@ -0,0 +1,223 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""An opt-in profiler recording what each hook costs.
+
+When enabled, every handler the charm observes is wrapped to record its wall time, the
+Kubernetes and Pebble calls it makes, the relation data it writes and whether it deferred
+its event. A summary is logged once per dispatch and added to a rolling aggregate.
+
+The observed handlers are listed through an ops internal, as ops has no public API for
+it. If it is missing, the profiler logs a warning and records the other costs. The
+relation data writes are reported by the charm.
+"""
+
+import json
+import logging
+import os
+import time
+from collections import Counter, defaultdict
+from typing import Any, Callable, Dict, Mapping, Optional
+
+from ops.charm import CharmBase
+from ops.framework import CommitEvent, EventBase, Object, PreCommitEvent, StoredState
+
+from constants import HOOK_STATS_PEER_KEY, PEER
+
+logger = logging.getLogger(__name__)
+
+KUBERNETES_VERBS = ("get", "list", "watch", "create", "replace", "patch", "apply", "delete")
+# Once a hook has been profiled this many times its aggregate is halved, so that the
+# averages follow the recent dispatches rather than the whole lifetime of the unit
+HOOK_STATS_WINDOW = 100
+
+
+def _resource_kind(resource: Any) -> str:
+    """Return the kind of a lightkube resource, given either its class or an instance."""
+    return resource.__name__ if isinstance(resource, type) else type(resource).__name__
+
+
+def _merge(aggregate: Dict, sample: Dict) -> None:
+    for key, value in sample.items():
+        if isinstance(value, dict):
+            _merge(aggregate.setdefault(key, {}), value)
+        else:
+            aggregate[key] = aggregate.get(key, 0) + value
+
+
+def _halve(aggregate: Dict) -> None:
+    for key, value in aggregate.items():
+        if isinstance(value, dict):
+            _halve(value)
+        else:
+            aggregate[key] = value / 2
+
+
+class _DispatchProfile:
+    """The costs recorded during a single dispatch."""
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.handlers: Dict[str, float] = defaultdict(float)
+        self.kubernetes_calls: Counter = Counter()
+        self.pebble_calls: Counter = Counter()
+        self.relation_data_bytes = 0
+        self.deferrals = 0
+        self.first_event: Optional[str] = None
+
+    def summary(self) -> Dict:
+        return {
+            "wall_time_ms": round((time.perf_counter() - self.started) * 1000, 3),
+            "handlers_ms": {name: round(ms, 3) for name, ms in self.handlers.items()},
+            "kubernetes_calls": dict(self.kubernetes_calls),
+            "pebble_calls": dict(self.pebble_calls),
+            "relation_data_bytes": self.relation_data_bytes,
+            "deferrals": self.deferrals,
+        }
+
+
+class HookProfiler(Object):
+    """Wraps the charm handlers and keeps a ledger of what each hook costs."""
+
+    _stored = StoredState()
+
+    def __init__(self, charm: CharmBase, enabled: bool = False) -> None:
+        super().__init__(charm, "hook-profiler")
+        self._charm = charm
+        self.enabled = enabled
+        self._stored.set_default(stats="{}")
+        self._profile = _DispatchProfile()
+
+        if not enabled:
+            return
+
+        self._instrument_handlers()
+        for container in charm.unit.containers.values():
+            self.track_pebble_client(container.pebble)
+        # Registered after the charm observers, so the configMap flush is accounted for.
+        # The stored state is saved by the commit observers, so the aggregate is updated
+        # on pre-commit to be persisted.
+        self.framework.observe(self.framework.on.pre_commit, self._on_pre_commit)
+
+    @property
+    def stats(self) -> Dict:
+        """The rolling aggregate of the hooks profiled on this unit."""
+        return json.loads(self._stored.stats)
+
+    @property
+    def hook_name(self) -> str:
+        """The name of the hook or action being dispatched."""
+        dispatch_path = os.environ.get("JUJU_DISPATCH_PATH")
+        if dispatch_path:
+            return os.path.basename(dispatch_path)
+        return self._profile.first_event or "unknown"
+
+    def _instrument_handlers(self) -> None:
+        # ops looks the handlers up by name when dispatching, so shadowing them with
+        # instance attributes is enough to wrap every observed handler
+        observers = getattr(self.framework, "_observers", None)
+        if not isinstance(observers, list):
+            logger.warning("Cannot list the observed handlers, their costs are not recorded")
+            return
+
+        handlers = {
+            method_name
+            for observer_path, method_name, _, _ in observers
+            if observer_path == self._charm.handle.path
+        }
+        for name in handlers:
+            setattr(self._charm, name, self._wrap_handler(name, getattr(self._charm, name)))
+
+    def _wrap_handler(self, name: str, handler: Callable) -> Callable:
+        def wrapper(event: EventBase) -> None:
+            if self._profile.first_event is None and not isinstance(
+                event, (PreCommitEvent, CommitEvent)
+            ):
+                self._profile.first_event = event.handle.kind.replace("_", "-")
+            start = time.perf_counter()
+            try:
+                handler(event)
+            finally:
+                self._profile.handlers[name] += (time.perf_counter() - start) * 1000
+                if event.deferred:
+                    self._profile.deferrals += 1
+
+        wrapper.__name__ = name
+        return wrapper
+
+    def track_relation_data(self, data: Mapping[str, str], writes: int = 1) -> None:
+        """Count the bytes of relation data written by the charm, `writes` times over."""
+        if not self.enabled:
+            return
+
+        self._profile.relation_data_bytes += writes * sum(
+            len(key) + len(value or "") for key, value in data.items()
+        )
+
+    def track_kubernetes_client(self, client: Any) -> Any:
+        """Count the calls made with a lightkube client, by verb and resource."""
+        if not self.enabled:
+            return client
+
+        for verb in KUBERNETES_VERBS:
+            method = getattr(client, verb, None)
+            if method is not None:
+                setattr(client, verb, self._count_kubernetes_call(verb, method))
+        return client
+
+    def _count_kubernetes_call(self, verb: str, method: Callable) -> Callable:
+        def wrapper(resource: Any, *args: Any, **kwargs: Any) -> Any:
+            self._profile.kubernetes_calls[f"{verb} {_resource_kind(resource)}"] += 1
+            return method(resource, *args, **kwargs)
+
+        return wrapper
+
+    def track_pebble_client(self, client: Any) -> None:
+        """Count the calls made with a Pebble client, by method."""
+        for name in dir(client):
+            method = getattr(client, name)
+            if name.startswith("_") or not callable(method):
+                continue
+            setattr(client, name, self._count_pebble_call(name, method))
+
+    def _count_pebble_call(self, name: str, method: Callable) -> Callable:
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            self._profile.pebble_calls[name] += 1
+            return method(*args, **kwargs)
+
+        return wrapper
+
+    def _on_pre_commit(self, event: PreCommitEvent) -> None:
+        hook_name = self.hook_name
+        summary = self._profile.summary()
+        logger.info(f"Hook stats for {hook_name}: {json.dumps(summary, sort_keys=True)}")
+
+        stats = self.stats
+        hook_stats = stats.setdefault(hook_name, {"count": 0})
+        max_wall_time_ms = max(hook_stats.pop("max_wall_time_ms", 0), summary["wall_time_ms"])
+        if hook_stats["count"] >= HOOK_STATS_WINDOW:
+            _halve(hook_stats)
+        _merge(hook_stats, dict(summary, count=1))
+        hook_stats["max_wall_time_ms"] = max_wall_time_ms
+        self._stored.stats = json.dumps(stats)
+
+        # Publishing on every hook would trigger a peer relation-changed on the other units,
+        # which would publish in turn. update-status runs periodically and is not caused by
+        # peer data changes, so the aggregate is published from there.
+        if hook_name == "update-status":
+            self.publish()
+
+    def publish(self) -> None:
+        """Publish the aggregate of this unit in the peer relation."""
+        if peers := self.model.get_relation(PEER):
+            peers.data[self.model.unit][HOOK_STATS_PEER_KEY] = self._stored.stats
+
+    def collect(self) -> Dict[str, Dict]:
+        """Return the aggregates published by every unit, with the latest one of this unit."""
+        stats = {}
+        if peers := self.model.get_relation(PEER):
+            for unit in peers.units:
+                if data := peers.data[unit].get(HOOK_STATS_PEER_KEY):
+                    stats[unit.name] = json.loads(data)
+        stats[self.model.unit.name] = self.stats
+        return stats
@@ -0,0 +1,40 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Generation of the JSON Web Key Set signing the id tokens issued by Oathkeeper."""
+
+import base64
+import json
+import uuid
+
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+RSA_KEY_SIZE = 2048
+
+
+def _b64url_uint(value: int) -> str:
+    """Encode an integer as the base64url string of its big-endian bytes, as in RFC 7518."""
+    length = max((value.bit_length() + 7) // 8, 1)
+    return base64.urlsafe_b64encode(value.to_bytes(length, "big")).rstrip(b"=").decode()
+
+
+def generate_jwks() -> str:
+    """Generate a JSON Web Key Set holding a single RS256 private signing key."""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=RSA_KEY_SIZE)
+    private_numbers = key.private_numbers()
+    public_numbers = private_numbers.public_numbers
+    jwk = {
+        "kty": "RSA",
+        "use": "sig",
+        "alg": "RS256",
+        "kid": str(uuid.uuid4()),
+        "n": _b64url_uint(public_numbers.n),
+        "e": _b64url_uint(public_numbers.e),
+        "d": _b64url_uint(private_numbers.d),
+        "p": _b64url_uint(private_numbers.p),
+        "q": _b64url_uint(private_numbers.q),
+        "dp": _b64url_uint(private_numbers.dmp1),
+        "dq": _b64url_uint(private_numbers.dmq1),
+        "qi": _b64url_uint(private_numbers.iqmp),
+    }
+    return json.dumps({"keys": [jwk]})
@@ -0,0 +1,105 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Helpers to size the Go runtime of Oathkeeper to the limits of its container.
+
+The Go runtime sizes GOMAXPROCS to the number of cores of the node and ignores the memory
+limit, which leads to CPU throttling and OOM kills in a pod with resource limits.
+"""
+
+import logging
+import math
+import re
+from typing import Dict, Optional, Tuple
+
+from ops.model import Container
+from ops.pebble import Error
+
+logger = logging.getLogger(__name__)
+
+QUANTITY_REGEX = re.compile(r"^([0-9]+(?:\.[0-9]+)?)([a-zA-Z]*)$")
+MEMORY_SUFFIXES = {
+    "": 1,
+    "k": 10**3,
+    "M": 10**6,
+    "G": 10**9,
+    "T": 10**12,
+    "Ki": 2**10,
+    "Mi": 2**20,
+    "Gi": 2**30,
+    "Ti": 2**40,
+}
+# Leave some headroom to the memory that the Go runtime does not account for
+GOMEMLIMIT_RATIO = 0.9
+
+
+def _split_quantity(quantity: str) -> Tuple[float, str]:
+    match = QUANTITY_REGEX.match(quantity.strip())
+    if not match:
+        raise ValueError(f"Invalid resource quantity: {quantity}")
+    return float(match.group(1)), match.group(2)
+
+
+def parse_cpu(quantity: str) -> float:
+    """Parse a Kubernetes CPU quantity, e.g. `500m` or `2`, into cores."""
+    value, suffix = _split_quantity(quantity)
+    if suffix == "m":
+        return value / 1000
+    if suffix:
+        raise ValueError(f"Invalid CPU quantity: {quantity}")
+    return value
+
+
+def parse_memory(quantity: str) -> int:
+    """Parse a Kubernetes memory quantity, e.g. `512Mi` or `1G`, into bytes."""
+    value, suffix = _split_quantity(quantity)
+    if suffix not in MEMORY_SUFFIXES:
+        raise ValueError(f"Invalid memory quantity: {quantity}")
+    return int(value * MEMORY_SUFFIXES[suffix])
+
+
+def _read(container: Container, path: str) -> Optional[str]:
+    try:
+        return container.pull(path).read().strip()
+    except Error:
+        return None
+
+
+def read_cgroup_cpu_limit(container: Container) -> Optional[float]:
+    """Read the CPU limit of a container from its cgroup, in cores."""
+    # cgroup v2 exposes "<quota> <period>", or "max <period>" when unlimited
+    if cpu_max := _read(container, "/sys/fs/cgroup/cpu.max"):
+        quota, _, period = cpu_max.partition(" ")
+        if quota == "max" or not period:
+            return None
+        return int(quota) / int(period)
+
+    quota = _read(container, "/sys/fs/cgroup/cpu/cpu.cfs_quota_us")
+    period = _read(container, "/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+    if not quota or not period or int(quota) <= 0:
+        return None
+    return int(quota) / int(period)
+
+
+def read_cgroup_memory_limit(container: Container) -> Optional[int]:
+    """Read the memory limit of a container from its cgroup, in bytes."""
+    memory_max = _read(container, "/sys/fs/cgroup/memory.max") or _read(
+        container, "/sys/fs/cgroup/memory/memory.limit_in_bytes"
+    )
+    if not memory_max or memory_max == "max":
+        return None
+    # cgroup v1 reports a huge number when there is no limit
+    limit = int(memory_max)
+    return limit if limit < 2**62 else None
+
+
+def go_runtime_env(cpu: Optional[float], memory: Optional[int]) -> Dict[str, str]:
+    """Return the Go runtime environment matching the resource limits."""
+    env = {}
+    if cpu:
+        # Round fractional limits down like automaxprocs, more threads than the quota
+        # would get the process throttled
+        env["GOMAXPROCS"] = str(max(math.floor(cpu), 1))
+    if memory:
+        env["GOMEMLIMIT"] = f"{int(memory * GOMEMLIMIT_RATIO) // 2**20}MiB"
+    return env
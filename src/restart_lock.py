@@ -0,0 +1,115 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""A lock held over the peer relation, to restart the units a few at a time.
+
+A unit requests the lock in its peer databag. The leader grants it to up to `batch_size`
+units at once in the application databag, and a unit releases it once it is serving again.
+"""
+
+import json
+import logging
+from typing import List
+
+from ops.charm import CharmBase, RelationEvent
+from ops.framework import EventBase, EventSource, Object, ObjectEvents
+from ops.model import Relation
+
+logger = logging.getLogger(__name__)
+
+LOCK_STATE_KEY = "restart_lock"
+LOCK_GRANTED_KEY = "restart_lock_granted"
+REQUESTED = "requested"
+RELEASED = "released"
+
+
+class RestartLockAcquiredEvent(EventBase):
+    """Event emitted when the lock requested by this unit is granted."""
+
+
+class RestartLockEvents(ObjectEvents):
+    """Events emitted by the restart lock."""
+
+    acquired = EventSource(RestartLockAcquiredEvent)
+
+
+class RestartLock(Object):
+    """Coordinates the restarts of the units over the peer relation."""
+
+    on = RestartLockEvents()
+
+    def __init__(self, charm: CharmBase, relation_name: str, batch_size: int = 1) -> None:
+        super().__init__(charm, "restart-lock")
+        self._relation_name = relation_name
+        self.batch_size = max(batch_size, 1)
+
+        self.framework.observe(charm.on[relation_name].relation_changed, self._on_peers_changed)
+        self.framework.observe(charm.on[relation_name].relation_departed, self._on_peers_changed)
+
+    @property
+    def _relation(self) -> Relation:
+        return self.model.get_relation(self._relation_name)
+
+    @property
+    def requested(self) -> bool:
+        """Whether this unit is waiting for the lock or holding it."""
+        if not (relation := self._relation):
+            return False
+        return relation.data[self.model.unit].get(LOCK_STATE_KEY) == REQUESTED
+
+    @property
+    def granted(self) -> bool:
+        """Whether this unit holds the lock."""
+        if not (relation := self._relation):
+            return False
+        return self.requested and self.model.unit.name in self._granted_units(relation)
+
+    def acquire(self) -> bool:
+        """Request the lock, returns True if this unit can restart right away.
+
+        Otherwise the `acquired` event is emitted once the leader grants the lock.
+        """
+        relation = self._relation
+        # A unit on its own has no capacity to preserve
+        if not relation or not relation.units:
+            return True
+
+        relation.data[self.model.unit][LOCK_STATE_KEY] = REQUESTED
+        if self.model.unit.is_leader():
+            self._grant(relation)
+        return self.granted
+
+    def release(self) -> None:
+        """Release the lock, or drop the request if it was not granted yet."""
+        if not (relation := self._relation) or not self.requested:
+            return
+
+        relation.data[self.model.unit][LOCK_STATE_KEY] = RELEASED
+        # The leader does not get a relation-changed event for its own changes
+        if self.model.unit.is_leader():
+            self._grant(relation)
+
+    def _granted_units(self, relation: Relation) -> List[str]:
+        return json.loads(relation.data[self.model.app].get(LOCK_GRANTED_KEY, "[]"))
+
+    def _grant(self, relation: Relation) -> None:
+        """Grant the lock to the waiting units, keeping at most `batch_size` holders."""
+        requested = sorted(
+            unit.name
+            for unit in relation.units | {self.model.unit}
+            if relation.data[unit].get(LOCK_STATE_KEY) == REQUESTED
+        )
+        holders = [unit for unit in self._granted_units(relation) if unit in requested]
+        waiting = [unit for unit in requested if unit not in holders]
+        granted = holders + waiting[: max(self.batch_size - len(holders), 0)]
+
+        if granted != self._granted_units(relation):
+            logger.info(f"Restart lock granted to {granted}")
+            relation.data[self.model.app][LOCK_GRANTED_KEY] = json.dumps(granted)
+
+    def _on_peers_changed(self, event: RelationEvent) -> None:
+        if self.model.unit.is_leader():
+            self._grant(event.relation)
+
+        if self.granted:
+            self.on.acquired.emit()
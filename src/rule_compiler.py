@@ -0,0 +1,345 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""A helper module for compiling the URL patterns of Oathkeeper access rules."""
+
+import re
+from typing import Dict, List, Optional
+
+# Endpoints made only of these characters have the same meaning as a regex and as a
+# literal string, which lets us build their complement without lookarounds
+LITERAL_ENDPOINT_REGEX = re.compile(r"^[A-Za-z0-9_~%/-]+$")
+GLOB_SPECIAL_CHARS = set("*?[]{}\\<>")
+
+REGEXP_MATCHING_STRATEGY = "regexp"
+GLOB_MATCHING_STRATEGY = "glob"
+
+
+class _PathNode:
+    """A node of the trie built from the allowed endpoints."""
+
+    def __init__(self) -> None:
+        self.children: Dict[str, "_PathNode"] = {}
+        # The path ending at this node is allowed
+        self.allowed = False
+        # Every path going through this node is allowed
+        self.allows_subtree = False
+
+
+def _build_trie(allowed_endpoints: List[str]) -> _PathNode:
+    """Build a trie of the paths allowed by the allow rules.
+
+    An allowed endpoint `e` matches `/e` and any path starting with `/e/`.
+    """
+    root = _PathNode()
+    for endpoint in allowed_endpoints:
+        node = root
+        for char in f"/{endpoint}":
+            if node.allows_subtree:
+                break
+            node = node.children.setdefault(char, _PathNode())
+        else:
+            node.allowed = True
+            node = node.children.setdefault("/", _PathNode())
+            node.allows_subtree = True
+            node.children = {}
+    return root
+
+
+def _class_chars(chars: str) -> str:
+    # The rules are written without escaping backslashes, so the characters of a class
+    # cannot be escaped. A `-` is only read as a range when it follows another character.
+    return "".join(sorted(chars, key=lambda c: c != "-"))
+
+
+def _alternatives(alternatives: List[str], glob: bool = False) -> str:
+    if len(alternatives) == 1:
+        return alternatives[0]
+    if glob:
+        return f"{{{','.join(alternatives)}}}"
+    return f"(?:{'|'.join(alternatives)})"
+
+
+class _SuffixNode:
+    """A node of the trie built from the reversed static asset suffixes."""
+
+    def __init__(self) -> None:
+        self.children: Dict[str, "_SuffixNode"] = {}
+        # Every path ending with the characters read so far is a static asset
+        self.matched = False
+        # The path made of exactly the characters read so far is a static asset
+        self.matched_whole = False
+
+
+def _build_suffix_trie(static_asset_suffixes: List[str], after_dot: bool = False) -> _SuffixNode:
+    """Build a trie of the static asset suffixes, read from the end of the path.
+
+    With `after_dot`, the path follows a dot, so a bare suffix is a static asset too.
+    """
+    root = _SuffixNode()
+    for suffix in static_asset_suffixes:
+        node = root
+        for char in reversed(suffix):
+            node = node.children.setdefault(char, _SuffixNode())
+        if after_dot:
+            node.matched_whole = True
+        node.children.setdefault(".", _SuffixNode()).matched = True
+    return root
+
+
+def _render_suffixes(node: _SuffixNode, static: bool, glob: bool = False) -> str:
+    """Render a pattern matching the paths that end (`static`) or not with a suffix below `node`.
+
+    The trie is read from the end of the path, so each alternative prepends a character
+    to the pattern of the child it descends into.
+    """
+    if static and node.matched:
+        return "**" if glob else ".*"
+
+    alternatives = []
+    if node.matched_whole == static:
+        alternatives.append("")
+    if not static:
+        chars = "".join(sorted(node.children))
+        alternatives.append(
+            f"**[!{_class_chars(chars)}]" if glob else f".*[^{_class_chars(chars)}]"
+        )
+
+    for char, child in sorted(node.children.items()):
+        if child.matched and not static:
+            continue
+        literal = "[.]" if char == "." and not glob else char
+        alternatives.append(f"{_render_suffixes(child, static, glob)}{literal}")
+
+    return _alternatives(alternatives, glob)
+
+
+def _render_complement(node: _PathNode, glob: bool = False) -> str:
+    """Render a pattern matching every path below `node` that is not allowed.
+
+    Each alternative starts with a different character or with the end of the path,
+    so they are mutually exclusive and the pattern never needs to backtrack.
+    """
+    # Every node we render has at least one child, as allowed paths always continue with `/`
+    chars = "".join(sorted(node.children))
+    alternatives = []
+    if not node.allowed:
+        alternatives.append("" if glob else "$")
+    alternatives.append(f"[!{_class_chars(chars)}]**" if glob else f"[^{_class_chars(chars)}].*")
+
+    for char, child in sorted(node.children.items()):
+        if child.allows_subtree:
+            continue
+        alternatives.append(f"{char}{_render_complement(child, glob)}")
+
+    return _alternatives(alternatives, glob)
+
+
+def _render_ends(node: _PathNode, glob: bool = False) -> Optional[str]:
+    """Render a pattern matching the paths ending below `node` that are not allowed."""
+    alternatives = []
+    if not node.allowed:
+        alternatives.append("" if glob else "$")
+
+    for char, child in sorted(node.children.items()):
+        if child.allows_subtree:
+            continue
+        pattern = _render_ends(child, glob)
+        if pattern is not None:
+            alternatives.append(f"{char}{pattern}")
+
+    return _alternatives(alternatives, glob) if alternatives else None
+
+
+def _render_diverging(node: _PathNode, glob: bool = False) -> str:
+    """Render a pattern matching a path prefix leaving the trie below `node`.
+
+    The prefix ends with the first character of the path that is neither in the trie
+    nor a dot.
+    """
+    chars = "".join(sorted(node.children)) + "."
+    alternatives = [f"[!{_class_chars(chars)}]" if glob else f"[^{_class_chars(chars)}]"]
+
+    for char, child in sorted(node.children.items()):
+        if child.allows_subtree:
+            continue
+        alternatives.append(f"{char}{_render_diverging(child, glob)}")
+
+    return _alternatives(alternatives, glob)
+
+
+def _render_prefixes(node: _PathNode, glob: bool = False) -> str:
+    """Render a pattern matching a path prefix in the trie below `node`, allowed or not."""
+    alternatives = [""]
+    for char, child in sorted(node.children.items()):
+        if child.allows_subtree:
+            continue
+        alternatives.append(f"{char}{_render_prefixes(child, glob)}")
+
+    return _alternatives(alternatives, glob)
+
+
+def _render_static_complement(
+    node: _PathNode, static_asset_suffixes: List[str], static: bool, glob: bool = False
+) -> str:
+    """Render a pattern matching the static assets (`static`) or the other paths not allowed.
+
+    The allowed endpoints contain no dot, so a path leaving the trie with any other
+    character is a static asset when the rest of the path ends with a suffix, and a path
+    leaving it with a dot is one when the rest of the path is a suffix or ends with one.
+    The split between the trie prefix and the rest of the path is unambiguous, and the
+    suffix patterns are rendered only once.
+    """
+    rest = _render_suffixes(_build_suffix_trie(static_asset_suffixes), static, glob)
+    after_dot = _render_suffixes(
+        _build_suffix_trie(static_asset_suffixes, after_dot=True), static, glob
+    )
+    alternatives = []
+    # A path ending in the trie contains no dot, so it is never a static asset
+    ends = None if static else _render_ends(node, glob)
+    if ends is not None:
+        alternatives.append(ends)
+    alternatives.append(f"{_render_diverging(node, glob)}{rest}")
+    alternatives.append(f"{_render_prefixes(node, glob)}{'.' if glob else '[.]'}{after_dot}")
+    return _alternatives(alternatives, glob)
+
+
+def _exclude_endpoints(allowed_endpoints: List[str]) -> str:
+    """Return a negative lookahead rejecting the paths covered by the allowed endpoints."""
+    exclude_endpoints = ["/" + endpoint + "((/.*$)|$)" for endpoint in allowed_endpoints]
+    return f"(?!{'|'.join(exclude_endpoints)})"
+
+
+def lookahead_deny_pattern(allowed_endpoints: List[str]) -> str:
+    """Return a deny pattern that excludes the allowed endpoints with a negative lookahead."""
+    return f"{_exclude_endpoints(allowed_endpoints)}.*"
+
+
+def compile_deny_pattern(
+    allowed_endpoints: List[str], static_asset_suffixes: Optional[List[str]] = None
+) -> str:
+    """Return the regex matching every path that is not covered by the allowed endpoints.
+
+    The pattern is meant to be wrapped in `<>` after the protected url. When all the
+    endpoints are literal paths, the complement is partitioned by prefix and contains no
+    lookaround. Otherwise we fall back to a negative lookahead. The paths ending with one
+    of the `static_asset_suffixes` are left out.
+    """
+    suffixes = static_asset_suffixes or []
+    any_path = _render_suffixes(_build_suffix_trie(suffixes), static=False) if suffixes else ".*"
+    if not allowed_endpoints:
+        return any_path
+
+    if not all(LITERAL_ENDPOINT_REGEX.match(endpoint) for endpoint in allowed_endpoints):
+        return _exclude_endpoints(allowed_endpoints) + any_path
+
+    if suffixes:
+        return _render_static_complement(_build_trie(allowed_endpoints), suffixes, static=False)
+    return _render_complement(_build_trie(allowed_endpoints))
+
+
+def compile_deny_glob(
+    allowed_endpoints: List[str], static_asset_suffixes: Optional[List[str]] = None
+) -> str:
+    """Return the glob matching every path that is not covered by the allowed endpoints.
+
+    All the endpoints must be literal paths, see `is_glob_compatible`. The paths ending
+    with one of the `static_asset_suffixes` are left out.
+    """
+    suffixes = static_asset_suffixes or []
+    if not allowed_endpoints:
+        if suffixes:
+            return _render_suffixes(_build_suffix_trie(suffixes), static=False, glob=True)
+        return "**"
+
+    if suffixes:
+        return _render_static_complement(
+            _build_trie(allowed_endpoints), suffixes, static=False, glob=True
+        )
+    return _render_complement(_build_trie(allowed_endpoints), glob=True)
+
+
+def compile_static_asset_pattern(
+    allowed_endpoints: List[str],
+    static_asset_suffixes: List[str],
+    matching_strategy: str = REGEXP_MATCHING_STRATEGY,
+) -> str:
+    """Return the pattern matching the static assets not covered by the allowed endpoints.
+
+    The endpoints must be literal paths for the glob matching strategy, otherwise the
+    regex falls back to a negative lookahead.
+    """
+    glob = matching_strategy == GLOB_MATCHING_STRATEGY
+    if not allowed_endpoints:
+        return _render_suffixes(_build_suffix_trie(static_asset_suffixes), static=True, glob=glob)
+
+    if not all(LITERAL_ENDPOINT_REGEX.match(endpoint) for endpoint in allowed_endpoints):
+        static_assets = _render_suffixes(_build_suffix_trie(static_asset_suffixes), static=True)
+        return _exclude_endpoints(allowed_endpoints) + static_assets
+
+    return _render_static_complement(
+        _build_trie(allowed_endpoints), static_asset_suffixes, static=True, glob=glob
+    )
+
+
+def is_glob_compatible(protected_urls: List[str], allowed_endpoints: List[str]) -> bool:
+    """Check whether the rules of a protected app can be expressed with glob patterns."""
+    if any(GLOB_SPECIAL_CHARS & set(url) for url in protected_urls):
+        return False
+    return all(LITERAL_ENDPOINT_REGEX.match(endpoint) for endpoint in allowed_endpoints)
+
+
+def protected_url_pattern(url: str, matching_strategy: str = REGEXP_MATCHING_STRATEGY) -> str:
+    """Return the pattern of a protected url, matching both http and https."""
+    if url.endswith("/"):
+        url = url[:-1]
+
+    if matching_strategy == GLOB_MATCHING_STRATEGY:
+        return url.replace("https", "<{https,http}>")
+    return url.replace("https", "<^(https|http)>")
+
+
+def allow_pattern(
+    url_pattern: str, endpoint: str, matching_strategy: str = REGEXP_MATCHING_STRATEGY
+) -> str:
+    """Return the pattern matching an allowed endpoint and everything below it."""
+    if matching_strategy == GLOB_MATCHING_STRATEGY:
+        return f"{url_pattern}/{endpoint}<{{,/**}}>"
+    return f"{url_pattern}/<{endpoint}((/.*$)|$)>"
+
+
+def deny_pattern(
+    url_pattern: str,
+    allowed_endpoints: List[str],
+    matching_strategy: str = REGEXP_MATCHING_STRATEGY,
+    static_asset_suffixes: Optional[List[str]] = None,
+) -> str:
+    """Return the pattern matching every endpoint except the allowed ones and static assets."""
+    if matching_strategy == GLOB_MATCHING_STRATEGY:
+        return f"{url_pattern}<{compile_deny_glob(allowed_endpoints, static_asset_suffixes)}>"
+    return f"{url_pattern}<{compile_deny_pattern(allowed_endpoints, static_asset_suffixes)}>"
+
+
+def preflight_pattern(url_pattern: str, matching_strategy: str = REGEXP_MATCHING_STRATEGY) -> str:
+    """Return the pattern matching every endpoint, for the CORS preflight requests."""
+    if matching_strategy == GLOB_MATCHING_STRATEGY:
+        return f"{url_pattern}<**>"
+    return f"{url_pattern}<.*>"
+
+
+def static_asset_pattern(
+    url_pattern: str,
+    allowed_endpoints: List[str],
+    static_asset_suffixes: List[str],
+    matching_strategy: str = REGEXP_MATCHING_STRATEGY,
+) -> str:
+    """Return the pattern matching the static assets outside of the allowed endpoints.
+
+    The static assets below the allowed endpoints are already matched by the allow rules.
+    The suffixes are alphanumeric, and the dot is matched with a character class as the
+    rules are written without escaping backslashes.
+    """
+    pattern = compile_static_asset_pattern(
+        allowed_endpoints, static_asset_suffixes, matching_strategy
+    )
+    return f"{url_pattern}<{pattern}>"
@@ -0,0 +1,172 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""An offline implementation of Oathkeeper's access rule matching.
+
+It resolves a url and method to an access rule the same way Oathkeeper's decisions API does,
+which lets us measure what a rule set costs per request without running Oathkeeper.
+"""
+
+import logging
+import re
+from typing import Dict, Iterable, List, Pattern, Tuple
+from urllib.parse import urlparse
+
+import yaml
+
+from rule_compiler import GLOB_MATCHING_STRATEGY, REGEXP_MATCHING_STRATEGY
+
+logger = logging.getLogger(__name__)
+
+# The rule files are written as flow-style YAML, use the C loader when it is available
+_YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+class RuleMatchingError(Exception):
+    """Raised when a request does not match exactly one access rule."""
+
+
+class NoMatchingRuleError(RuleMatchingError):
+    """Raised when no access rule matches the request."""
+
+
+class MultipleMatchingRulesError(RuleMatchingError):
+    """Raised when more than one access rule matches the request."""
+
+
+def _split_delimited(pattern: str) -> List[Tuple[str, bool]]:
+    """Split a pattern into (text, is_delimited) parts, following Oathkeeper's `<>` nesting."""
+    parts: List[Tuple[str, bool]] = []
+    depth, start = 0, 0
+    for i, char in enumerate(pattern):
+        if char == "<":
+            if depth == 0:
+                parts.append((pattern[start:i], False))
+                start = i + 1
+            depth += 1
+        elif char == ">":
+            depth -= 1
+            if depth < 0:
+                raise ValueError(f"Unbalanced delimiters in pattern {pattern}")
+            if depth == 0:
+                parts.append((pattern[start:i], True))
+                start = i + 1
+
+    if depth != 0:
+        raise ValueError(f"Unbalanced delimiters in pattern {pattern}")
+    parts.append((pattern[start:], False))
+    return [part for part in parts if part[0]]
+
+
+def _glob_to_regex(glob: str) -> str:
+    """Translate glob syntax to a regex, treating `.` and `/` as separators like Oathkeeper."""
+    regex, depth, i = "", 0, 0
+    while i < len(glob):
+        char = glob[i]
+        if glob.startswith("**", i):
+            regex += ".*"
+            i += 1
+        elif char == "*":
+            regex += "[^./]*"
+        elif char == "?":
+            regex += "[^./]"
+        elif char == "[":
+            end = glob.index("]", i + 1)
+            chars = glob[i + 1 : end]
+            negated = chars.startswith("!")
+            chars = re.escape(chars[1:] if negated else chars)
+            regex += f"[^{chars}]" if negated else f"[{chars}]"
+            i = end
+        elif char == "{":
+            regex += "(?:"
+            depth += 1
+        elif char == "}" and depth:
+            regex += ")"
+            depth -= 1
+        elif char == "," and depth:
+            regex += "|"
+        elif char == "\\" and i + 1 < len(glob):
+            regex += re.escape(glob[i + 1])
+            i += 1
+        else:
+            regex += re.escape(char)
+        i += 1
+    return regex
+
+
+def compile_pattern(pattern: str, matching_strategy: str = REGEXP_MATCHING_STRATEGY) -> Pattern:
+    """Compile an access rule url pattern into a Python regex.
+
+    The text outside `<>` is matched literally, the text inside is a regex or a glob
+    depending on the matching strategy, and the whole url must match.
+    """
+    regex = ""
+    for text, is_delimited in _split_delimited(pattern):
+        if not is_delimited:
+            regex += re.escape(text)
+        elif matching_strategy == GLOB_MATCHING_STRATEGY:
+            regex += _glob_to_regex(text)
+        else:
+            regex += text
+    return re.compile(f"^{regex}$")
+
+
+def load_access_rules(configmap_data: Dict[str, str]) -> List[Dict]:
+    """Load the access rules from the data of an access rules configMap."""
+    rules = []
+    for key, value in sorted(configmap_data.items()):
+        if not value:
+            continue
+        try:
+            loaded = yaml.load(value, Loader=_YamlLoader)
+        except yaml.YAMLError as e:
+            logger.error(f"Failed to load the access rules in {key}: {e}")
+            continue
+        rules.extend(loaded or [])
+    return rules
+
+
+class RuleMatcher:
+    """Resolves requests to access rules, mirroring Oathkeeper's rule matcher."""
+
+    def __init__(
+        self, rules: Iterable[Dict], matching_strategy: str = REGEXP_MATCHING_STRATEGY
+    ) -> None:
+        self.rules = list(rules)
+        self.matching_strategy = matching_strategy
+        self._compiled = [
+            (rule, compile_pattern(rule["match"]["url"], matching_strategy)) for rule in self.rules
+        ]
+        self.rules_evaluated = 0
+
+    @classmethod
+    def from_configmap(
+        cls, configmap_data: Dict[str, str], matching_strategy: str = REGEXP_MATCHING_STRATEGY
+    ) -> "RuleMatcher":
+        """Build a matcher from the data of an access rules configMap."""
+        return cls(load_access_rules(configmap_data), matching_strategy)
+
+    def match(self, url: str, method: str = "GET") -> Dict:
+        """Return the only access rule matching the request.
+
+        Like Oathkeeper, every rule whose methods include the request method is evaluated,
+        and the query string is ignored.
+        """
+        parsed = urlparse(url)
+        url = f"{parsed.scheme}://{parsed.netloc}{parsed.path}"
+
+        matches = []
+        for rule, pattern in self._compiled:
+            if method not in rule["match"]["methods"]:
+                continue
+            self.rules_evaluated += 1
+            if pattern.match(url):
+                matches.append(rule)
+
+        if not matches:
+            raise NoMatchingRuleError(f"No access rule matches {method} {url}")
+        if len(matches) > 1:
+            raise MultipleMatchingRulesError(
+                f"{method} {url} matches multiple access rules: {[r['id'] for r in matches]}"
+            )
+        return matches[0]
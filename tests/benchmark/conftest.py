@@ -0,0 +1,28 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+from typing import Generator
+
+import pytest
+from ops.testing import Harness
+from pytest_mock import MockerFixture
+
+from charm import OathkeeperCharm
+
+
+@pytest.fixture()
+def mocked_kubernetes(mocker: MockerFixture) -> None:
+    mocker.patch("charm.KubernetesServicePatch")
+    mocker.patch("charm.Client", autospec=True)
+    mocker.patch("charm.OathkeeperConfigMap", autospec=True)
+    mocker.patch("config_map.AccessRulesConfigMap", autospec=True)
+
+
+@pytest.fixture()
+def harness(mocked_kubernetes: None) -> Generator[Harness, None, None]:
+    harness = Harness(OathkeeperCharm)
+    harness.set_model_name("testing")
+    harness.set_leader(True)
+    harness.begin()
+    yield harness
+    harness.cleanup()
@@ -0,0 +1,68 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import logging
+import subprocess
+import sys
+import time
+from typing import Callable, Dict
+
+import pytest
+from ops.testing import Harness
+
+from charm import OathkeeperCharm
+
+logger = logging.getLogger(__name__)
+
+ITERATIONS = 20
+
+# Budgets are loose enough for shared CI runners, but catch eager imports or
+# constructors sneaking back into the charm startup.
+MAX_IMPORT_TIME_S = 3
+MAX_HOOK_STARTUP_MS = 100
+
+HOOKS: Dict[str, Callable[[Harness], None]] = {
+    "install": lambda harness: harness.charm.on.install.emit(),
+    "config-changed": lambda harness: harness.charm.on.config_changed.emit(),
+    "update-status": lambda harness: harness.charm.on.update_status.emit(),
+    "leader-elected": lambda harness: harness.charm.on.leader_elected.emit(),
+    "oathkeeper-pebble-ready": lambda harness: harness.charm.on.oathkeeper_pebble_ready.emit(
+        harness.charm.unit.get_container("oathkeeper")
+    ),
+}
+
+
+def test_import_time() -> None:
+    # The charm module is already imported in this process, measure it in a fresh one
+    code = "import time; start = time.perf_counter(); import charm; print(time.perf_counter() - start)"
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    import_time = float(result.stdout)
+
+    logger.info(f"Importing the charm took {import_time:.3f}s")
+    assert import_time < MAX_IMPORT_TIME_S
+
+
+@pytest.mark.parametrize("hook", HOOKS)
+def test_hook_startup_time(mocked_kubernetes: None, hook: str) -> None:
+    elapsed = 0.0
+    for _ in range(ITERATIONS):
+        start = time.perf_counter()
+        harness = Harness(OathkeeperCharm)
+        harness.set_leader(True)
+        harness.begin()
+        HOOKS[hook](harness)
+        elapsed += time.perf_counter() - start
+        harness.cleanup()
+
+    startup_ms = elapsed / ITERATIONS * 1000
+    logger.info(f"{hook}: {startup_ms:.1f}ms to build the charm and handle the event")
+    assert startup_ms < MAX_HOOK_STARTUP_MS
+
+
+def test_update_status_does_not_build_kubernetes_client(harness: Harness) -> None:
+    harness.charm.on.update_status.emit()
+
+    assert "client" not in harness.charm.__dict__
+    assert "access_rules_shards" not in harness.charm.__dict__
@@ -0,0 +1,86 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import logging
+import random
+import time
+import tracemalloc
+from typing import Dict, List
+
+import pytest
+from ops.testing import Harness
+
+from rule_compiler import GLOB_MATCHING_STRATEGY, REGEXP_MATCHING_STRATEGY
+from rule_matcher import RuleMatcher
+
+logger = logging.getLogger(__name__)
+
+ALLOWED_ENDPOINTS = ["welcome", "about/app", "static"]
+# The allow rules, the preflight rule and the deny rule
+RULES_PER_RELATION = len(ALLOWED_ENDPOINTS) + 2
+REQUESTS = 200
+
+# Budgets are per evaluated rule, so that they hold for any number of relations.
+# They are loose enough for shared CI runners, but catch rule sets that get
+# significantly more expensive to evaluate or to keep in memory.
+MAX_MATCH_LATENCY_US_PER_RULE = 10
+MAX_MEMORY_KIB_PER_RULE = 16
+
+
+def render_configmap_data(harness: Harness, relations: int, matching_strategy: str) -> Dict:
+    """Render the access rules configMap data of `relations` auth-proxy requirers."""
+    data = {}
+    for i in range(relations):
+        app_name = f"requirer-{i}"
+        for rule_type in ("allow", "deny"):
+            rules = harness.charm._render_access_rules(
+                rule_type=rule_type,
+                protected_urls=[f"https://{app_name}.example.com"],
+                allowed_endpoints=ALLOWED_ENDPOINTS,
+                relation_app_name=app_name,
+                matching_strategy=matching_strategy,
+            )
+            data[f"access-rules-{app_name}-{rule_type}.json"] = str(rules)
+    return data
+
+
+def sample_urls(relations: int, seed: int = 0) -> List[str]:
+    """Sample request urls hitting both allowed and protected endpoints."""
+    rng = random.Random(seed)
+    paths = ["", "/", "/welcome", "/welcome/x", "/about/app/y", "/about", "/dashboard/1"]
+    return [
+        f"https://requirer-{rng.randrange(relations)}.example.com{rng.choice(paths)}"
+        for _ in range(REQUESTS)
+    ]
+
+
+@pytest.mark.parametrize("matching_strategy", [REGEXP_MATCHING_STRATEGY, GLOB_MATCHING_STRATEGY])
+@pytest.mark.parametrize("relations", [10, 100, 1000])
+def test_rule_set_cost(harness: Harness, relations: int, matching_strategy: str) -> None:
+    data = render_configmap_data(harness, relations, matching_strategy)
+
+    tracemalloc.start()
+    matcher = RuleMatcher.from_configmap(data, matching_strategy)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    urls = sample_urls(relations)
+    start = time.perf_counter()
+    for url in urls:
+        matcher.match(url, "GET")
+    elapsed = time.perf_counter() - start
+
+    rules = len(matcher.rules)
+    rules_evaluated = matcher.rules_evaluated / len(urls)
+    latency_us = elapsed / len(urls) * 1e6
+    memory_kib = peak_memory / 1024
+    logger.info(
+        f"strategy={matching_strategy} relations={relations} rules={rules} "
+        f"rules_evaluated={rules_evaluated:.0f} match_latency={latency_us:.1f}us "
+        f"memory={memory_kib:.0f}KiB"
+    )
+
+    assert rules == relations * RULES_PER_RELATION
+    assert rules_evaluated <= rules
+    assert latency_us / rules_evaluated <= MAX_MATCH_LATENCY_US_PER_RULE
+    assert memory_kib / rules <= MAX_MEMORY_KIB_PER_RULE
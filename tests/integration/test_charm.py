@@ -2,8 +2,10 @@
 # Copyright 2023 Canonical Ltd.
 # See LICENSE file for licensing details.
 
+import asyncio
 import json
 import logging
+import time
 from os.path import join
 from pathlib import Path
 from typing import Dict, List, Optional
@@ -23,6 +25,10 @@ APP_NAME = METADATA["name"]
 CA_CHARM = "self-signed-certificates"
 TRAEFIK = "traefik-k8s"
 AUTH_PROXY_REQUIRER = "auth-proxy-requirer"
+# The kubelet syncs the mounted configMaps every 60-90s, pushed files must be faster than that
+MAX_TIME_TO_EFFECTIVE_RULE = 45
+TEMPO = "tempo-k8s"
+SAMPLED_REQUESTS = 200
 
 
 async def get_k8s_service_address(
@@ -113,6 +119,30 @@ async def test_forward_auth_relation(ops_test: OpsTest) -> None:
     await ops_test.model.wait_for_idle([TRAEFIK, APP_NAME], status="active", timeout=1000)
 
 
+async def test_time_to_effective_rule_with_pebble_delivery(
+    ops_test: OpsTest, lightkube_client: Client
+) -> None:
+    """Measure how long a new access rule takes to be enforced with the pebble config delivery."""
+    await ops_test.model.applications[APP_NAME].set_config({"config-delivery": "pebble"})
+    await ops_test.juju("remove-relation", APP_NAME, f"{AUTH_PROXY_REQUIRER}:auth-proxy")
+    await ops_test.model.wait_for_idle([APP_NAME, AUTH_PROXY_REQUIRER], status="active")
+
+    requirer_url = await get_reverse_proxy_app_url(
+        ops_test, TRAEFIK, AUTH_PROXY_REQUIRER, lightkube_client
+    )
+    allowed_url = join(requirer_url, "anything/allowed")
+
+    start = time.monotonic()
+    await ops_test.model.integrate(f"{AUTH_PROXY_REQUIRER}:auth-proxy", APP_NAME)
+    while requests.get(allowed_url, verify=False).status_code != 200:
+        assert time.monotonic() - start < MAX_TIME_TO_EFFECTIVE_RULE
+        await asyncio.sleep(1)
+    logger.info(f"The access rules took effect in {time.monotonic() - start:.1f}s")
+
+    await ops_test.model.applications[APP_NAME].set_config({"config-delivery": "configmap"})
+    await ops_test.model.wait_for_idle([APP_NAME, AUTH_PROXY_REQUIRER], status="active")
+
+
 @retry(
     wait=wait_exponential(multiplier=3, min=1, max=20),
     stop=stop_after_attempt(20),
@@ -169,7 +199,7 @@ async def test_forward_auth_url_response_headers(
             "id": "iap-requirer:anonymous",
             "match": {
                 "url": protected_url,
-                "methods": ["GET", "POST", "OPTION", "PUT", "PATCH", "DELETE"],
+                "methods": ["GET", "POST", "PUT", "PATCH", "DELETE"],
             },
             "authenticators": [{"handler": "anonymous"}],
             "mutators": [{"handler": "header"}],
@@ -237,6 +267,48 @@ def update_config_configmap(ops_test: OpsTest, lightkube_client: Client) -> None
     )
 
 
+@pytest.mark.parametrize("sampling_ratio", [0.0, 0.01, 1.0])
+async def test_decision_latency_with_trace_sampling(
+    ops_test: OpsTest, lightkube_client: Client, sampling_ratio: float
+) -> None:
+    """Measure the decision latency with the tracing relation at a given sampling ratio."""
+    if TEMPO not in ops_test.model.applications:
+        await ops_test.model.deploy(TEMPO, channel="latest/edge", trust=True)
+        await ops_test.model.integrate(f"{APP_NAME}:tracing", TEMPO)
+
+    await ops_test.model.applications[APP_NAME].set_config({
+        "tracing-sampling-ratio": str(sampling_ratio)
+    })
+    await ops_test.model.wait_for_idle([APP_NAME, TEMPO], status="active", timeout=1000)
+
+    requirer_url = await get_reverse_proxy_app_url(
+        ops_test, TRAEFIK, AUTH_PROXY_REQUIRER, lightkube_client
+    )
+    allowed_url = join(requirer_url, "anything/allowed")
+
+    latencies = []
+    with requests.Session() as session:
+        for _ in range(SAMPLED_REQUESTS):
+            start = time.perf_counter()
+            assert session.get(allowed_url, verify=False).status_code == 200
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    latencies.sort()
+    logger.info(
+        f"sampling_ratio={sampling_ratio} "
+        f"p50={latencies[len(latencies) // 2]:.1f}ms "
+        f"p99={latencies[int(len(latencies) * 0.99)]:.1f}ms"
+    )
+
+
+async def test_remove_tracing_integration(ops_test: OpsTest) -> None:
+    """Ensure that the tracing relation doesn't cause errors on removal."""
+    await ops_test.juju("remove-relation", APP_NAME, f"{TEMPO}:tracing")
+    await ops_test.model.applications[APP_NAME].reset_config(["tracing-sampling-ratio"])
+
+    await ops_test.model.wait_for_idle([APP_NAME], status="active")
+
+
 async def test_oathkeeper_scale_up(ops_test: OpsTest) -> None:
     """Check that oathkeeper works after it is scaled up."""
     app = ops_test.model.applications[APP_NAME]
@@ -9,6 +9,7 @@ from ops.testing import Harness
 from pytest_mock import MockerFixture
 
 from charm import OathkeeperCharm
+from config_map import ConfigMapManager
 
 
 @pytest.fixture()
@@ -33,6 +34,12 @@ def mocked_oathkeeper_is_running(mocker: MockerFixture) -> MagicMock:
     return mocker.patch("charm.OathkeeperCharm._oathkeeper_service_is_running", return_value=True)
 
 
+@pytest.fixture(autouse=True)
+def configmap_registry(mocker: MockerFixture) -> None:
+    # The configMaps register themselves at class level, don't leak them across tests
+    mocker.patch.object(ConfigMapManager, "configmaps", {})
+
+
 @pytest.fixture(autouse=True)
 def lk_client(mocker: MockerFixture) -> None:
     mock_lightkube = mocker.patch("charm.Client", autospec=True)
@@ -47,7 +54,7 @@ def mocked_oathkeeper_configmap(mocker: MockerFixture) -> MagicMock:
 
 @pytest.fixture(autouse=True)
 def mocked_access_rules_configmap(mocker: MockerFixture) -> MagicMock:
-    mock = mocker.patch("charm.AccessRulesConfigMap", autospec=True)
+    mock = mocker.patch("config_map.AccessRulesConfigMap", autospec=True)
     mock.return_value.name = "access-rules"
     return mock.return_value
 
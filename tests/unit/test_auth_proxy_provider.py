@@ -5,6 +5,7 @@ from typing import Any, Generator, List
 
 import pytest
 from charms.oathkeeper.v0.auth_proxy import (
+    AuthProxyConfig,
     AuthProxyConfigChangedEvent,
     AuthProxyConfigRemovedEvent,
     AuthProxyProvider,
@@ -88,3 +89,52 @@ def test_auth_proxy_config_removed_event_emitted_when_relation_removed(harness:
     harness.remove_relation(relation_id)
 
     assert any(isinstance(e, AuthProxyConfigRemovedEvent) for e in harness.charm.events)
+
+
+def test_get_auth_proxy_configs(harness: Harness) -> None:
+    relation_id = setup_requirer_relation(harness)
+
+    assert harness.charm.auth_proxy.get_auth_proxy_configs() == {
+        relation_id: AuthProxyConfig(
+            protected_urls=["https://example.com"],
+            headers=["X-User"],
+            allowed_endpoints=["welcome", "about/app"],
+            authenticator="cookie_session",
+            mutator="header",
+            static_asset_suffixes=[],
+        )
+    }
+
+
+def test_auth_proxy_config_changed_event_carries_authenticator(harness: Harness) -> None:
+    relation_id = setup_requirer_relation(harness)
+    harness.update_relation_data(relation_id, "requirer", {"authenticator": "jwt"})
+
+    event = harness.charm.events[-1]
+    assert isinstance(event, AuthProxyConfigChangedEvent)
+    assert event.to_auth_proxy_config().authenticator == "jwt"
+
+
+def test_auth_proxy_config_changed_event_carries_mutator(harness: Harness) -> None:
+    relation_id = setup_requirer_relation(harness)
+    harness.update_relation_data(relation_id, "requirer", {"mutator": "id_token"})
+
+    event = harness.charm.events[-1]
+    assert isinstance(event, AuthProxyConfigChangedEvent)
+    assert event.to_auth_proxy_config().mutator == "id_token"
+
+
+def test_auth_proxy_config_changed_event_carries_static_asset_suffixes(harness: Harness) -> None:
+    relation_id = setup_requirer_relation(harness)
+    harness.update_relation_data(relation_id, "requirer", {"static_asset_suffixes": '["js"]'})
+
+    event = harness.charm.events[-1]
+    assert isinstance(event, AuthProxyConfigChangedEvent)
+    assert event.to_auth_proxy_config().static_asset_suffixes == ["js"]
+
+
+def test_invalid_authenticator_ignored(harness: Harness) -> None:
+    relation_id = setup_requirer_relation(harness)
+    harness.update_relation_data(relation_id, "requirer", {"authenticator": "basic_auth"})
+
+    assert harness.charm.auth_proxy.get_auth_proxy_configs() == {}
@@ -98,6 +98,37 @@ def test_exception_raised_when_invalid_header(harness: Harness) -> None:
         harness.charm.auth_proxy.update_auth_proxy_config(auth_proxy_config=auth_proxy_config)
 
 
+def test_exception_raised_when_invalid_authenticator(harness: Harness) -> None:
+    auth_proxy_config = AuthProxyConfig(**AUTH_PROXY_CONFIG, authenticator="basic_auth")
+
+    with pytest.raises(AuthProxyConfigError, match="Unsupported authenticator"):
+        harness.charm.auth_proxy.update_auth_proxy_config(auth_proxy_config=auth_proxy_config)
+
+
+def test_exception_raised_when_invalid_mutator(harness: Harness) -> None:
+    auth_proxy_config = AuthProxyConfig(**AUTH_PROXY_CONFIG, mutator="cookie")
+
+    with pytest.raises(AuthProxyConfigError, match="Unsupported mutator"):
+        harness.charm.auth_proxy.update_auth_proxy_config(auth_proxy_config=auth_proxy_config)
+
+
+def test_exception_raised_when_invalid_static_asset_suffix(harness: Harness) -> None:
+    auth_proxy_config = AuthProxyConfig(**AUTH_PROXY_CONFIG, static_asset_suffixes=[".js"])
+
+    with pytest.raises(AuthProxyConfigError, match="Invalid static asset suffix"):
+        harness.charm.auth_proxy.update_auth_proxy_config(auth_proxy_config=auth_proxy_config)
+
+
+def test_authenticator_in_relation_bag(harness: Harness) -> None:
+    relation_id = harness.add_relation("auth-proxy", "provider")
+    auth_proxy_config = AuthProxyConfig(**AUTH_PROXY_CONFIG, authenticator="jwt")
+
+    harness.charm.auth_proxy.update_auth_proxy_config(auth_proxy_config=auth_proxy_config)
+
+    relation_data = harness.get_relation_data(relation_id, harness.model.app.name)
+    assert relation_data["authenticator"] == "jwt"
+
+
 def test_auth_proxy_relation_removed_event_emitted(harness: Harness) -> None:
     relation_id = harness.add_relation("auth-proxy", "provider")
     harness.add_relation_unit(relation_id, "provider/0")
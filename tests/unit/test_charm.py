@@ -1,26 +1,48 @@
 # Copyright 2023 Canonical Ltd.
 # See LICENSE file for licensing details.
 
+import ast
 import json
 import logging
-from typing import Optional, Tuple
-from unittest.mock import MagicMock, Mock
+from typing import Dict, List, Optional, Tuple
+from unittest.mock import MagicMock, Mock, PropertyMock
 
 import pytest
 import yaml
 from capture_events import capture_events
 from charms.oathkeeper.v0.oathkeeper_info import OathkeeperInfoRelationCreatedEvent
 from jinja2 import Template
-from ops.model import ActiveStatus, WaitingStatus
-from ops.pebble import ExecError
+from lightkube.core.exceptions import ApiError
+from ops.model import (
+    ActiveStatus,
+    BlockedStatus,
+    SecretNotFoundError,
+    StatusBase,
+    WaitingStatus,
+)
+from ops.pebble import ChangeError, CheckInfo, CheckLevel, CheckStatus, ExecError
 from ops.testing import Harness
+from pytest_mock import MockerFixture
 
 ACCESS_RULES_PATH = "/etc/config/access-rules"
 CONFIG_FILE_PATH = "/etc/config/oathkeeper/oathkeeper.yaml"
+PUSHED_ACCESS_RULES_PATH = "/etc/oathkeeper/access-rules"
+PUSHED_CONFIG_FILE_PATH = "/etc/oathkeeper/oathkeeper.yaml"
 CONTAINER_NAME = "oathkeeper"
 SERVICE_NAME = "oathkeeper"
 
 
+def saved_stored_state(harness: Harness) -> Dict:
+    """Load the charm's stored state as it was saved by the last commit."""
+    data = harness.charm._stored._data
+    return harness.framework._storage.load_snapshot(data.handle.path)
+
+
+def reload_stored_state(harness: Harness) -> None:
+    """Restore the charm's stored state from the last commit, like the next dispatch does."""
+    harness.charm._stored._data.restore(saved_stored_state(harness))
+
+
 def setup_ingress_relation(harness: Harness) -> Tuple[int, str]:
     """Set up ingress relation."""
     harness.add_network("10.0.0.1")
@@ -187,6 +209,28 @@ def test_pebble_container_cannot_connect(harness: Harness) -> None:
     harness.charm.on.oathkeeper_pebble_ready.emit(CONTAINER_NAME)
 
     assert harness.charm.unit.status == WaitingStatus("Waiting to connect to Oathkeeper container")
+    assert harness.charm._stored.needs_reconcile
+
+
+def test_postponed_events_reconciled_once(harness: Harness, mocker: MockerFixture) -> None:
+    harness.set_can_connect(CONTAINER_NAME, False)
+    handle_status = mocker.spy(harness.charm, "_handle_status_update_config")
+    setup_kratos_relation(harness)
+    harness.charm.on.oathkeeper_pebble_ready.emit(CONTAINER_NAME)
+    handle_status.reset_mock()
+
+    harness.framework.commit()
+    assert saved_stored_state(harness)["needs_reconcile"]
+
+    harness.set_can_connect(CONTAINER_NAME, True)
+    harness.framework.reemit()
+    harness.framework.commit()
+    reload_stored_state(harness)
+    harness.framework.commit()
+
+    handle_status.assert_called_once()
+    assert not saved_stored_state(harness)["needs_reconcile"]
+    assert harness.charm.unit.status == ActiveStatus()
 
 
 def test_ingress_relation_created(harness: Harness) -> None:
@@ -282,6 +326,53 @@ def test_container_config_updated_with_custom_headers(
     assert yaml.safe_load(expected_config) == yaml.safe_load(config)
 
 
+@pytest.mark.parametrize(
+    "headers,extra_from",
+    [
+        ([], '{"identity":{"id":identity.id}}'),
+        (
+            ["X-User", "X-Email"],
+            '{"identity":{"id":identity.id,"traits":{"email":identity.traits.email}}}',
+        ),
+        (
+            ["X-Name", "X-Email"],
+            '{"identity":{"id":identity.id,'
+            '"traits":{"email":identity.traits.email,"name":identity.traits.name}}}',
+        ),
+    ],
+)
+def test_session_projection(
+    harness: Harness,
+    mocked_oathkeeper_configmap: MagicMock,
+    mocker: MockerFixture,
+    headers: List[str],
+    extra_from: str,
+) -> None:
+    mocker.patch(
+        "charms.oathkeeper.v0.auth_proxy.AuthProxyProvider.get_headers", return_value=headers
+    )
+    harness.update_config({"session-projection": True})
+    harness.set_can_connect(CONTAINER_NAME, True)
+
+    harness.charm.on.oathkeeper_pebble_ready.emit(CONTAINER_NAME)
+
+    configmap = mocked_oathkeeper_configmap.update.call_args_list[-1][0][0]
+    config = yaml.safe_load(configmap["oathkeeper.yaml"])
+    assert config["authenticators"]["cookie_session"]["config"]["extra_from"] == extra_from
+
+
+def test_whole_session_kept_by_default(
+    harness: Harness, mocked_oathkeeper_configmap: MagicMock
+) -> None:
+    harness.set_can_connect(CONTAINER_NAME, True)
+
+    harness.charm.on.oathkeeper_pebble_ready.emit(CONTAINER_NAME)
+
+    configmap = mocked_oathkeeper_configmap.update.call_args_list[-1][0][0]
+    config = yaml.safe_load(configmap["oathkeeper.yaml"])
+    assert config["authenticators"]["cookie_session"]["config"]["extra_from"] == "@this"
+
+
 def test_on_pebble_ready_correct_plan(harness: Harness) -> None:
     harness.set_can_connect(CONTAINER_NAME, True)
     container = harness.model.unit.get_container(CONTAINER_NAME)
@@ -299,8 +390,14 @@ def test_on_pebble_ready_correct_plan(harness: Harness) -> None:
         "checks": {
             "alive": {
                 "override": "replace",
+                "level": "alive",
                 "http": {"url": "http://localhost:4456/health/alive"},
             },
+            "ready": {
+                "override": "replace",
+                "level": "ready",
+                "http": {"url": "http://localhost:4456/health/ready"},
+            },
         },
     }
     updated_plan = harness.get_container_pebble_plan(CONTAINER_NAME).to_dict()
@@ -317,6 +414,84 @@ def test_on_pebble_ready_statefulset_patched(harness: Harness) -> None:
     assert mocked_handle.called
 
 
+def test_config_files_not_pushed_with_configmap_delivery(
+    harness: Harness, mocked_access_rules_configmap: MagicMock
+) -> None:
+    mocked_access_rules_configmap.get.return_value = {"rules.json": "[]"}
+    harness.set_can_connect(CONTAINER_NAME, True)
+
+    harness.charm.on.oathkeeper_pebble_ready.emit(CONTAINER_NAME)
+
+    container = harness.model.unit.get_container(CONTAINER_NAME)
+    assert not container.exists(PUSHED_CONFIG_FILE_PATH)
+    assert not container.exists(PUSHED_ACCESS_RULES_PATH)
+
+
+def test_config_files_pushed_with_pebble_delivery(
+    harness: Harness, mocked_access_rules_configmap: MagicMock
+) -> None:
+    mocked_access_rules_configmap.get.return_value = {"rules.json": "[]"}
+    harness.update_config({"config-delivery": "pebble"})
+    harness.set_can_connect(CONTAINER_NAME, True)
+    container = harness.model.unit.get_container(CONTAINER_NAME)
+    container.push(f"{PUSHED_ACCESS_RULES_PATH}/stale.json", "[]", make_dirs=True)
+
+    harness.charm.on.oathkeeper_pebble_ready.emit(CONTAINER_NAME)
+
+    assert container.pull(f"{PUSHED_ACCESS_RULES_PATH}/rules.json").read() == "[]"
+    assert not container.exists(f"{PUSHED_ACCESS_RULES_PATH}/stale.json")
+    config = yaml.safe_load(container.pull(PUSHED_CONFIG_FILE_PATH).read())
+    assert config["access_rules"]["repositories"] == [
+        f"file://{PUSHED_ACCESS_RULES_PATH}/rules.json"
+    ]
+    service = harness.get_container_pebble_plan(CONTAINER_NAME).services[SERVICE_NAME]
+    assert service.command == f"oathkeeper serve -c {PUSHED_CONFIG_FILE_PATH}"
+
+
+def test_config_files_pushed_on_peer_relation_changed(
+    harness: Harness, mocked_access_rules_configmap: MagicMock
+) -> None:
+    harness.update_config({"config-delivery": "pebble"})
+    harness.set_can_connect(CONTAINER_NAME, True)
+    peer_relation_id, app_name = setup_peer_relation(harness)
+    mocked_access_rules_configmap.get.return_value = {"rules.json": "[]"}
+    harness.set_leader(False)
+
+    harness.update_relation_data(peer_relation_id, app_name, {"key": "value"})
+
+    container = harness.model.unit.get_container(CONTAINER_NAME)
+    assert container.exists(f"{PUSHED_ACCESS_RULES_PATH}/rules.json")
+    assert container.exists(PUSHED_CONFIG_FILE_PATH)
+
+
+def test_unchanged_config_files_not_pushed_again(
+    harness: Harness, mocked_access_rules_configmap: MagicMock, mocker: MockerFixture
+) -> None:
+    mocked_access_rules_configmap.get.return_value = {"rules.json": "[]"}
+    harness.update_config({"config-delivery": "pebble"})
+    harness.set_can_connect(CONTAINER_NAME, True)
+    harness.charm.on.oathkeeper_pebble_ready.emit(CONTAINER_NAME)
+    container = harness.model.unit.get_container(CONTAINER_NAME)
+    container.remove_path(f"{PUSHED_ACCESS_RULES_PATH}/rules.json")
+    push = mocker.spy(container, "push")
+
+    harness.charm.on.update_status.emit()
+    harness.charm.on.update_status.emit()
+
+    push.assert_called_once()
+    assert push.call_args[0][0] == f"{PUSHED_ACCESS_RULES_PATH}/rules.json"
+
+
+def test_service_restarted_when_config_delivery_changed(harness: Harness) -> None:
+    harness.set_can_connect(CONTAINER_NAME, True)
+    harness.charm.on.oathkeeper_pebble_ready.emit(CONTAINER_NAME)
+
+    harness.update_config({"config-delivery": "pebble"})
+
+    service = harness.get_container_pebble_plan(CONTAINER_NAME).services[SERVICE_NAME]
+    assert service.command == f"oathkeeper serve -c {PUSHED_CONFIG_FILE_PATH}"
+
+
 def test_list_rules_action(
     harness: Harness, mocked_oathkeeper_is_running: MagicMock, mocked_list_rules: MagicMock
 ) -> None:
@@ -505,7 +680,7 @@ def test_allow_access_rules_rendering(
             "id": f"{app_name}:welcome:0:allow",
             "match": {
                 "url": "<^(https|http)>://example.com/<welcome((/.*$)|$)>",
-                "methods": ["GET", "POST", "OPTION", "PUT", "PATCH", "DELETE"],
+                "methods": ["GET", "POST", "PUT", "PATCH", "DELETE"],
             },
             "authenticators": [{"handler": "noop"}],
             "mutators": [{"handler": "noop"}],
@@ -516,13 +691,21 @@ def test_allow_access_rules_rendering(
             "id": f"{app_name}:about/app:0:allow",
             "match": {
                 "url": "<^(https|http)>://example.com/<about/app((/.*$)|$)>",
-                "methods": ["GET", "POST", "OPTION", "PUT", "PATCH", "DELETE"],
+                "methods": ["GET", "POST", "PUT", "PATCH", "DELETE"],
             },
             "authenticators": [{"handler": "noop"}],
             "mutators": [{"handler": "noop"}],
             "authorizer": {"handler": "allow"},
             "errors": [{"handler": "json"}],
         },
+        {
+            "id": f"{app_name}:0:preflight",
+            "match": {"url": "<^(https|http)>://example.com<.*>", "methods": ["OPTIONS"]},
+            "authenticators": [{"handler": "noop"}],
+            "mutators": [{"handler": "noop"}],
+            "authorizer": {"handler": "allow"},
+            "errors": [{"handler": "json"}],
+        },
     ]
 
     configmap_data = mocked_access_rules_configmap.patch.call_args_list[0][1]
@@ -530,7 +713,7 @@ def test_allow_access_rules_rendering(
     assert str(expected_allow_rules) == container_allow_rules
 
 
-def test_allow_access_rules_not_rendered_when_no_allowed_endpoints_provided(
+def test_only_preflight_allowed_when_no_allowed_endpoints_provided(
     harness: Harness,
     mocked_oathkeeper_is_running: MagicMock,
     mocked_access_rules_configmap: MagicMock,
@@ -541,9 +724,11 @@ def test_allow_access_rules_not_rendered_when_no_allowed_endpoints_provided(
     _, app_name = setup_auth_proxy_relation_without_allowed_endpoints(harness)
 
     configmap_data = mocked_access_rules_configmap.patch.call_args_list[0][1]
-    container_allow_rules = configmap_data["patch"]["data"]
+    container_allow_rules = configmap_data["patch"]["data"][f"access-rules-{app_name}-allow.json"]
 
-    assert f"access-rules-{app_name}-allow.json" not in container_allow_rules
+    assert [rule["id"] for rule in ast.literal_eval(container_allow_rules)] == [
+        f"{app_name}:0:preflight"
+    ]
 
 
 def test_allow_access_rules_rendering_when_auth_proxy_config_changed(
@@ -570,27 +755,43 @@ def test_allow_access_rules_rendering_when_auth_proxy_config_changed(
             "id": f"{app_name}:welcome:0:allow",
             "match": {
                 "url": "<^(https|http)>://example.com/<welcome((/.*$)|$)>",
-                "methods": ["GET", "POST", "OPTION", "PUT", "PATCH", "DELETE"],
+                "methods": ["GET", "POST", "PUT", "PATCH", "DELETE"],
             },
             "authenticators": [{"handler": "noop"}],
             "mutators": [{"handler": "noop"}],
             "authorizer": {"handler": "allow"},
             "errors": [{"handler": "json"}],
         },
+        {
+            "id": f"{app_name}:0:preflight",
+            "match": {"url": "<^(https|http)>://example.com<.*>", "methods": ["OPTIONS"]},
+            "authenticators": [{"handler": "noop"}],
+            "mutators": [{"handler": "noop"}],
+            "authorizer": {"handler": "allow"},
+            "errors": [{"handler": "json"}],
+        },
         {
             "id": f"{app_name}:welcome:1:allow",
             "match": {
                 "url": "<^(https|http)>://other-example.com/<welcome((/.*$)|$)>",
-                "methods": ["GET", "POST", "OPTION", "PUT", "PATCH", "DELETE"],
+                "methods": ["GET", "POST", "PUT", "PATCH", "DELETE"],
             },
             "authenticators": [{"handler": "noop"}],
             "mutators": [{"handler": "noop"}],
             "authorizer": {"handler": "allow"},
             "errors": [{"handler": "json"}],
         },
+        {
+            "id": f"{app_name}:1:preflight",
+            "match": {"url": "<^(https|http)>://other-example.com<.*>", "methods": ["OPTIONS"]},
+            "authenticators": [{"handler": "noop"}],
+            "mutators": [{"handler": "noop"}],
+            "authorizer": {"handler": "allow"},
+            "errors": [{"handler": "json"}],
+        },
     ]
 
-    configmap_data = mocked_access_rules_configmap.patch.call_args_list[2][1]
+    configmap_data = mocked_access_rules_configmap.patch.call_args_list[-1][1]
     container_allow_rules = configmap_data["patch"]["data"][f"access-rules-{app_name}-allow.json"]
     assert str(expected_allow_rules) == container_allow_rules
 
@@ -609,8 +810,8 @@ def test_deny_access_rules_rendering_when_single_protected_url_provided(
         {
             "id": f"{app_name}:0:deny",
             "match": {
-                "url": "<^(https|http)>://example.com<(?!/welcome((/.*$)|$)|/about/app((/.*$)|$)).*>",
-                "methods": ["GET", "POST", "OPTION", "PUT", "PATCH", "DELETE"],
+                "url": "<^(https|http)>://example.com<(?:$|[^/].*|/(?:$|[^aw].*|a(?:$|[^b].*|b(?:$|[^o].*|o(?:$|[^u].*|u(?:$|[^t].*|t(?:$|[^/].*|/(?:$|[^a].*|a(?:$|[^p].*|p(?:$|[^p].*|p[^/].*))))))))|w(?:$|[^e].*|e(?:$|[^l].*|l(?:$|[^c].*|c(?:$|[^o].*|o(?:$|[^m].*|m(?:$|[^e].*|e[^/].*))))))))>",
+                "methods": ["GET", "POST", "PUT", "PATCH", "DELETE"],
             },
             "authenticators": [{"handler": "cookie_session"}],
             "mutators": [{"handler": "header"}],
@@ -619,7 +820,7 @@ def test_deny_access_rules_rendering_when_single_protected_url_provided(
         },
     ]
 
-    configmap_data = mocked_access_rules_configmap.patch.call_args_list[1][1]
+    configmap_data = mocked_access_rules_configmap.patch.call_args_list[0][1]
     container_deny_rules = configmap_data["patch"]["data"][f"access-rules-{app_name}-deny.json"]
     assert str(expected_deny_rules) == container_deny_rules
 
@@ -646,8 +847,8 @@ def test_deny_access_rules_rendering_when_multiple_protected_urls_provided(
         {
             "id": f"{app_name}:0:deny",
             "match": {
-                "url": "<^(https|http)>://example.com/unit-0<(?!/welcome((/.*$)|$)|/about/app((/.*$)|$)).*>",
-                "methods": ["GET", "POST", "OPTION", "PUT", "PATCH", "DELETE"],
+                "url": "<^(https|http)>://example.com/unit-0<(?:$|[^/].*|/(?:$|[^aw].*|a(?:$|[^b].*|b(?:$|[^o].*|o(?:$|[^u].*|u(?:$|[^t].*|t(?:$|[^/].*|/(?:$|[^a].*|a(?:$|[^p].*|p(?:$|[^p].*|p[^/].*))))))))|w(?:$|[^e].*|e(?:$|[^l].*|l(?:$|[^c].*|c(?:$|[^o].*|o(?:$|[^m].*|m(?:$|[^e].*|e[^/].*))))))))>",
+                "methods": ["GET", "POST", "PUT", "PATCH", "DELETE"],
             },
             "authenticators": [{"handler": "cookie_session"}],
             "mutators": [{"handler": "header"}],
@@ -657,8 +858,8 @@ def test_deny_access_rules_rendering_when_multiple_protected_urls_provided(
         {
             "id": f"{app_name}:1:deny",
             "match": {
-                "url": "<^(https|http)>://example.com/unit-1<(?!/welcome((/.*$)|$)|/about/app((/.*$)|$)).*>",
-                "methods": ["GET", "POST", "OPTION", "PUT", "PATCH", "DELETE"],
+                "url": "<^(https|http)>://example.com/unit-1<(?:$|[^/].*|/(?:$|[^aw].*|a(?:$|[^b].*|b(?:$|[^o].*|o(?:$|[^u].*|u(?:$|[^t].*|t(?:$|[^/].*|/(?:$|[^a].*|a(?:$|[^p].*|p(?:$|[^p].*|p[^/].*))))))))|w(?:$|[^e].*|e(?:$|[^l].*|l(?:$|[^c].*|c(?:$|[^o].*|o(?:$|[^m].*|m(?:$|[^e].*|e[^/].*))))))))>",
+                "methods": ["GET", "POST", "PUT", "PATCH", "DELETE"],
             },
             "authenticators": [{"handler": "cookie_session"}],
             "mutators": [{"handler": "header"}],
@@ -667,7 +868,7 @@ def test_deny_access_rules_rendering_when_multiple_protected_urls_provided(
         },
     ]
 
-    configmap_data = mocked_access_rules_configmap.patch.call_args_list[3][1]
+    configmap_data = mocked_access_rules_configmap.patch.call_args_list[-1][1]
     container_deny_rules = configmap_data["patch"]["data"][f"access-rules-{app_name}-deny.json"]
     assert str(expected_deny_rules) == container_deny_rules
 
@@ -687,7 +888,7 @@ def test_all_endpoints_protected_when_no_allowed_endpoints_provided(
             "id": f"{app_name}:0:deny",
             "match": {
                 "url": "<^(https|http)>://example.com<.*>",
-                "methods": ["GET", "POST", "OPTION", "PUT", "PATCH", "DELETE"],
+                "methods": ["GET", "POST", "PUT", "PATCH", "DELETE"],
             },
             "authenticators": [{"handler": "cookie_session"}],
             "mutators": [{"handler": "header"}],
@@ -702,6 +903,315 @@ def test_all_endpoints_protected_when_no_allowed_endpoints_provided(
     assert str(expected_deny_rules) == container_deny_rules
 
 
+@pytest.mark.parametrize(
+    "config,authenticator,error_handler",
+    [
+        ({"jwt-jwks-url": "http://hydra/.well-known/jwks.json"}, "jwt", "json"),
+        ({}, "cookie_session", "redirect"),
+    ],
+)
+def test_access_rules_rendered_with_requested_authenticator(
+    harness: Harness,
+    mocked_oathkeeper_is_running: MagicMock,
+    mocked_access_rules_configmap: MagicMock,
+    config: Dict,
+    authenticator: str,
+    error_handler: str,
+) -> None:
+    harness.set_can_connect(CONTAINER_NAME, True)
+    harness.update_config(config)
+    setup_peer_relation(harness)
+    relation_id, app_name = setup_auth_proxy_relation(harness)
+
+    harness.update_relation_data(relation_id, app_name, {"authenticator": "jwt"})
+
+    configmap_data = mocked_access_rules_configmap.patch.call_args_list[-1][1]
+    deny_rules = configmap_data["patch"]["data"][f"access-rules-{app_name}-deny.json"]
+    deny_rule = ast.literal_eval(deny_rules)[0]
+    assert deny_rule["authenticators"] == [{"handler": authenticator}]
+    assert deny_rule["errors"] == [{"handler": error_handler}]
+
+
+def test_token_authenticators_rendered_in_config(
+    harness: Harness, mocked_oathkeeper_configmap: MagicMock
+) -> None:
+    harness.set_can_connect(CONTAINER_NAME, True)
+    harness.update_config({
+        "jwt-jwks-url": "http://hydra/.well-known/jwks.json",
+        "oauth2-introspection-url": "http://hydra:4445/admin/oauth2/introspect",
+        "oauth2-introspection-cache-ttl": "30s",
+    })
+
+    harness.charm.on.oathkeeper_pebble_ready.emit(CONTAINER_NAME)
+
+    configmap = mocked_oathkeeper_configmap.update.call_args_list[-1][0][0]
+    authenticators = yaml.safe_load(configmap["oathkeeper.yaml"])["authenticators"]
+    assert authenticators["jwt"] == {
+        "enabled": True,
+        "config": {"jwks_urls": ["http://hydra/.well-known/jwks.json"], "jwks_ttl": "5m"},
+    }
+    assert authenticators["oauth2_introspection"]["config"] == {
+        "introspection_url": "http://hydra:4445/admin/oauth2/introspect",
+        "cache": {"enabled": True, "ttl": "30s", "max_cost": 100000000},
+    }
+
+
+def test_session_headers_with_token_authenticator(
+    harness: Harness,
+    mocked_oathkeeper_is_running: MagicMock,
+    mocked_oathkeeper_configmap: MagicMock,
+) -> None:
+    harness.set_can_connect(CONTAINER_NAME, True)
+    harness.update_config({"jwt-jwks-url": "http://hydra/.well-known/jwks.json"})
+    setup_peer_relation(harness)
+    relation_id, app_name = setup_auth_proxy_relation(harness)
+
+    harness.update_relation_data(
+        relation_id,
+        app_name,
+        {"authenticator": "jwt", "mutator": "id_token", "headers": '["X-Email", "X-Name"]'},
+    )
+
+    configmap = mocked_oathkeeper_configmap.update.call_args_list[-1][0][0]
+    mutators = yaml.safe_load(configmap["oathkeeper.yaml"])["mutators"]
+    # The claims of the token have no identity, the same claims are read instead
+    email = (
+        "{{ with .Extra.identity }}{{ print .traits.email }}{{ else }}"
+        "{{ with .Extra.email }}{{ print . }}{{ end }}{{ end }}"
+    )
+    assert mutators["header"]["config"]["headers"]["X-Email"] == email
+    assert json.loads(mutators["id_token"]["config"]["claims"])["email"] == email
+    assert "{{ with .Extra.identity }}" in mutators["header"]["config"]["headers"]["X-Name"]
+
+
+def test_static_asset_rules_rendered_with_glob_strategy(
+    harness: Harness,
+    mocked_oathkeeper_is_running: MagicMock,
+    mocked_access_rules_configmap: MagicMock,
+    mocked_oathkeeper_configmap: MagicMock,
+) -> None:
+    harness.set_can_connect(CONTAINER_NAME, True)
+    harness.update_config({"access-rules-matching-strategy": "glob"})
+    setup_peer_relation(harness)
+    relation_id, app_name = setup_auth_proxy_relation(harness)
+
+    harness.update_relation_data(relation_id, app_name, {"static_asset_suffixes": '["js"]'})
+
+    configmap_data = mocked_access_rules_configmap.patch.call_args_list[-1][1]
+    allow_rules = configmap_data["patch"]["data"][f"access-rules-{app_name}-allow.json"]
+    deny_rules = configmap_data["patch"]["data"][f"access-rules-{app_name}-deny.json"]
+    static_rule = ast.literal_eval(allow_rules)[-1]
+    deny_rule = ast.literal_eval(deny_rules)[0]
+    assert static_rule["id"] == f"{app_name}:0:static"
+    assert static_rule["match"]["url"].startswith("<{https,http}>://example.com<")
+    assert static_rule["match"]["methods"] == ["GET", "HEAD"]
+    assert static_rule["authenticators"] == [{"handler": "noop"}]
+    assert deny_rule["match"]["url"].startswith("<{https,http}>://example.com<")
+
+    config = mocked_oathkeeper_configmap.update.call_args_list[-1][0][0]["oathkeeper.yaml"]
+    assert yaml.safe_load(config)["access_rules"]["matching_strategy"] == "glob"
+
+
+def test_glob_access_rules_rendering(
+    harness: Harness,
+    mocked_oathkeeper_is_running: MagicMock,
+    mocked_access_rules_configmap: MagicMock,
+    mocked_oathkeeper_configmap: MagicMock,
+) -> None:
+    harness.set_can_connect(CONTAINER_NAME, True)
+    harness.update_config({"access-rules-matching-strategy": "glob"})
+    setup_peer_relation(harness)
+
+    _, app_name = setup_auth_proxy_relation(harness)
+
+    configmap_data = mocked_access_rules_configmap.patch.call_args_list[0][1]
+    allow_rules = configmap_data["patch"]["data"][f"access-rules-{app_name}-allow.json"]
+    deny_rules = configmap_data["patch"]["data"][f"access-rules-{app_name}-deny.json"]
+    assert (
+        ast.literal_eval(allow_rules)[0]["match"]["url"]
+        == "<{https,http}>://example.com/welcome<{,/**}>"
+    )
+    assert ast.literal_eval(deny_rules)[0]["match"]["url"].startswith(
+        "<{https,http}>://example.com<{,[!/]**,/{"
+    )
+
+    config = mocked_oathkeeper_configmap.update.call_args_list[-1][0][0]["oathkeeper.yaml"]
+    assert yaml.safe_load(config)["access_rules"]["matching_strategy"] == "glob"
+
+
+def test_glob_matching_strategy_falls_back_to_regexp_for_regex_endpoints(
+    harness: Harness,
+    mocked_oathkeeper_is_running: MagicMock,
+    mocked_access_rules_configmap: MagicMock,
+    mocked_oathkeeper_configmap: MagicMock,
+) -> None:
+    harness.set_can_connect(CONTAINER_NAME, True)
+    harness.update_config({"access-rules-matching-strategy": "glob"})
+    setup_peer_relation(harness)
+    relation_id, app_name = setup_auth_proxy_relation(harness)
+
+    harness.update_relation_data(
+        relation_id, app_name, {"allowed_endpoints": '["static/.*\\\\.js"]'}
+    )
+
+    configmap_data = mocked_access_rules_configmap.patch.call_args_list[-1][1]
+    deny_rules = configmap_data["patch"]["data"][f"access-rules-{app_name}-deny.json"]
+    assert ast.literal_eval(deny_rules)[0]["match"]["url"].startswith(
+        "<^(https|http)>://example.com<"
+    )
+
+    config = mocked_oathkeeper_configmap.update.call_args_list[-1][0][0]["oathkeeper.yaml"]
+    assert yaml.safe_load(config)["access_rules"]["matching_strategy"] == "regexp"
+
+
+def test_glob_matching_strategy_falls_back_to_regexp_with_oathkeeper_info_relation(
+    harness: Harness,
+    mocked_oathkeeper_is_running: MagicMock,
+    mocked_oathkeeper_configmap: MagicMock,
+) -> None:
+    harness.set_can_connect(CONTAINER_NAME, True)
+    harness.update_config({"access-rules-matching-strategy": "glob"})
+    setup_peer_relation(harness)
+    setup_auth_proxy_relation(harness)
+
+    setup_oathkeeper_info_relation(harness)
+
+    config = mocked_oathkeeper_configmap.update.call_args_list[-1][0][0]["oathkeeper.yaml"]
+    assert yaml.safe_load(config)["access_rules"]["matching_strategy"] == "regexp"
+
+
+def test_access_rules_rerendered_when_matching_strategy_changed(
+    harness: Harness,
+    mocked_oathkeeper_is_running: MagicMock,
+    mocked_access_rules_configmap: MagicMock,
+    mocked_oathkeeper_configmap: MagicMock,
+) -> None:
+    harness.set_can_connect(CONTAINER_NAME, True)
+    setup_peer_relation(harness)
+    _, app_name = setup_auth_proxy_relation(harness)
+    mocked_access_rules_configmap.patch.reset_mock()
+
+    harness.update_config({"access-rules-matching-strategy": "glob"})
+
+    configmap_data = mocked_access_rules_configmap.patch.call_args_list[-1][1]
+    deny_rules = configmap_data["patch"]["data"][f"access-rules-{app_name}-deny.json"]
+    assert ast.literal_eval(deny_rules)[0]["match"]["url"].startswith("<{https,http}>")
+
+    config = mocked_oathkeeper_configmap.update.call_args_list[-1][0][0]["oathkeeper.yaml"]
+    assert yaml.safe_load(config)["access_rules"]["matching_strategy"] == "glob"
+
+
+def test_statefulset_mounts_all_access_rules_shards(
+    harness: Harness, lk_client: MagicMock
+) -> None:
+    harness.charm.access_rules_shards.resize(2)
+    harness.set_can_connect(CONTAINER_NAME, True)
+    harness.charm.on.oathkeeper_pebble_ready.emit(CONTAINER_NAME)
+
+    patch = lk_client.patch.call_args[1]["obj"]
+    volumes = patch["spec"]["template"]["spec"]["volumes"]
+    volume = next(v for v in volumes if v["name"] == "access-rules")
+    assert volume["configMap"] is None
+    assert [s["configMap"]["name"] for s in volume["projected"]["sources"]] == [
+        "access-rules",
+        "access-rules-1",
+    ]
+
+
+def test_statefulset_patched_with_resource_limits(harness: Harness, lk_client: MagicMock) -> None:
+    harness.update_config({"cpu": "1500m", "memory": "1Gi"})
+
+    patch = lk_client.patch.call_args[1]["obj"]
+    container = patch["spec"]["template"]["spec"]["containers"][0]
+    assert container["resources"] == {
+        "limits": {"cpu": "1500m", "memory": "1Gi"},
+        "requests": {"cpu": "1500m", "memory": "1Gi"},
+    }
+
+    lk_client.patch.reset_mock()
+    harness.update_config({"cpu": "1500m", "memory": "1Gi"})
+    lk_client.patch.assert_not_called()
+
+
+def test_go_runtime_sized_to_the_resource_limits(harness: Harness) -> None:
+    harness.update_config({"cpu": "1500m", "memory": "1Gi"})
+    harness.set_can_connect(CONTAINER_NAME, True)
+    harness.charm.on.oathkeeper_pebble_ready.emit(CONTAINER_NAME)
+
+    environment = harness.get_container_pebble_plan(CONTAINER_NAME).to_dict()["services"][
+        SERVICE_NAME
+    ]["environment"]
+    assert environment["GOMAXPROCS"] == "1"
+    assert environment["GOMEMLIMIT"] == "921MiB"
+
+
+def test_invalid_resource_limits_ignored(harness: Harness, lk_client: MagicMock) -> None:
+    harness.update_config({"cpu": "2 cores", "memory": "1Gi"})
+
+    container = lk_client.patch.call_args[1]["obj"]["spec"]["template"]["spec"]["containers"][0]
+    assert container["resources"]["limits"] == {"memory": "1Gi"}
+
+
+def test_access_rules_moved_when_shards_changed(
+    harness: Harness,
+    mocked_oathkeeper_is_running: MagicMock,
+    mocked_access_rules_configmap: MagicMock,
+    lk_client: MagicMock,
+    mocker: MockerFixture,
+) -> None:
+    harness.set_can_connect(CONTAINER_NAME, True)
+    peer_relation_id, _ = setup_peer_relation(harness)
+    relation_id, _ = setup_auth_proxy_relation(harness)
+    mocked_access_rules_configmap.patch.reset_mock()
+    shards = {}
+
+    def new_shard(client: MagicMock, charm: MagicMock, name: str) -> MagicMock:
+        shards[name] = MagicMock()
+        shards[name].name = name
+        return shards[name]
+
+    mocker.patch("config_map.AccessRulesConfigMap", side_effect=new_shard)
+
+    harness.update_config({"access-rules-shards": 3})
+
+    assert lk_client.patch.called
+    shards["access-rules-2"].patch.assert_called_once()
+    moved = shards["access-rules-2"].patch.call_args[1]["patch"]["data"]
+    assert set(moved) == {"access-rules-requirer-allow.json", "access-rules-requirer-deny.json"}
+    mocked_access_rules_configmap.patch.assert_called_once_with(
+        patch={"data": dict.fromkeys(moved)}, cm_name="access-rules"
+    )
+    peer_data = harness.get_relation_data(peer_relation_id, harness.charm.app)
+    assert json.loads(peer_data[f"auth_proxy_{relation_id}"])["configmap"] == "access-rules-2"
+    assert json.loads(peer_data["access_rules"])["shards"] == 3
+
+
+def test_postponed_auth_proxy_relations_reconciled_in_single_patch(
+    harness: Harness,
+    mocked_access_rules_configmap: MagicMock,
+    mocked_update_forward_auth: MagicMock,
+    mocker: MockerFixture,
+) -> None:
+    mocked_is_running = mocker.patch(
+        "charm.OathkeeperCharm._oathkeeper_service_is_running",
+        new_callable=PropertyMock,
+        return_value=False,
+    )
+    harness.set_can_connect(CONTAINER_NAME, True)
+    setup_peer_relation(harness)
+    for i in range(20):
+        setup_auth_proxy_relation(harness, app_name=f"requirer-{i}")
+    mocked_access_rules_configmap.patch.assert_not_called()
+
+    mocked_is_running.return_value = True
+    harness.framework.commit()
+
+    mocked_access_rules_configmap.patch.assert_called_once()
+    data = mocked_access_rules_configmap.patch.call_args[1]["patch"]["data"]
+    assert len(data) == 40
+    mocked_update_forward_auth.assert_called_once()
+
+
 def test_peer_data_set_on_auth_proxy_config_changed(
     harness: Harness,
     mocked_oathkeeper_is_running: MagicMock,
@@ -712,10 +1222,14 @@ def test_peer_data_set_on_auth_proxy_config_changed(
     relation_id, _ = setup_auth_proxy_relation(harness)
     auth_proxy_peer_id = f"auth_proxy_{relation_id}"
 
-    peer_data = '{"access_rules_filenames": ["access-rules-requirer-allow.json", "access-rules-requirer-deny.json"]}'
-    assert harness.get_relation_data(peer_relation_id, harness.charm.app) == {
-        auth_proxy_peer_id: peer_data
-    }
+    peer_data = json.loads(
+        harness.get_relation_data(peer_relation_id, harness.charm.app)[auth_proxy_peer_id]
+    )
+    assert peer_data["access_rules_filenames"] == [
+        "access-rules-requirer-allow.json",
+        "access-rules-requirer-deny.json",
+    ]
+    assert peer_data["fingerprint"]
 
 
 def test_no_peer_relation_on_auth_proxy_config_removed(
@@ -741,10 +1255,12 @@ def test_peer_data_pop_on_auth_proxy_config_removed(
 
     harness.remove_relation(relation_id)
 
-    assert harness.get_relation_data(peer_relation_id, harness.charm.app) == {}
+    assert f"auth_proxy_{relation_id}" not in harness.get_relation_data(
+        peer_relation_id, harness.charm.app
+    )
 
 
-def test_access_rules_pop_from_configmap_on_auth_proxy_config_removed(
+def test_access_rules_removed_from_configmap_on_auth_proxy_config_removed(
     harness: Harness,
     mocked_oathkeeper_is_running: MagicMock,
     mocked_access_rules_configmap: MagicMock,
@@ -752,12 +1268,19 @@ def test_access_rules_pop_from_configmap_on_auth_proxy_config_removed(
     harness.set_can_connect(CONTAINER_NAME, True)
     setup_peer_relation(harness)
     relation_id, _ = setup_auth_proxy_relation(harness)
-    harness.charm.access_rules_configmap.pop = mocked_handle = Mock(return_value=None)
+    mocked_access_rules_configmap.patch.reset_mock()
 
     harness.remove_relation(relation_id)
 
-    configmap_keys = mocked_access_rules_configmap.pop.call_args_list[0][1]["keys"]
-    mocked_handle.assert_called_with(keys=configmap_keys)
+    mocked_access_rules_configmap.patch.assert_called_once_with(
+        patch={
+            "data": {
+                "access-rules-requirer-allow.json": None,
+                "access-rules-requirer-deny.json": None,
+            }
+        },
+        cm_name="access-rules",
+    )
 
 
 def test_peer_data_when_multiple_auth_proxy_relations(
@@ -773,13 +1296,149 @@ def test_peer_data_when_multiple_auth_proxy_relations(
     other_requirer_relation_id, _ = setup_auth_proxy_relation(harness, app_name="other-requirer")
     other_requirer_auth_proxy_peer_id = f"auth_proxy_{other_requirer_relation_id}"
 
-    requirer_peer_data = '{"access_rules_filenames": ["access-rules-requirer-allow.json", "access-rules-requirer-deny.json"]}'
-    other_requirer_peer_data = '{"access_rules_filenames": ["access-rules-other-requirer-allow.json", "access-rules-other-requirer-deny.json"]}'
+    peer_data = harness.get_relation_data(peer_relation_id, harness.charm.app)
+    requirer_peer_data = json.loads(peer_data[requirer_auth_proxy_peer_id])
+    other_requirer_peer_data = json.loads(peer_data[other_requirer_auth_proxy_peer_id])
 
-    assert harness.get_relation_data(peer_relation_id, harness.charm.app) == {
-        requirer_auth_proxy_peer_id: requirer_peer_data,
-        other_requirer_auth_proxy_peer_id: other_requirer_peer_data,
-    }
+    assert requirer_peer_data["access_rules_filenames"] == [
+        "access-rules-requirer-allow.json",
+        "access-rules-requirer-deny.json",
+    ]
+    assert other_requirer_peer_data["access_rules_filenames"] == [
+        "access-rules-other-requirer-allow.json",
+        "access-rules-other-requirer-deny.json",
+    ]
+
+
+def test_access_rules_not_patched_when_auth_proxy_config_unchanged(
+    harness: Harness,
+    mocked_oathkeeper_is_running: MagicMock,
+    mocked_access_rules_configmap: MagicMock,
+    mocked_oathkeeper_configmap: MagicMock,
+    mocked_update_forward_auth: MagicMock,
+) -> None:
+    harness.set_can_connect(CONTAINER_NAME, True)
+    setup_peer_relation(harness)
+    relation_id, app_name = setup_auth_proxy_relation(harness)
+    mocked_access_rules_configmap.patch.reset_mock()
+    mocked_oathkeeper_configmap.update.reset_mock()
+    mocked_update_forward_auth.reset_mock()
+
+    harness.charm.auth_proxy.on.proxy_config_changed.emit(
+        ["https://example.com"], ["X-User"], ["welcome", "about/app"], relation_id, app_name
+    )
+
+    mocked_access_rules_configmap.patch.assert_not_called()
+    mocked_oathkeeper_configmap.update.assert_not_called()
+    mocked_update_forward_auth.assert_not_called()
+
+
+def test_access_rules_patched_when_auth_proxy_config_changed(
+    harness: Harness,
+    mocked_oathkeeper_is_running: MagicMock,
+    mocked_access_rules_configmap: MagicMock,
+    mocked_update_forward_auth: MagicMock,
+) -> None:
+    harness.set_can_connect(CONTAINER_NAME, True)
+    setup_peer_relation(harness)
+    relation_id, app_name = setup_auth_proxy_relation(harness)
+    mocked_access_rules_configmap.patch.reset_mock()
+    mocked_update_forward_auth.reset_mock()
+
+    harness.update_relation_data(relation_id, app_name, {"allowed_endpoints": '["welcome"]'})
+
+    assert mocked_access_rules_configmap.patch.called
+    mocked_update_forward_auth.assert_called_once()
+
+
+def test_configmaps_flushed_on_commit(harness: Harness, mocker: MockerFixture) -> None:
+    mocked_flush = mocker.patch("config_map.flush_all")
+
+    harness.framework.commit()
+
+    mocked_flush.assert_called_once()
+
+
+def test_failed_flush_reverts_peer_data(harness: Harness, mocker: MockerFixture) -> None:
+    peer_relation_id, app_name = setup_peer_relation(harness)
+    harness.update_relation_data(
+        peer_relation_id, app_name, {"oathkeeper_config": json.dumps({"fingerprint": "old"})}
+    )
+    mocker.patch("config_map.flush_all", side_effect=ApiError(response=MagicMock()))
+
+    harness.charm._update_config()
+    harness.framework.commit()
+
+    peer_data = harness.get_relation_data(peer_relation_id, app_name)
+    assert json.loads(peer_data["oathkeeper_config"]) == {"fingerprint": "old"}
+    assert harness.charm._stored.pending_reconcile
+
+
+def test_failed_flush_saved_for_next_hook(harness: Harness, mocker: MockerFixture) -> None:
+    mocker.patch("config_map.flush_all", side_effect=ApiError(response=MagicMock()))
+    mocker.patch("charm.OathkeeperCharm._update_config")
+
+    harness.framework.commit()
+
+    saved = saved_stored_state(harness)
+    assert saved["pending_reconcile"]
+    assert saved["failed_flushes"] == 1
+
+
+def test_failed_flush_retried_on_next_hook(harness: Harness, mocker: MockerFixture) -> None:
+    setup_peer_relation(harness)
+    mocked_flush = mocker.patch("config_map.flush_all", side_effect=ApiError(response=MagicMock()))
+    mocked_update_config = mocker.patch("charm.OathkeeperCharm._update_config")
+    harness.framework.commit()
+    mocked_update_config.assert_not_called()
+
+    mocked_flush.side_effect = None
+    reload_stored_state(harness)
+    harness.framework.commit()
+
+    mocked_update_config.assert_called_once()
+    assert mocked_flush.call_count == 2
+    saved = saved_stored_state(harness)
+    assert not saved["pending_reconcile"]
+    assert saved["failed_flushes"] == 0
+
+
+def test_blocked_when_flush_failure_budget_exhausted(
+    harness: Harness, mocker: MockerFixture
+) -> None:
+    mocker.patch("config_map.flush_all", side_effect=ApiError(response=MagicMock()))
+    mocker.patch("charm.OathkeeperCharm._update_config")
+
+    for _ in range(3):
+        harness.framework.commit()
+        reload_stored_state(harness)
+
+    assert saved_stored_state(harness)["failed_flushes"] == 3
+    assert harness.model.unit.status == BlockedStatus(
+        "Failed to write the configMaps, see the logs"
+    )
+
+
+@pytest.mark.parametrize(
+    "ready,status",
+    [(True, ActiveStatus()), (False, WaitingStatus("Waiting for Oathkeeper to be ready"))],
+)
+def test_unblocked_when_flush_succeeds_again(
+    harness: Harness, mocker: MockerFixture, ready: bool, status: StatusBase
+) -> None:
+    mocked_flush = mocker.patch("config_map.flush_all", side_effect=ApiError(response=MagicMock()))
+    mocker.patch("charm.OathkeeperCharm._update_config")
+    mocker.patch("charm.OathkeeperCharm._is_ready", return_value=ready)
+    for _ in range(3):
+        harness.framework.commit()
+        reload_stored_state(harness)
+
+    mocked_flush.side_effect = None
+    harness.charm.on.update_status.emit()
+    harness.framework.commit()
+
+    assert saved_stored_state(harness)["failed_flushes"] == 0
+    assert harness.model.unit.status == status
 
 
 def test_forward_auth_relation_removed(harness: Harness, caplog: pytest.LogCaptureFixture) -> None:
@@ -848,6 +1507,89 @@ def test_oathkeeper_info_updated_on_relation_ready(harness: Harness) -> None:
         public_endpoint="http://oathkeeper.testing.svc.cluster.local:4456",
         rules_configmap_name="access-rules",
         configmaps_namespace="testing",
+        jwks_endpoint=None,
+    )
+
+
+def test_id_token_mutator(
+    harness: Harness,
+    mocked_oathkeeper_is_running: MagicMock,
+    mocked_access_rules_configmap: MagicMock,
+    mocked_oathkeeper_configmap: MagicMock,
+) -> None:
+    harness.set_can_connect(CONTAINER_NAME, True)
+    setup_peer_relation(harness)
+    info_relation_id = setup_oathkeeper_info_relation(harness)
+    relation_id, app_name = setup_auth_proxy_relation(harness)
+
+    harness.update_relation_data(
+        relation_id, app_name, {"mutator": "id_token", "headers": '["X-User", "X-Email"]'}
+    )
+
+    configmap_data = mocked_access_rules_configmap.patch.call_args_list[-1][1]
+    deny_rules = configmap_data["patch"]["data"][f"access-rules-{app_name}-deny.json"]
+    assert ast.literal_eval(deny_rules)[0]["mutators"] == [{"handler": "id_token"}]
+
+    configmap = mocked_oathkeeper_configmap.update.call_args_list[-1][0][0]
+    id_token = yaml.safe_load(configmap["oathkeeper.yaml"])["mutators"]["id_token"]
+    assert id_token["config"] == {
+        "issuer_url": "http://oathkeeper.testing.svc.cluster.local:4456",
+        "jwks_url": "file:///etc/oathkeeper/id_token.jwks.json",
+        "claims": json.dumps({
+            "email": "{{ with .Extra.identity }}{{ print .traits.email }}{{ else }}"
+            "{{ with .Extra.email }}{{ print . }}{{ end }}{{ end }}"
+        }),
+    }
+
+    secret = harness.model.get_secret(label="id-token-jwks")
+    container = harness.model.unit.get_container(CONTAINER_NAME)
+    pushed_jwks = container.pull("/etc/oathkeeper/id_token.jwks.json").read()
+    assert pushed_jwks == secret.get_content()["jwks"]
+
+    info = harness.get_relation_data(info_relation_id, harness.charm.app)
+    assert (
+        info["jwks_endpoint"]
+        == "http://oathkeeper.testing.svc.cluster.local:4456/.well-known/jwks.json"
+    )
+
+
+def test_id_token_mutator_disabled_by_default(
+    harness: Harness, mocked_oathkeeper_configmap: MagicMock
+) -> None:
+    harness.set_can_connect(CONTAINER_NAME, True)
+    setup_auth_proxy_relation(harness)
+
+    harness.charm.on.oathkeeper_pebble_ready.emit(CONTAINER_NAME)
+
+    configmap = mocked_oathkeeper_configmap.update.call_args_list[-1][0][0]
+    assert "id_token" not in yaml.safe_load(configmap["oathkeeper.yaml"])["mutators"]
+    with pytest.raises(SecretNotFoundError):
+        harness.model.get_secret(label="id-token-jwks")
+
+
+def test_oathkeeper_info_not_rewritten_on_update_status(harness: Harness) -> None:
+    harness.set_can_connect(CONTAINER_NAME, True)
+    relation_id = setup_oathkeeper_info_relation(harness)
+    assert harness.charm.info_provider.writes == 1
+
+    harness.charm.on.update_status.emit()
+    harness.charm.on.update_status.emit()
+
+    assert harness.charm.info_provider.writes == 1
+    assert harness.get_relation_data(relation_id, "oathkeeper")["rules_configmap_name"] == (
+        "access-rules"
+    )
+
+
+def test_oathkeeper_info_rewritten_when_changed(harness: Harness) -> None:
+    harness.set_can_connect(CONTAINER_NAME, True)
+    relation_id = setup_oathkeeper_info_relation(harness)
+
+    setup_ingress_relation(harness)
+
+    assert harness.charm.info_provider.writes == 2
+    assert harness.get_relation_data(relation_id, "oathkeeper")["public_endpoint"] == (
+        "http://ingress/testing-oathkeeper"
     )
 
 
@@ -892,6 +1634,21 @@ def test_layer_updated_with_tracing_endpoint_info(harness: Harness, mocked_traci
     assert pebble_env["TRACING_PROVIDER"] == "otel"
 
 
+@pytest.mark.parametrize("ratio,expected", [(0.01, 0.01), (0.0, 0.0), (2.0, 1.0), (-1.0, 0.0)])
+def test_tracing_sampling_ratio(
+    harness: Harness, mocked_tracing_ready: MagicMock, ratio: float, expected: float
+) -> None:
+    harness.update_config({"tracing-sampling-ratio": ratio})
+    harness.set_can_connect(CONTAINER_NAME, True)
+    setup_tempo_relation(harness)
+    harness.charm.on.oathkeeper_pebble_ready.emit(CONTAINER_NAME)
+
+    pebble_env = harness.get_container_pebble_plan(CONTAINER_NAME).to_dict()["services"][
+        SERVICE_NAME
+    ]["environment"]
+    assert pebble_env["TRACING_PROVIDERS_OTLP_SAMPLING_SAMPLING_RATIO"] == expected
+
+
 def test_on_pebble_ready_with_loki_integration(harness: Harness) -> None:
     harness.set_can_connect(CONTAINER_NAME, True)
     container = harness.model.unit.get_container(CONTAINER_NAME)
@@ -899,3 +1656,151 @@ def test_on_pebble_ready_with_loki_integration(harness: Harness) -> None:
     setup_loki_relation(harness)
 
     assert harness.model.unit.status == ActiveStatus()
+
+
+def test_service_not_restarted_on_kratos_relation_changed(
+    harness: Harness, mocker: MockerFixture
+) -> None:
+    harness.set_can_connect(CONTAINER_NAME, True)
+    harness.charm.on.oathkeeper_pebble_ready.emit(CONTAINER_NAME)
+    replan = mocker.spy(harness.model.unit.get_container(CONTAINER_NAME), "replan")
+
+    setup_kratos_relation(harness)
+
+    replan.assert_not_called()
+    assert harness.charm._oathkeeper_service_is_running
+    assert harness.model.unit.status == ActiveStatus()
+
+
+def test_service_restarted_when_environment_changed(
+    harness: Harness, mocker: MockerFixture
+) -> None:
+    harness.set_can_connect(CONTAINER_NAME, True)
+    harness.charm.on.oathkeeper_pebble_ready.emit(CONTAINER_NAME)
+    replan = mocker.spy(harness.model.unit.get_container(CONTAINER_NAME), "replan")
+    mocker.patch("charm.OathkeeperCharm._tracing_ready", return_value=True)
+    mocker.patch("charm.OathkeeperCharm._get_tracing_endpoint_info", return_value="tempo:4318")
+
+    assert harness.charm._restart_required
+    harness.charm.on.config_changed.emit()
+
+    replan.assert_called_once()
+    assert not harness.charm._restart_required
+
+
+def test_layer_changes(harness: Harness, mocker: MockerFixture) -> None:
+    harness.set_can_connect(CONTAINER_NAME, True)
+    assert harness.charm._layer_changes() == [
+        "services.oathkeeper",
+        "checks.alive",
+        "checks.ready",
+    ]
+
+    harness.charm.on.oathkeeper_pebble_ready.emit(CONTAINER_NAME)
+    assert harness.charm._layer_changes() == []
+
+    mocker.patch(
+        "charm.OathkeeperCharm._config_file_path",
+        new_callable=PropertyMock,
+        return_value=PUSHED_CONFIG_FILE_PATH,
+    )
+    assert harness.charm._layer_changes() == ["services.oathkeeper.command"]
+
+
+def test_identical_layer_not_replanned(harness: Harness, mocker: MockerFixture) -> None:
+    harness.set_can_connect(CONTAINER_NAME, True)
+    harness.charm.on.oathkeeper_pebble_ready.emit(CONTAINER_NAME)
+    container = harness.model.unit.get_container(CONTAINER_NAME)
+    add_layer = mocker.spy(container, "add_layer")
+    replan = mocker.spy(container, "replan")
+
+    harness.charm._restart_service()
+
+    add_layer.assert_not_called()
+    replan.assert_not_called()
+
+
+def test_pebble_layer_has_ready_check(harness: Harness) -> None:
+    harness.set_can_connect(CONTAINER_NAME, True)
+    harness.charm.on.oathkeeper_pebble_ready.emit(CONTAINER_NAME)
+
+    checks = harness.get_container_pebble_plan(CONTAINER_NAME).to_dict()["checks"]
+    assert checks["ready"]["level"] == "ready"
+    assert checks["ready"]["http"] == {"url": "http://localhost:4456/health/ready"}
+    assert harness.model.unit.status == ActiveStatus()
+
+
+def test_waiting_status_when_not_ready(harness: Harness, mocker: MockerFixture) -> None:
+    harness.set_can_connect(CONTAINER_NAME, True)
+    is_ready = mocker.patch("charm.OathkeeperCharm._is_ready", return_value=False)
+    wait_for_ready = mocker.spy(harness.charm, "_wait_for_ready")
+
+    harness.charm.on.oathkeeper_pebble_ready.emit(CONTAINER_NAME)
+
+    assert harness.model.unit.status == WaitingStatus("Waiting for Oathkeeper to be ready")
+    wait_for_ready.assert_not_called()
+
+    is_ready.return_value = True
+    harness.charm.on.update_status.emit()
+
+    assert harness.model.unit.status == ActiveStatus()
+
+
+def test_failed_replan_blocks_without_waiting(harness: Harness, mocker: MockerFixture) -> None:
+    harness.set_can_connect(CONTAINER_NAME, True)
+    container = harness.model.unit.get_container(CONTAINER_NAME)
+    mocker.patch.object(container, "replan", side_effect=ChangeError("error", MagicMock()))
+    wait_for_ready = mocker.spy(harness.charm, "_wait_for_ready")
+
+    harness.charm.on.oathkeeper_pebble_ready.emit(CONTAINER_NAME)
+
+    assert harness.model.unit.status == BlockedStatus(
+        "Failed to restart the container, please consult the logs"
+    )
+    wait_for_ready.assert_not_called()
+
+
+@pytest.mark.parametrize("successes,ready", [(None, True), (3, False), (4, True)])
+def test_ready_requires_a_check_success_after_the_restart(
+    harness: Harness, mocker: MockerFixture, successes: Optional[int], ready: bool
+) -> None:
+    harness.set_can_connect(CONTAINER_NAME, True)
+    harness.charm.on.oathkeeper_pebble_ready.emit(CONTAINER_NAME)
+    container = harness.model.unit.get_container(CONTAINER_NAME)
+    check = CheckInfo("ready", CheckLevel.READY, CheckStatus.UP, successes=successes)
+    mocker.patch.object(container, "get_checks", return_value={"ready": check})
+
+    assert harness.charm._is_ready(since={"ready": 3}) == ready
+
+
+def test_fresh_start_requires_a_check_success_before_active(
+    harness: Harness, mocker: MockerFixture
+) -> None:
+    harness.set_can_connect(CONTAINER_NAME, True)
+    container = harness.model.unit.get_container(CONTAINER_NAME)
+    check = CheckInfo("ready", CheckLevel.READY, CheckStatus.UP, successes=0)
+    mocker.patch.object(container, "get_checks", return_value={"ready": check})
+
+    harness.charm.on.oathkeeper_pebble_ready.emit(CONTAINER_NAME)
+
+    assert harness.model.unit.status == WaitingStatus("Waiting for Oathkeeper to be ready")
+
+    harness.charm.on.update_status.emit()
+
+    assert harness.model.unit.status == WaitingStatus("Waiting for Oathkeeper to be ready")
+
+    check.successes = 1
+    harness.charm.on.update_status.emit()
+
+    assert harness.model.unit.status == ActiveStatus()
+    assert not harness.charm._stored.ready_since
+
+
+def test_wait_for_ready_times_out(harness: Harness, mocker: MockerFixture) -> None:
+    harness.set_can_connect(CONTAINER_NAME, True)
+    harness.charm.on.oathkeeper_pebble_ready.emit(CONTAINER_NAME)
+    mocker.patch("charm.time.sleep")
+    container = harness.model.unit.get_container(CONTAINER_NAME)
+    container.stop(SERVICE_NAME)
+
+    assert harness.charm._wait_for_ready(timeout=0.01) is False
@@ -1,15 +1,33 @@
 # Copyright 2023 Canonical Ltd.
 # See LICENSE file for licensing details.
 
+from typing import Dict, Optional
 from unittest.mock import MagicMock
 
 import pytest
 from httpx import Response
 from lightkube import ApiError
+from lightkube.models.meta_v1 import ObjectMeta
+from lightkube.resources.core_v1 import ConfigMap
+from lightkube.types import PatchType
 from pytest_mock import MockerFixture
 
 from charm import OathkeeperCharm
-from config_map import AccessRulesConfigMap, ConfigMapBase, ConfigMapManager, OathkeeperConfigMap
+from config_map import (
+    AccessRulesConfigMap,
+    AccessRulesShards,
+    ConfigMapBase,
+    ConfigMapManager,
+    OathkeeperConfigMap,
+)
+
+
+def configmap(data: Optional[Dict[str, str]], resource_version: str = "1") -> ConfigMap:
+    return ConfigMap(data=data, metadata=ObjectMeta(resourceVersion=resource_version))
+
+
+def version_test(resource_version: str = "1") -> Dict:
+    return {"op": "test", "path": "/metadata/resourceVersion", "value": resource_version}
 
 
 @pytest.fixture
@@ -43,50 +61,48 @@ def test_delete_all(lk_client: MagicMock, mocker: MockerFixture, mocked_charm: M
 def test_config_map_create(
     lk_client: MagicMock, cls: ConfigMapBase, mocked_charm: MagicMock
 ) -> None:
-    resp = Response(status_code=403, json={"message": "Forbidden", "code": 403})
-    lk_client.get.side_effect = ApiError(response=resp)
     cm = cls(lk_client, mocked_charm)
 
     cm.create()
 
-    assert lk_client.create.call_args[0][0].metadata.name == cm.name
-
-
-@pytest.mark.parametrize("cls", (OathkeeperConfigMap, AccessRulesConfigMap))
-def test_create_map_already_exists(
-    lk_client: MagicMock, cls: ConfigMapBase, mocked_charm: MagicMock
-) -> None:
-    cm = cls(lk_client, mocked_charm)
-
-    cm.create()
-
-    assert lk_client.get.called
-    assert not lk_client.create.called
+    assert lk_client.apply.call_args[0][0].metadata.name == cm.name
+    assert lk_client.apply.call_args[0][0].data is None
+    assert lk_client.apply.call_args[1]["force"]
+    assert not lk_client.get.called
 
 
 @pytest.mark.parametrize("cls", (OathkeeperConfigMap, AccessRulesConfigMap))
 def test_config_map_update(
     lk_client: MagicMock, cls: ConfigMapBase, mocked_charm: MagicMock
 ) -> None:
-    data = {"a": 1}
+    data = {"a": "1"}
     cm = cls(lk_client, mocked_charm)
 
     cm.update(data)
+    assert not lk_client.apply.called
+    cm.flush()
 
-    assert lk_client.replace.call_args[0][0].data == data
+    assert lk_client.apply.call_args[0][0].data == data
+    assert not lk_client.get.called
+    assert not lk_client.replace.called
 
 
 @pytest.mark.parametrize("cls", (OathkeeperConfigMap, AccessRulesConfigMap))
 def test_config_map_patch(
     lk_client: MagicMock, cls: ConfigMapBase, mocked_charm: MagicMock
 ) -> None:
-    patch = {"data": {"a": 1}}
+    lk_client.get.return_value = configmap({"b": "2"})
     cm = cls(lk_client, mocked_charm)
 
-    cm.patch(patch, "cm-name")
+    cm.patch({"data": {"a/b": "1"}}, "cm-name")
+    assert not lk_client.patch.called
+    cm.flush()
 
-    assert lk_client.patch.called
-    assert lk_client.patch.call_args[1]["obj"] == patch
+    assert lk_client.patch.call_args[1]["patch_type"] == PatchType.JSON
+    assert lk_client.patch.call_args[1]["obj"] == [
+        version_test(),
+        {"op": "add", "path": "/data/a~1b", "value": "1"},
+    ]
 
 
 @pytest.mark.parametrize("cls", (OathkeeperConfigMap, AccessRulesConfigMap))
@@ -95,26 +111,118 @@ def test_config_map_pop(
     cls: ConfigMapBase,
     mocked_charm: MagicMock,
 ) -> None:
+    lk_client.get.return_value = configmap({"some-key": "1"})
     cm = cls(lk_client, mocked_charm)
 
-    cm.pop(keys=["some-key"])
+    cm.pop(keys=["some-key", "missing-key"])
+    cm.flush()
 
-    assert lk_client.replace.called
+    assert lk_client.patch.call_args[1]["obj"] == [
+        version_test(),
+        {"op": "remove", "path": "/data/some-key"},
+    ]
+    assert not lk_client.replace.called
 
 
-@pytest.mark.parametrize("cls", (OathkeeperConfigMap, AccessRulesConfigMap))
-def test_update_map_error(
-    lk_client: MagicMock, cls: ConfigMapBase, mocked_charm: MagicMock
-) -> None:
-    data = {"data": 1}
-    resp = Response(status_code=403, json={"message": "Forbidden", "code": 403})
+def test_config_map_patch_without_data(lk_client: MagicMock, mocked_charm: MagicMock) -> None:
+    lk_client.get.return_value = configmap(None)
+    cm = AccessRulesConfigMap(lk_client, mocked_charm)
+
+    cm.patch({"data": {"a": "1", "b": None}}, cm.name)
+    cm.flush()
+
+    assert lk_client.patch.call_args[1]["obj"] == [
+        version_test(),
+        {"op": "add", "path": "/data", "value": {"a": "1"}},
+    ]
+
+
+def test_config_map_pop_without_data(lk_client: MagicMock, mocked_charm: MagicMock) -> None:
+    lk_client.get.return_value = MagicMock(data=None)
+    cm = AccessRulesConfigMap(lk_client, mocked_charm)
+
+    cm.pop(keys=["a"])
+
+    assert cm.flush() == (2, 1)
+    assert not lk_client.patch.called
+
+
+def test_patch_map_error(lk_client: MagicMock, mocked_charm: MagicMock) -> None:
+    resp = Response(status_code=404, json={"message": "Not Found", "code": 404})
     lk_client.get.side_effect = ApiError(response=resp)
-    cm = cls(lk_client, mocked_charm)
+    cm = AccessRulesConfigMap(lk_client, mocked_charm)
 
-    cm.update(data)
+    cm.patch({"data": {"a": "1"}}, cm.name)
+    cm.flush()
+
+    assert not lk_client.patch.called
+
+
+def test_config_map_changes_merged_in_single_call(
+    lk_client: MagicMock, mocked_charm: MagicMock
+) -> None:
+    lk_client.get.return_value = configmap({"a": "0", "c": "0"})
+    cm = AccessRulesConfigMap(lk_client, mocked_charm)
+
+    cm.patch({"data": {"a": "1"}}, cm.name)
+    cm.patch({"data": {"b": "2"}}, cm.name)
+    cm.pop(keys=["a", "c"])
+    requested, made = cm.flush()
+
+    lk_client.patch.assert_called_once()
+    assert lk_client.patch.call_args[1]["obj"] == [
+        version_test(),
+        {"op": "remove", "path": "/data/a"},
+        {"op": "add", "path": "/data/b", "value": "2"},
+        {"op": "remove", "path": "/data/c"},
+    ]
+    assert (requested, made) == (4, 2)
+
+
+def test_config_map_changes_applied_to_update(
+    lk_client: MagicMock, mocked_charm: MagicMock
+) -> None:
+    cm = OathkeeperConfigMap(lk_client, mocked_charm)
+
+    cm.update({"a": "1", "b": "2"})
+    cm.patch({"data": {"c": "3"}}, cm.name)
+    cm.pop(keys=["a"])
+    cm.flush()
+
+    assert not lk_client.patch.called
+    lk_client.apply.assert_called_once()
+    assert lk_client.apply.call_args[0][0].data == {"b": "2", "c": "3"}
+
+
+def test_config_map_get_includes_buffered_changes(
+    lk_client: MagicMock, mocked_charm: MagicMock
+) -> None:
+    lk_client.get.return_value = MagicMock(data={"a": "1", "b": "2"})
+    cm = AccessRulesConfigMap(lk_client, mocked_charm)
+
+    cm.patch({"data": {"c": "3"}}, cm.name)
+    cm.pop(keys=["a"])
+
+    assert cm.get() == {"b": "2", "c": "3"}
+
+
+def test_config_map_flush_without_changes(lk_client: MagicMock, mocked_charm: MagicMock) -> None:
+    cm = AccessRulesConfigMap(lk_client, mocked_charm)
+
+    assert cm.flush() == (0, 0)
+    assert not lk_client.patch.called
+    assert not lk_client.apply.called
 
-    assert lk_client.get.called
-    assert not lk_client.replace.called
+
+def test_flush_all(lk_client: MagicMock, mocker: MockerFixture, mocked_charm: MagicMock) -> None:
+    mocker.patch.object(ConfigMapManager, "configmaps", {})
+    OathkeeperConfigMap(lk_client, mocked_charm).update({"a": "1"})
+    cm = AccessRulesConfigMap(lk_client, mocked_charm)
+    cm.patch({"data": {"a": "1"}}, cm.name)
+    cm.patch({"data": {"b": "2"}}, cm.name)
+
+    # An apply, a read and a patch instead of a read, a replace and two patches
+    assert ConfigMapManager.flush_all() == 1
 
 
 @pytest.mark.parametrize("cls", (OathkeeperConfigMap, AccessRulesConfigMap))
@@ -161,3 +269,125 @@ def test_delete_map_error(
 
     with pytest.raises(ValueError):
         cm.delete()
+
+
+@pytest.fixture
+def access_rules_shards(
+    lk_client: MagicMock, mocker: MockerFixture, mocked_charm: MagicMock
+) -> AccessRulesShards:
+    mocker.patch("config_map.AccessRulesConfigMap", AccessRulesConfigMap)
+    return AccessRulesShards(lk_client, mocked_charm, shards=3)
+
+
+def test_access_rules_shard_names(access_rules_shards: AccessRulesShards) -> None:
+    assert access_rules_shards.names == ["access-rules", "access-rules-1", "access-rules-2"]
+
+
+def test_access_rules_shard_is_stable(access_rules_shards: AccessRulesShards) -> None:
+    shard = access_rules_shards.shard("requirer")
+
+    assert shard in access_rules_shards.configmaps
+    assert access_rules_shards.shard("requirer") is shard
+
+
+def test_access_rules_shards_get_merges_data(
+    access_rules_shards: AccessRulesShards, lk_client: MagicMock
+) -> None:
+    lk_client.get.side_effect = [
+        MagicMock(data={"a.json": "a"}),
+        MagicMock(data=None),
+        MagicMock(data={"b.json": "b"}),
+    ]
+
+    assert access_rules_shards.get() == {"a.json": "a", "b.json": "b"}
+
+
+def test_access_rules_shards_prune(
+    access_rules_shards: AccessRulesShards, lk_client: MagicMock
+) -> None:
+    access_rules_shards.prune(previous_shards=5)
+
+    deleted = [c[0][1] for c in lk_client.delete.call_args_list]
+    assert deleted == ["access-rules-3", "access-rules-4"]
+
+
+def test_config_map_read_once_per_dispatch(lk_client: MagicMock, mocked_charm: MagicMock) -> None:
+    lk_client.get.return_value = MagicMock(data={"a": "1"})
+    cm = AccessRulesConfigMap(lk_client, mocked_charm)
+
+    cm.get()
+    cm.get()
+    cm.pop(keys=["a"])
+    cm.flush()
+
+    lk_client.get.assert_called_once()
+
+
+def test_config_map_read_after_write(lk_client: MagicMock, mocked_charm: MagicMock) -> None:
+    lk_client.apply.return_value = MagicMock(data={"a": "1"})
+    cm = AccessRulesConfigMap(lk_client, mocked_charm)
+
+    cm.update({"a": "1"})
+    cm.flush()
+
+    assert cm.get() == {"a": "1"}
+    assert not lk_client.get.called
+
+
+def test_config_map_resource_version(lk_client: MagicMock, mocked_charm: MagicMock) -> None:
+    lk_client.get.return_value = MagicMock(metadata=MagicMock(resourceVersion="42"))
+    cm = AccessRulesConfigMap(lk_client, mocked_charm)
+
+    assert cm.resource_version is None
+    cm.get()
+
+    assert cm.resource_version == "42"
+
+
+def test_config_map_patch_conflict_invalidates_snapshot(
+    lk_client: MagicMock, mocked_charm: MagicMock
+) -> None:
+    resp = Response(status_code=422, json={"message": "Invalid", "code": 422})
+    lk_client.get.side_effect = [configmap({"a": "1"}), configmap({"b": "2"}, "2")]
+    lk_client.patch.side_effect = [ApiError(response=resp), configmap({"b": "2", "c": "3"}, "3")]
+    cm = AccessRulesConfigMap(lk_client, mocked_charm)
+    cm.get()
+
+    cm.pop(keys=["a"])
+    cm.patch({"data": {"c": "3"}}, cm.name)
+    requested, made = cm.flush()
+
+    assert lk_client.get.call_count == 2
+    assert lk_client.patch.call_args_list[0][1]["obj"][0] == version_test("1")
+    assert lk_client.patch.call_args[1]["obj"] == [
+        version_test("2"),
+        {"op": "add", "path": "/data/c", "value": "3"},
+    ]
+    assert made == 3
+
+
+def test_config_map_patch_without_resource_version(
+    lk_client: MagicMock, mocked_charm: MagicMock
+) -> None:
+    lk_client.get.return_value = ConfigMap(data={})
+    cm = AccessRulesConfigMap(lk_client, mocked_charm)
+
+    cm.patch({"data": {"a": "1"}}, cm.name)
+    cm.flush()
+
+    assert lk_client.patch.call_args[1]["obj"] == [{"op": "add", "path": "/data/a", "value": "1"}]
+
+
+def test_config_map_patch_conflict_raised_after_retry(
+    lk_client: MagicMock, mocked_charm: MagicMock
+) -> None:
+    resp = Response(status_code=409, json={"message": "Conflict", "code": 409})
+    lk_client.get.return_value = MagicMock(data={})
+    lk_client.patch.side_effect = ApiError(response=resp)
+    cm = AccessRulesConfigMap(lk_client, mocked_charm)
+
+    cm.patch({"data": {"a": "1"}}, cm.name)
+    with pytest.raises(ApiError):
+        cm.flush()
+
+    assert lk_client.patch.call_count == 2
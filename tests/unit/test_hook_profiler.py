@@ -0,0 +1,152 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import json
+from typing import Generator
+from unittest.mock import MagicMock
+
+import pytest
+from lightkube.resources.core_v1 import ConfigMap
+from ops.testing import Harness
+from pytest_mock import MockerFixture
+
+from charm import OathkeeperCharm
+from hook_profiler import HOOK_STATS_WINDOW
+
+CONTAINER_NAME = "oathkeeper"
+
+
+@pytest.fixture()
+def profiled_harness(
+    mocked_kubernetes_service_patcher: MagicMock,
+) -> Generator[Harness, None, None]:
+    harness = Harness(OathkeeperCharm)
+    harness.set_model_name("testing")
+    harness.set_leader(True)
+    harness.update_config({"profile-hooks": True})
+    harness.begin()
+    yield harness
+    harness.cleanup()
+
+
+def test_profiler_disabled_by_default(harness: Harness) -> None:
+    harness.charm.on.update_status.emit()
+    harness.framework.commit()
+
+    assert not harness.charm._profiler.enabled
+    assert harness.charm._profiler.stats == {}
+
+
+def test_profiler_records_handler_costs(profiled_harness: Harness) -> None:
+    profiled_harness.set_can_connect(CONTAINER_NAME, True)
+    peer_relation_id = profiled_harness.add_relation("oathkeeper", "oathkeeper")
+
+    profiled_harness.charm.on.config_changed.emit()
+    profiled_harness.charm.client.get(ConfigMap, "access-rules")
+    profiled_harness.charm._set_peer_data("key", {"value": 1})
+    profiled_harness.framework.commit()
+
+    stats = profiled_harness.charm._profiler.stats["config-changed"]
+    assert stats["count"] == 1
+    assert set(stats["handlers_ms"]) == {"_on_config_changed", "_on_pre_commit"}
+    assert stats["kubernetes_calls"] == {"get ConfigMap": 1}
+    assert stats["pebble_calls"]["get_plan"] == 1
+    assert stats["relation_data_bytes"] >= len("key") + len(json.dumps({"value": 1}))
+    assert stats["deferrals"] == 0
+    assert "hook_stats" not in profiled_harness.get_relation_data(peer_relation_id, "oathkeeper/0")
+
+
+def test_profiler_counts_deferrals(profiled_harness: Harness, mocker: MockerFixture) -> None:
+    mocker.patch(
+        "charm.OathkeeperCharm._handle_status_update_config",
+        side_effect=lambda event: event.defer(),
+    )
+
+    profiled_harness.charm.on.oathkeeper_pebble_ready.emit(
+        profiled_harness.charm.unit.get_container(CONTAINER_NAME)
+    )
+    profiled_harness.framework.commit()
+
+    assert profiled_harness.charm._profiler.stats["oathkeeper-pebble-ready"]["deferrals"] == 1
+
+
+def test_profiler_aggregate_is_saved(profiled_harness: Harness) -> None:
+    profiler = profiled_harness.charm._profiler
+    stored = profiler._stored._data
+
+    for _ in range(2):
+        profiled_harness.charm.on.update_status.emit()
+        profiled_harness.framework.commit()
+        # Start the next dispatch from the saved state
+        stored.restore(profiled_harness.framework._storage.load_snapshot(stored.handle.path))
+
+    assert json.loads(stored["stats"])["update-status"]["count"] == 2
+
+
+def test_profiler_without_ops_internals(
+    profiled_harness: Harness, mocker: MockerFixture, caplog: pytest.LogCaptureFixture
+) -> None:
+    profiler = profiled_harness.charm._profiler
+    mocker.patch.object(profiled_harness.framework, "_observers", None)
+
+    profiler._instrument_handlers()
+
+    assert "Cannot list the observed handlers" in caplog.text
+
+
+def test_profiler_records_oathkeeper_info_writes(profiled_harness: Harness) -> None:
+    relation_ids = [
+        profiled_harness.add_relation("oathkeeper-info", app) for app in ("requirer", "other")
+    ]
+    for relation_id in relation_ids:
+        profiled_harness.update_relation_data(relation_id, "oathkeeper", {"public_endpoint": ""})
+    profiler = profiled_harness.charm._profiler
+    profiler._profile.relation_data_bytes = 0
+
+    profiled_harness.charm._update_oathkeeper_info_relation_data(None)
+
+    databag = profiled_harness.get_relation_data(relation_ids[0], "oathkeeper")
+    size = sum(len(key) + len(value) for key, value in databag.items())
+    assert profiler._profile.relation_data_bytes == 2 * size
+
+
+def test_profiler_aggregate_is_rolling(profiled_harness: Harness) -> None:
+    profiler = profiled_harness.charm._profiler
+    profiler._stored.stats = json.dumps({
+        "update-status": {"count": HOOK_STATS_WINDOW, "deferrals": 10, "max_wall_time_ms": 1e6}
+    })
+
+    profiled_harness.charm.on.update_status.emit()
+    profiled_harness.framework.commit()
+
+    stats = profiler.stats["update-status"]
+    assert stats["count"] == HOOK_STATS_WINDOW / 2 + 1
+    assert stats["deferrals"] == 5
+    assert stats["max_wall_time_ms"] == 1e6
+
+
+def test_profiler_publishes_on_update_status(profiled_harness: Harness) -> None:
+    peer_relation_id = profiled_harness.add_relation("oathkeeper", "oathkeeper")
+
+    profiled_harness.charm.on.update_status.emit()
+    profiled_harness.framework.commit()
+
+    published = profiled_harness.get_relation_data(peer_relation_id, "oathkeeper/0")
+    assert json.loads(published["hook_stats"])["update-status"]["count"] == 1
+
+
+def test_hook_stats_action(profiled_harness: Harness) -> None:
+    peer_relation_id = profiled_harness.add_relation("oathkeeper", "oathkeeper")
+    profiled_harness.add_relation_unit(peer_relation_id, "oathkeeper/1")
+    profiled_harness.update_relation_data(
+        peer_relation_id,
+        "oathkeeper/1",
+        {"hook_stats": json.dumps({"install": {"count": 1}})},
+    )
+    profiled_harness.framework.commit()
+
+    output = profiled_harness.run_action("hook-stats")
+
+    stats = json.loads(output.results["stats"])
+    assert stats["oathkeeper/1"] == {"install": {"count": 1}}
+    assert stats["oathkeeper/0"]["oathkeeper-relation-changed"]["count"] == 1
@@ -0,0 +1,28 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import base64
+import json
+
+from jwks import generate_jwks
+
+
+def decode_uint(value: str) -> int:
+    return int.from_bytes(base64.urlsafe_b64decode(value + "=" * (-len(value) % 4)), "big")
+
+
+def test_generate_jwks() -> None:
+    jwks = json.loads(generate_jwks())
+
+    [key] = jwks["keys"]
+    assert (key["kty"], key["use"], key["alg"]) == ("RSA", "sig", "RS256")
+    assert decode_uint(key["e"]) == 65537
+    assert decode_uint(key["p"]) * decode_uint(key["q"]) == decode_uint(key["n"])
+    assert decode_uint(key["n"]).bit_length() == 2048
+
+
+def test_generated_keys_differ() -> None:
+    first, second = (json.loads(generate_jwks())["keys"][0] for _ in range(2))
+
+    assert first["kid"] != second["kid"]
+    assert first["n"] != second["n"]
@@ -0,0 +1,104 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+from typing import Dict, Optional
+
+import pytest
+from ops.testing import Harness
+
+from resource_limits import (
+    go_runtime_env,
+    parse_cpu,
+    parse_memory,
+    read_cgroup_cpu_limit,
+    read_cgroup_memory_limit,
+)
+
+CONTAINER_NAME = "oathkeeper"
+
+
+@pytest.mark.parametrize("quantity,cores", [("500m", 0.5), ("2", 2), ("1.5", 1.5)])
+def test_parse_cpu(quantity: str, cores: float) -> None:
+    assert parse_cpu(quantity) == cores
+
+
+@pytest.mark.parametrize(
+    "quantity,size", [("512Mi", 512 * 2**20), ("1Gi", 2**30), ("1G", 10**9), ("1024", 1024)]
+)
+def test_parse_memory(quantity: str, size: int) -> None:
+    assert parse_memory(quantity) == size
+
+
+@pytest.mark.parametrize("quantity", ["", "2 cores", "1Gi"])
+def test_parse_invalid_cpu(quantity: str) -> None:
+    with pytest.raises(ValueError):
+        parse_cpu(quantity)
+
+
+@pytest.mark.parametrize("quantity", ["", "1GB", "-1Gi"])
+def test_parse_invalid_memory(quantity: str) -> None:
+    with pytest.raises(ValueError):
+        parse_memory(quantity)
+
+
+@pytest.mark.parametrize(
+    "files,cpu,memory",
+    [
+        ({}, None, None),
+        (
+            {"cpu.max": "250000 100000", "memory.max": str(512 * 2**20)},
+            2.5,
+            512 * 2**20,
+        ),
+        ({"cpu.max": "max 100000", "memory.max": "max"}, None, None),
+        (
+            {
+                "cpu/cpu.cfs_quota_us": "50000",
+                "cpu/cpu.cfs_period_us": "100000",
+                "memory/memory.limit_in_bytes": str(2**30),
+            },
+            0.5,
+            2**30,
+        ),
+        (
+            {
+                "cpu/cpu.cfs_quota_us": "-1",
+                "cpu/cpu.cfs_period_us": "100000",
+                "memory/memory.limit_in_bytes": str(2**63 - 4096),
+            },
+            None,
+            None,
+        ),
+    ],
+)
+def test_read_cgroup_limits(
+    harness: Harness, files: Dict[str, str], cpu: Optional[float], memory: Optional[int]
+) -> None:
+    harness.set_can_connect(CONTAINER_NAME, True)
+    container = harness.model.unit.get_container(CONTAINER_NAME)
+    for path, content in files.items():
+        container.push(f"/sys/fs/cgroup/{path}", content, make_dirs=True)
+
+    assert read_cgroup_cpu_limit(container) == cpu
+    assert read_cgroup_memory_limit(container) == memory
+
+
+def test_go_runtime_env() -> None:
+    assert go_runtime_env(0.5, 512 * 2**20) == {"GOMAXPROCS": "1", "GOMEMLIMIT": "460MiB"}
+    assert go_runtime_env(1.5, None) == {"GOMAXPROCS": "1"}
+    assert go_runtime_env(2.9, None) == {"GOMAXPROCS": "2"}
+    assert go_runtime_env(None, None) == {}
+
+
+def test_go_runtime_env_from_cgroup(harness: Harness) -> None:
+    harness.set_can_connect(CONTAINER_NAME, True)
+    container = harness.model.unit.get_container(CONTAINER_NAME)
+    container.push("/sys/fs/cgroup/cpu.max", "300000 100000", make_dirs=True)
+
+    harness.charm.on.oathkeeper_pebble_ready.emit(container)
+
+    environment = harness.get_container_pebble_plan(CONTAINER_NAME).to_dict()["services"][
+        "oathkeeper"
+    ]["environment"]
+    assert environment["GOMAXPROCS"] == "3"
+    assert "GOMEMLIMIT" not in environment
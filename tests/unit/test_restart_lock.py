@@ -0,0 +1,153 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import json
+from typing import List
+
+import pytest
+from ops.testing import Harness
+from pytest_mock import MockerFixture
+
+PEER = "oathkeeper"
+
+
+def setup_peers(harness: Harness, units: int = 3) -> int:
+    relation_id = harness.add_relation(PEER, "oathkeeper")
+    for i in range(1, units):
+        harness.add_relation_unit(relation_id, f"oathkeeper/{i}")
+    return relation_id
+
+
+def request_lock(harness: Harness, relation_id: int, unit: str) -> None:
+    harness.update_relation_data(relation_id, unit, {"restart_lock": "requested"})
+
+
+def release_lock(harness: Harness, relation_id: int, unit: str) -> None:
+    harness.update_relation_data(relation_id, unit, {"restart_lock": "released"})
+
+
+def granted_units(harness: Harness, relation_id: int) -> List[str]:
+    return json.loads(harness.get_relation_data(relation_id, "oathkeeper")["restart_lock_granted"])
+
+
+def test_acquire_without_peers(harness: Harness) -> None:
+    harness.add_relation(PEER, "oathkeeper")
+
+    assert harness.charm._restart_lock.acquire()
+
+
+def test_units_restart_one_at_a_time(harness: Harness) -> None:
+    relation_id = setup_peers(harness)
+
+    request_lock(harness, relation_id, "oathkeeper/1")
+    request_lock(harness, relation_id, "oathkeeper/2")
+    assert granted_units(harness, relation_id) == ["oathkeeper/1"]
+
+    release_lock(harness, relation_id, "oathkeeper/1")
+    assert granted_units(harness, relation_id) == ["oathkeeper/2"]
+
+    release_lock(harness, relation_id, "oathkeeper/2")
+    assert granted_units(harness, relation_id) == []
+
+
+def test_units_restart_in_batches(harness: Harness) -> None:
+    # Harness does not re-initialize the charm on config changes
+    harness.charm._restart_lock.batch_size = 2
+    relation_id = setup_peers(harness, units=4)
+
+    for unit in ("oathkeeper/1", "oathkeeper/2", "oathkeeper/3"):
+        request_lock(harness, relation_id, unit)
+
+    assert granted_units(harness, relation_id) == ["oathkeeper/1", "oathkeeper/2"]
+
+
+def test_leader_waits_for_the_lock(harness: Harness, mocker: MockerFixture) -> None:
+    relation_id = setup_peers(harness)
+    restart = mocker.patch("charm.OathkeeperCharm._restart_service")
+    request_lock(harness, relation_id, "oathkeeper/1")
+
+    assert not harness.charm._restart_lock.acquire()
+
+    release_lock(harness, relation_id, "oathkeeper/1")
+
+    restart.assert_called_once()
+    assert not harness.charm._restart_lock.requested
+    assert granted_units(harness, relation_id) == []
+
+
+@pytest.mark.parametrize(
+    "granted,restarted", [(["oathkeeper/0"], True), (["oathkeeper/1"], False)]
+)
+def test_unit_restarts_when_granted(
+    harness: Harness, mocker: MockerFixture, granted: List[str], restarted: bool
+) -> None:
+    relation_id = setup_peers(harness)
+    harness.set_leader(False)
+    restart = mocker.patch("charm.OathkeeperCharm._restart_service")
+
+    assert not harness.charm._restart_lock.acquire()
+    harness.update_relation_data(
+        relation_id, "oathkeeper", {"restart_lock_granted": json.dumps(granted)}
+    )
+
+    assert restart.called == restarted
+    assert harness.charm._restart_lock.requested != restarted
+
+
+def test_layer_change_waits_for_the_lock(harness: Harness, mocker: MockerFixture) -> None:
+    harness.set_can_connect("oathkeeper", True)
+    harness.charm.on.oathkeeper_pebble_ready.emit("oathkeeper")
+    relation_id = setup_peers(harness)
+    request_lock(harness, relation_id, "oathkeeper/1")
+    replan = mocker.spy(harness.model.unit.get_container("oathkeeper"), "replan")
+    mocker.patch("charm.OathkeeperCharm._tracing_ready", return_value=True)
+    mocker.patch("charm.OathkeeperCharm._get_tracing_endpoint_info", return_value="tempo:4318")
+
+    harness.charm._restart_service()
+    replan.assert_not_called()
+
+    release_lock(harness, relation_id, "oathkeeper/1")
+    replan.assert_called_once()
+    assert granted_units(harness, relation_id) == []
+
+
+def test_rolling_restart_waits_for_a_fresh_ready_check(
+    harness: Harness, mocker: MockerFixture
+) -> None:
+    harness.set_can_connect("oathkeeper", True)
+    harness.charm.on.oathkeeper_pebble_ready.emit("oathkeeper")
+    setup_peers(harness)
+    mocker.patch(
+        "charm.OathkeeperCharm._layer_changes", return_value=["services.oathkeeper.environment"]
+    )
+    mocker.patch("charm.OathkeeperCharm._ready_check_successes", return_value={"ready": 7})
+    wait_for_ready = mocker.patch("charm.OathkeeperCharm._wait_for_ready", return_value=True)
+
+    assert harness.charm._restart_service()
+
+    wait_for_ready.assert_called_once_with({"ready": 7})
+    assert not harness.charm._restart_lock.requested
+
+
+def test_lock_released_on_a_later_hook_without_waiting(
+    harness: Harness, mocker: MockerFixture
+) -> None:
+    harness.set_can_connect("oathkeeper", True)
+    harness.charm.on.oathkeeper_pebble_ready.emit("oathkeeper")
+    setup_peers(harness)
+    mocker.patch(
+        "charm.OathkeeperCharm._layer_changes", return_value=["services.oathkeeper.environment"]
+    )
+    is_ready = mocker.patch("charm.OathkeeperCharm._is_ready", return_value=False)
+    wait_for_ready = mocker.spy(harness.charm, "_wait_for_ready")
+
+    assert harness.charm._restart_service(wait=False)
+    harness.framework.commit()
+
+    wait_for_ready.assert_not_called()
+    assert harness.charm._restart_lock.granted
+
+    is_ready.return_value = True
+    harness.framework.commit()
+
+    assert not harness.charm._restart_lock.requested
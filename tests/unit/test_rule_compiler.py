@@ -0,0 +1,218 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+import random
+from typing import List, Pattern, Set
+
+import pytest
+
+from rule_compiler import (
+    GLOB_MATCHING_STRATEGY,
+    REGEXP_MATCHING_STRATEGY,
+    allow_pattern,
+    compile_deny_pattern,
+    deny_pattern,
+    is_glob_compatible,
+    lookahead_deny_pattern,
+    protected_url_pattern,
+    static_asset_pattern,
+)
+from rule_matcher import compile_pattern, load_access_rules
+
+PROTECTED_URL = "https://example.com"
+ALPHABET = "/abcelmoptuw-_"
+
+
+def candidate_paths(allowed_endpoints: List[str], seed: int = 0) -> Set[str]:
+    """Build paths close to the allowed endpoints' boundaries, plus random ones."""
+    paths = {"", "/", "//"}
+    for endpoint in allowed_endpoints:
+        path = f"/{endpoint}"
+        for i in range(len(path) + 1):
+            prefix = path[:i]
+            paths.add(prefix)
+            paths.update(prefix + c for c in ALPHABET)
+        paths.update({f"{path}/", f"{path}/x", f"{path}//", f"{path}x", f"{path}-/x"})
+
+    rng = random.Random(seed)
+    for _ in range(500):
+        paths.add("".join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 12))))
+    return paths
+
+
+def compile_stored_pattern(
+    pattern: str, matching_strategy: str = REGEXP_MATCHING_STRATEGY
+) -> Pattern:
+    """Compile a pattern as Oathkeeper reads it back from the stored rule files."""
+    rules = [{"id": "rule", "match": {"url": pattern}}]
+    (stored_rule,) = load_access_rules({"rules.json": str(rules)})
+    return compile_pattern(stored_rule["match"]["url"], matching_strategy)
+
+
+@pytest.mark.parametrize(
+    "allowed_endpoints",
+    [
+        [],
+        ["welcome"],
+        ["welcome", "about/app"],
+        ["a", "ab", "abc/d"],
+        ["api", "api/v1/public"],
+        ["welcome/", "well-known"],
+        ["a_b", "a-b", "c%20d", "~user"],
+    ],
+)
+def test_deny_pattern_matches_same_urls_as_lookahead_pattern(
+    allowed_endpoints: List[str],
+) -> None:
+    new_deny = compile_stored_pattern(
+        f"{PROTECTED_URL}<{compile_deny_pattern(allowed_endpoints)}>"
+    )
+    old_deny = compile_stored_pattern(
+        f"{PROTECTED_URL}<{lookahead_deny_pattern(allowed_endpoints)}>"
+        if allowed_endpoints
+        else f"{PROTECTED_URL}<.*>"
+    )
+    allow = [
+        compile_stored_pattern(f"{PROTECTED_URL}/<{endpoint}((/.*$)|$)>")
+        for endpoint in allowed_endpoints
+    ]
+
+    for path in candidate_paths(allowed_endpoints):
+        url = f"{PROTECTED_URL}{path}"
+        denied = bool(new_deny.match(url))
+        assert denied == bool(old_deny.match(url)), url
+        # Exactly one of the allow and deny rules must match
+        assert denied != any(rule.match(url) for rule in allow), url
+
+
+@pytest.mark.parametrize(
+    "allowed_endpoints",
+    [["welcome"], ["welcome", "about/app"], ["a", "ab", "abc/d"]],
+)
+def test_deny_pattern_has_no_lookaround(allowed_endpoints: List[str]) -> None:
+    assert "(?" not in compile_deny_pattern(allowed_endpoints).replace("(?:", "")
+
+
+def test_deny_pattern_classes_have_no_backslash() -> None:
+    assert "\\" not in compile_deny_pattern(["a_b", "a-c", "api-docs"])
+
+
+def test_deny_pattern_falls_back_to_lookahead_for_regex_endpoints() -> None:
+    allowed_endpoints = ["static/.*\\.js", "welcome"]
+
+    assert compile_deny_pattern(allowed_endpoints) == lookahead_deny_pattern(allowed_endpoints)
+
+
+def test_deny_pattern_without_allowed_endpoints() -> None:
+    assert compile_deny_pattern([]) == ".*"
+
+
+@pytest.mark.parametrize(
+    "allowed_endpoints",
+    [
+        [],
+        ["welcome"],
+        ["welcome", "about/app"],
+        ["a", "ab", "abc/d"],
+        ["welcome/", "well-known"],
+        ["a_b", "a-b", "c%20d", "~user"],
+    ],
+)
+def test_glob_patterns_match_same_urls_as_regex_patterns(allowed_endpoints: List[str]) -> None:
+    regex_url = protected_url_pattern(PROTECTED_URL)
+    glob_url = protected_url_pattern(PROTECTED_URL, GLOB_MATCHING_STRATEGY)
+    regex_deny = compile_stored_pattern(deny_pattern(regex_url, allowed_endpoints))
+    glob_deny = compile_stored_pattern(
+        deny_pattern(glob_url, allowed_endpoints, GLOB_MATCHING_STRATEGY), GLOB_MATCHING_STRATEGY
+    )
+
+    for path in candidate_paths(allowed_endpoints):
+        for url in (f"{PROTECTED_URL}{path}", f"http://example.com{path}"):
+            assert bool(glob_deny.match(url)) == bool(regex_deny.match(url)), url
+
+            for endpoint in allowed_endpoints:
+                regex_allow = compile_stored_pattern(allow_pattern(regex_url, endpoint))
+                glob_allow = compile_stored_pattern(
+                    allow_pattern(glob_url, endpoint, GLOB_MATCHING_STRATEGY),
+                    GLOB_MATCHING_STRATEGY,
+                )
+                assert bool(glob_allow.match(url)) == bool(regex_allow.match(url)), url
+
+
+@pytest.mark.parametrize(
+    "protected_urls,allowed_endpoints,expected",
+    [
+        (["https://example.com"], ["welcome", "about/app"], True),
+        (["https://example.com"], [], True),
+        (["https://example.com"], ["static/.*\\.js"], False),
+        (["https://example.com/<id>"], ["welcome"], False),
+    ],
+)
+def test_is_glob_compatible(
+    protected_urls: List[str], allowed_endpoints: List[str], expected: bool
+) -> None:
+    assert is_glob_compatible(protected_urls, allowed_endpoints) == expected
+
+
+@pytest.mark.parametrize("matching_strategy", [REGEXP_MATCHING_STRATEGY, GLOB_MATCHING_STRATEGY])
+@pytest.mark.parametrize(
+    "allowed_endpoints,static_asset_suffixes",
+    [
+        ([], ["js"]),
+        (["welcome"], ["js", "css"]),
+        (["welcome", "about/app"], ["js", "s", "ajs"]),
+        (["a", "ab", "abc/d"], ["a", "aa", "ba"]),
+        (["welcome/", "well-known"], ["w", "woff2"]),
+        (["a_b", "a-b", "api-docs"], ["js", "css"]),
+    ],
+)
+def test_static_asset_and_deny_patterns_split_the_denied_urls(
+    matching_strategy: str, allowed_endpoints: List[str], static_asset_suffixes: List[str]
+) -> None:
+    url = protected_url_pattern(PROTECTED_URL, matching_strategy)
+    deny = compile_stored_pattern(
+        deny_pattern(url, allowed_endpoints, matching_strategy, static_asset_suffixes),
+        matching_strategy,
+    )
+    static = compile_stored_pattern(
+        static_asset_pattern(url, allowed_endpoints, static_asset_suffixes, matching_strategy),
+        matching_strategy,
+    )
+    old_deny = compile_stored_pattern(
+        f"{PROTECTED_URL}<{lookahead_deny_pattern(allowed_endpoints)}>"
+        if allowed_endpoints
+        else f"{PROTECTED_URL}<.*>"
+    )
+
+    paths = candidate_paths(allowed_endpoints)
+    paths.update(f"{path}.{suffix}" for path in list(paths) for suffix in static_asset_suffixes)
+    paths.update(f"{path}.{suffix}/x" for path in list(paths) for suffix in static_asset_suffixes)
+    for path in paths:
+        url = f"{PROTECTED_URL}{path}"
+        is_static = any(path.endswith(f".{suffix}") for suffix in static_asset_suffixes)
+        denied = bool(old_deny.match(url))
+        assert bool(static.match(url)) == (denied and is_static), url
+        assert bool(deny.match(url)) == (denied and not is_static), url
+
+
+@pytest.mark.parametrize("matching_strategy", [REGEXP_MATCHING_STRATEGY, GLOB_MATCHING_STRATEGY])
+def test_static_asset_patterns_have_no_lookaround(matching_strategy: str) -> None:
+    url = protected_url_pattern(PROTECTED_URL, matching_strategy)
+    allowed_endpoints = ["welcome", "about/app"]
+
+    for pattern in (
+        deny_pattern(url, allowed_endpoints, matching_strategy, ["js", "css"]),
+        static_asset_pattern(url, allowed_endpoints, ["js", "css"], matching_strategy),
+    ):
+        assert "(?" not in pattern.replace("(?:", "")
+
+
+def test_static_asset_patterns_fall_back_to_lookahead_for_regex_endpoints() -> None:
+    url = protected_url_pattern(PROTECTED_URL)
+    allowed_endpoints = ["static/.*\\.js", "welcome"]
+
+    for pattern in (
+        deny_pattern(url, allowed_endpoints, static_asset_suffixes=["js"]),
+        static_asset_pattern(url, allowed_endpoints, ["js"]),
+    ):
+        assert "(?!/static/.*\\.js((/.*$)|$)|/welcome((/.*$)|$))" in pattern
@@ -0,0 +1,158 @@
+# Copyright 2026 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+from typing import Dict, List, Optional
+
+import pytest
+from ops.testing import Harness
+
+from rule_compiler import GLOB_MATCHING_STRATEGY, REGEXP_MATCHING_STRATEGY
+from rule_matcher import (
+    MultipleMatchingRulesError,
+    NoMatchingRuleError,
+    RuleMatcher,
+    compile_pattern,
+    load_access_rules,
+)
+
+
+def render_configmap_data(
+    harness: Harness, matching_strategy: str, static_asset_suffixes: Optional[List[str]] = None
+) -> Dict[str, str]:
+    """Render the access rules configMap data of a requirer, like the charm does."""
+    data = {}
+    for rule_type in ("allow", "deny"):
+        rules = harness.charm._render_access_rules(
+            rule_type=rule_type,
+            protected_urls=["https://example.com"],
+            allowed_endpoints=["welcome", "about/app"],
+            relation_app_name="requirer",
+            matching_strategy=matching_strategy,
+            static_asset_suffixes=static_asset_suffixes,
+        )
+        data[f"access-rules-requirer-{rule_type}.json"] = str(rules)
+    return data
+
+
+@pytest.mark.parametrize(
+    "pattern,url,expected",
+    [
+        ("https://example.com/<.*>", "https://example.com/anything", True),
+        ("https://example.com/<.*>", "https://exampleXcom/anything", False),
+        ("<^(https|http)>://example.com<.*>", "http://example.com", True),
+        ("https://example.com/<[a-z]{3}>", "https://example.com/abc", True),
+        ("https://example.com/<[a-z]{3}>", "https://example.com/abcd", False),
+    ],
+)
+def test_compile_regexp_pattern(pattern: str, url: str, expected: bool) -> None:
+    assert bool(compile_pattern(pattern).match(url)) == expected
+
+
+@pytest.mark.parametrize(
+    "pattern,url,expected",
+    [
+        ("https://example.com/<**>", "https://example.com/a/b.c", True),
+        ("https://example.com/<*>", "https://example.com/a/b", False),
+        ("https://example.com/<{a,b}>", "https://example.com/b", True),
+        ("https://example.com/<[!a]**>", "https://example.com/abc", False),
+        ("https://example.com/<[!a]**>", "https://example.com/bc", True),
+    ],
+)
+def test_compile_glob_pattern(pattern: str, url: str, expected: bool) -> None:
+    assert bool(compile_pattern(pattern, GLOB_MATCHING_STRATEGY).match(url)) == expected
+
+
+def test_compile_pattern_with_unbalanced_delimiters() -> None:
+    with pytest.raises(ValueError):
+        compile_pattern("https://example.com/<.*")
+
+
+def test_load_access_rules_skips_empty_keys() -> None:
+    data = {"admin_ui_rules.json": "", "rules.json": '[{"id": "rule"}]'}
+
+    assert load_access_rules(data) == [{"id": "rule"}]
+
+
+@pytest.mark.parametrize("matching_strategy", [REGEXP_MATCHING_STRATEGY, GLOB_MATCHING_STRATEGY])
+@pytest.mark.parametrize(
+    "url,expected_rule_id",
+    [
+        ("https://example.com", "requirer:0:deny"),
+        ("https://example.com/welcome", "requirer:welcome:0:allow"),
+        ("http://example.com/welcome/page?query=1", "requirer:welcome:0:allow"),
+        ("https://example.com/welcomepage", "requirer:0:deny"),
+        ("https://example.com/about/app/x", "requirer:about/app:0:allow"),
+        ("https://example.com/about", "requirer:0:deny"),
+    ],
+)
+def test_rule_matcher_resolves_rendered_rules(
+    harness: Harness, matching_strategy: str, url: str, expected_rule_id: str
+) -> None:
+    matcher = RuleMatcher.from_configmap(
+        render_configmap_data(harness, matching_strategy), matching_strategy
+    )
+
+    assert matcher.match(url, "GET")["id"] == expected_rule_id
+    assert matcher.rules_evaluated == 3
+
+
+@pytest.mark.parametrize("matching_strategy", [REGEXP_MATCHING_STRATEGY, GLOB_MATCHING_STRATEGY])
+@pytest.mark.parametrize(
+    "method,url,expected_rule_id",
+    [
+        ("OPTIONS", "https://example.com/dashboard", "requirer:0:preflight"),
+        ("OPTIONS", "https://example.com/welcome", "requirer:0:preflight"),
+        ("GET", "https://example.com/assets/app.js", "requirer:0:static"),
+        ("HEAD", "https://example.com/style.css", "requirer:0:static"),
+        ("GET", "https://example.com/welcome.js", "requirer:0:static"),
+        ("GET", "https://example.com/about/.css", "requirer:0:static"),
+        ("GET", "https://example.com/welcome/app.js", "requirer:welcome:0:allow"),
+        ("GET", "https://example.com/app.json", "requirer:0:deny"),
+        ("GET", "https://example.com/app.js/index", "requirer:0:deny"),
+        ("GET", "https://example.com/js", "requirer:0:deny"),
+        ("GET", "https://example.com/about", "requirer:0:deny"),
+    ],
+)
+def test_rule_matcher_resolves_fast_path_rules(
+    harness: Harness, matching_strategy: str, method: str, url: str, expected_rule_id: str
+) -> None:
+    data = render_configmap_data(harness, matching_strategy, ["js", "css"])
+    matcher = RuleMatcher.from_configmap(data, matching_strategy)
+
+    assert matcher.match(url, method)["id"] == expected_rule_id
+
+
+def test_rule_matcher_rejects_writes_to_static_assets(harness: Harness) -> None:
+    data = render_configmap_data(harness, REGEXP_MATCHING_STRATEGY, ["js", "css"])
+    matcher = RuleMatcher.from_configmap(data)
+
+    with pytest.raises(NoMatchingRuleError):
+        matcher.match("https://example.com/app.js", "POST")
+
+
+def test_rule_matcher_skips_rules_for_other_methods() -> None:
+    rules: List[Dict] = [
+        {"id": "get", "match": {"url": "https://example.com/<.*>", "methods": ["GET"]}},
+        {"id": "post", "match": {"url": "https://example.com/<.*>", "methods": ["POST"]}},
+    ]
+    matcher = RuleMatcher(rules)
+
+    assert matcher.match("https://example.com/a", "POST")["id"] == "post"
+    assert matcher.rules_evaluated == 1
+
+
+def test_rule_matcher_no_matching_rule() -> None:
+    rules = [{"id": "rule", "match": {"url": "https://example.com/<a>", "methods": ["GET"]}}]
+
+    with pytest.raises(NoMatchingRuleError):
+        RuleMatcher(rules).match("https://example.com/b")
+
+
+def test_rule_matcher_multiple_matching_rules() -> None:
+    rules = [
+        {"id": "a", "match": {"url": "https://example.com/<.*>", "methods": ["GET"]}},
+        {"id": "b", "match": {"url": "https://example.com/<a>", "methods": ["GET"]}},
+    ]
+
+    with pytest.raises(MultipleMatchingRulesError):
+        RuleMatcher(rules).match("https://example.com/a")